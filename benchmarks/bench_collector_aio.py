@@ -0,0 +1,82 @@
+# -*- coding: UTF-8 -*-
+"""
+异步采集接口的吞吐量：本地HTTP服务模拟新华网首页和文章页（每个请求延迟
+latency 秒），比较 `HomePage.get_articles`（逐篇请求）与
+`HomePage.get_articles_async`（并发请求）的耗时。
+
+    PYTHONPATH=. python benchmarks/bench_collector_aio.py --articles 100 --latency 0.05
+"""
+import time
+import asyncio
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from tma.collector import xhn
+from tma.collector.aio import AsyncClient
+
+DAY = '2018-06-20'
+
+
+def serve(n, latency):
+    """启动本地HTTP服务，返回 (server, 首页url)"""
+    pages = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            body = pages.get(self.path, b"")
+            self.send_response(200 if body else 404)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    Handler.protocol_version = "HTTP/1.1"
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    url = "http://127.0.0.1:%i" % server.server_address[1]
+    links = ['/fortune/2018-06/20/c_%i.htm' % i for i in range(n)]
+    pages['/'] = "".join('<a href="%s%s">标题%i</a>' % (url, link, i)
+                         for i, link in enumerate(links)).encode('utf-8')
+    for i, link in enumerate(links):
+        pages[link] = ('<div class="h-news">标题%i&#13;\n%s 10:00:00&#13;\n来源：新华网</div>'
+                       '<div id="p-detail">　　正文%i</div>' % (i, DAY, i)).encode('utf-8')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, url + '/'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--limit-per-host', type=int, default=8)
+    args = parser.parse_args()
+
+    server, url = serve(args.articles, args.latency)
+    home = xhn.HomePage()
+    home.home_url = url
+
+    t = time.perf_counter()
+    sync = home.get_articles(d=[DAY])
+    t_sync = time.perf_counter() - t
+
+    async def _run():
+        async with AsyncClient(limit_per_host=args.limit_per_host) as client:
+            return await home.get_articles_async(d=[DAY], client=client)
+
+    t = time.perf_counter()
+    res = asyncio.run(_run())
+    t_async = time.perf_counter() - t
+    server.shutdown()
+
+    assert len(sync) == len(res) == args.articles
+    print("articles=%i latency=%.3fs limit_per_host=%i" %
+          (args.articles, args.latency, args.limit_per_host))
+    print("get_articles        %.2fs  %.1f req/s" % (t_sync, (args.articles + 1) / t_sync))
+    print("get_articles_async  %.2fs  %.1f req/s" % (t_async, (args.articles + 1) / t_async))
+
+
+if __name__ == "__main__":
+    main()
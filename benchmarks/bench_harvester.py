@@ -0,0 +1,83 @@
+# -*- coding: UTF-8 -*-
+"""
+全市场K线采集的吞吐量：用带延迟的本地 fake get_klines 代替网络请求，
+比较不同线程数量下 `KlineHarvester` 的耗时，并验证从检查点恢复时不再请求。
+
+    PYTHONPATH=. python benchmarks/bench_harvester.py --codes 400 --latency 0.02
+"""
+import os
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+from tma.storage import get_storage
+from tma.collector.store import KlineStore
+from tma.collector.aggregation import KlineHarvester
+
+
+class FakeKlines(object):
+    """模拟 get_klines：每次调用等待 latency 秒，返回 n 根随机日K线"""
+
+    def __init__(self, latency, n=250):
+        self.latency = latency
+        self.dates = pd.bdate_range('2017-01-02', periods=n).strftime('%Y-%m-%d')
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, code, freq="D", start_date=None):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+        dates = self.dates if start_date is None else self.dates[self.dates >= start_date]
+        rng = np.random.RandomState(int(code))
+        close = 10 + rng.randn(len(self.dates)).cumsum() * 0.1
+        close = close[len(self.dates) - len(dates):]
+        return pd.DataFrame({'date': dates, 'open': close, 'close': close,
+                             'high': close * 1.01, 'low': close * 0.99,
+                             'volume': rng.randint(1e4, 1e6, len(dates)).astype(float),
+                             'code': code})
+
+
+def run(codes, workers, latency, rate, root):
+    fetch = FakeKlines(latency)
+    store = KlineStore(storage=get_storage("csv", root=root))
+    harvester = KlineHarvester(workers=workers, rate=rate, store=store, fetch=fetch,
+                               checkpoint=os.path.join(root, "bench.ckpt"))
+    t = time.perf_counter()
+    df = harvester.harvest(codes, resume=False)
+    elapsed = time.perf_counter() - t
+    assert df['code'].nunique() == len(codes) and not harvester.failed
+
+    # 检查点中的股票全部完成，恢复时不再请求
+    calls = fetch.calls
+    harvester.harvest(codes, resume=True)
+    assert fetch.calls == calls
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--codes', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--rate', type=float, default=None)
+    args = parser.parse_args()
+
+    codes = ['%06d' % i for i in range(1, args.codes + 1)]
+    print("codes=%i latency=%.3fs rate=%s" % (args.codes, args.latency, args.rate))
+    for workers in args.workers:
+        root = tempfile.mkdtemp()
+        try:
+            elapsed = run(codes, workers, args.latency, args.rate, root)
+        finally:
+            shutil.rmtree(root)
+        print("workers=%-3i %6.2fs  %7.1f codes/s" % (workers, elapsed, len(codes) / elapsed))
+
+
+if __name__ == "__main__":
+    main()
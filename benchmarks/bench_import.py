@@ -0,0 +1,56 @@
+# -*- coding: UTF-8 -*-
+"""
+`import tma` 的冷启动耗时：在子进程中分别执行 `import tma` 和首次访问
+`tma.collector` 等子模块（相当于旧版本 import 时的全部导入），取多次运行
+的中位数，并列出 `import tma` 之后已经导入的重量级模块。
+
+    PYTHONPATH=. python benchmarks/bench_import.py --repeat 10
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+HEAVY = ('pandas', 'numpy', 'tushare', 'requests', 'jieba', 'tma.collector', 'tma.utils')
+
+CASES = [
+    ("python -c pass", "pass"),
+    ("import tma", "import tma"),
+    ("import tma; tma.utils", "import tma; tma.utils"),
+    ("import tma; tma.collector", "import tma; tma.collector"),
+]
+
+
+def run(code, env):
+    t = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+    return time.perf_counter() - t
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # 使用临时的用户目录，不读取已有的 ~/.tma 缓存
+    env = dict(os.environ, HOME=tempfile.mkdtemp(),
+               PYTHONPATH=os.pathsep.join([root, os.environ.get('PYTHONPATH', '')]))
+
+    print("median of %i runs" % args.repeat)
+    for label, code in CASES:
+        run(code, env)
+        times = [run(code, env) for _ in range(args.repeat)]
+        print("%-28s %8.1fms" % (label, statistics.median(times) * 1e3))
+
+    check = "import sys, tma; print(' '.join(m for m in %r if m in sys.modules))" % (HEAVY,)
+    out = subprocess.run([sys.executable, "-c", check], env=env, check=True,
+                         stdout=subprocess.PIPE, universal_newlines=True).stdout.strip()
+    print("loaded by import tma: %s" % (out or "none of " + ", ".join(HEAVY)))
+
+
+if __name__ == "__main__":
+    main()
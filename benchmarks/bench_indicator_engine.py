@@ -0,0 +1,111 @@
+# -*- coding: UTF-8 -*-
+"""
+全市场个股指标的计算耗时：在合成的日K线上比较 `MarketShareIndicatorEngine`
+（基于 `OHLCVPanel` 的矩阵运算）和逐只股票调用 `ShareDayIndicator` 的
+'ma' / 'lnd' 指标，并校验两者的结果一致。
+
+只统计指标计算本身；旧方式每只股票还要发出两次网络请求，这里用预先
+设置好的K线代替，因此测得的是旧方式耗时的下限。部分股票带有停牌日，
+用于覆盖面板中的NaN。
+
+    PYTHONPATH=. python benchmarks/bench_indicator_engine.py --codes 1500 --days 300
+"""
+import time
+import shutil
+import tempfile
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from tma.storage import get_storage
+from tma.collector import KlineStore, OHLCVPanel
+from tma.indicator import ShareDayIndicator, MarketShareIndicatorEngine
+
+FIELDS = ('open', 'high', 'low', 'close')
+
+
+def make_klines(n_codes, n_days, seed=0):
+    """合成 n_codes 只股票的日K线，每10只股票中有1只随机停牌5%的交易日"""
+    rng = np.random.RandomState(seed)
+    dates = pd.bdate_range('2017-01-02', periods=n_days).strftime('%Y-%m-%d')
+    frames = {}
+    for i in range(n_codes):
+        code = '%06d' % (600000 + i)
+        close = np.round(10 * np.exp(rng.randn(n_days).cumsum() * 0.02), 2)
+        kls = pd.DataFrame({
+            'date': dates, 'open': np.round(close * (1 + rng.randn(n_days) * 0.005), 2),
+            'close': close, 'high': np.round(close * 1.02, 2),
+            'low': np.round(close * 0.98, 2),
+            'volume': rng.randint(1e4, 1e7, n_days).astype(float), 'code': code})
+        if i % 10 == 0:
+            kls = kls[rng.rand(n_days) > 0.05].reset_index(drop=True)
+        frames[code] = kls
+    return frames
+
+
+def make_quotes(frames):
+    """与 today_market 字段一致的全市场行情"""
+    last = pd.DataFrame([kls.iloc[-1] for kls in frames.values()])
+    return pd.DataFrame({'code': last['code'].values, 'name': last['code'].values,
+                         'trade': last['close'].values, 'settlement': last['open'].values,
+                         'high': last['high'].values, 'low': last['low'].values,
+                         'amount': last['volume'].values * last['close'].values})
+
+
+def run_legacy(frames, target):
+    rows = []
+    for code, kls in frames.items():
+        sdi = ShareDayIndicator(code)
+        sdi.kls = kls.copy()
+        if 'ma' in target:
+            sdi.cal_move_average()
+        if 'lnd' in target:
+            sdi.cal_latest_nd()
+        rows.append(sdi.features)
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--codes', type=int, default=1500)
+    parser.add_argument('--days', type=int, default=300)
+    parser.add_argument('--target', nargs='+', default=['ma', 'lnd'])
+    args = parser.parse_args()
+
+    frames = make_klines(args.codes, args.days)
+    quotes = make_quotes(frames)
+    root = tempfile.mkdtemp()
+    try:
+        store = KlineStore("D", storage=get_storage("csv", root=root))
+        for code, kls in frames.items():
+            store.write(code, kls)
+        store.save_meta()
+        panel = OHLCVPanel.build("D", store=store, path=root + "/panel")
+
+        t = time.perf_counter()
+        new = MarketShareIndicatorEngine(panel=panel, quotes=quotes).run(args.target)
+        t_engine = time.perf_counter() - t
+
+        t = time.perf_counter()
+        old = run_legacy(frames, args.target)
+        t_legacy = time.perf_counter() - t
+    finally:
+        shutil.rmtree(root)
+
+    # 两者都是 float 结果，面板以 float32 保存，允许保留4位小数后的误差
+    new = new.set_index('CODE').loc[old['CODE']]
+    cols = [c for c in old.columns if c not in ('DATE', 'CODE')]
+    a, b = new[cols].to_numpy(dtype=float), old[cols].to_numpy(dtype=float)
+    assert (np.isnan(a) == np.isnan(b)).all()
+    diff = np.nanmax(np.abs(a - b) / np.maximum(np.abs(b), 1))
+    assert diff < 1e-3, diff
+
+    print("codes=%i days=%i target=%s" % (args.codes, args.days, ",".join(args.target)))
+    print("ShareDayIndicator x %i  %8.3fs" % (args.codes, t_legacy))
+    print("MarketShareIndicatorEngine %8.3fs  (%.0fx)" % (t_engine, t_legacy / t_engine))
+    print("max relative diff: %.2e" % diff)
+
+
+if __name__ == "__main__":
+    main()
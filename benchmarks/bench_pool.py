@@ -0,0 +1,116 @@
+# -*- coding: UTF-8 -*-
+"""
+股票池批量写入的吞吐量：比较旧版本每次修改都重写整个json文件的股票池，
+与基于追加日志的 `StockPool` 在逐只 add、fsync=False、batch() 和
+add_many 下的耗时，并校验重新打开后恢复的股票池与写入的一致。
+
+旧版本逐只 add 的耗时随股票池大小平方增长，默认只测前 --legacy 只。
+
+    PYTHONPATH=. python benchmarks/bench_pool.py --codes 3000 --legacy 300
+"""
+import os
+import json
+import time
+import shutil
+import tempfile
+import argparse
+from collections import OrderedDict
+
+from tma.pool import StockPool
+
+DT = "2018-08-03 10:00:00"
+REASONS = ("SS01", "SS02", "SS03")
+
+
+class LegacyJsonPool(object):
+    """旧版本的股票池：全部股票保存在一个json文件中，每次修改整体重写"""
+
+    def __init__(self, name, pool_path):
+        self.path = os.path.join(pool_path, '%s_pool.json' % name)
+        self.shares = OrderedDict(level1=[], level2=[], level3=[])
+
+    def save(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.shares, f, indent=2, ensure_ascii=False)
+
+    def add(self, code, reason, level, dt=None, save=True):
+        share = dict(code=code, dt=dt, level=level, reason=reason)
+        self.shares["level" + str(level)].append(share)
+        if save:
+            self.save()
+
+    def add_many(self, codes, reason, level, dt=None):
+        for code in codes:
+            share = dict(code=code, dt=dt, level=level, reason=reason)
+            self.shares["level" + str(level)].append(share)
+        self.save()
+
+
+def add_each(pool, codes):
+    for i, code in enumerate(codes):
+        pool.add(code, REASONS[i % 3], 3, dt=DT)
+
+
+def add_many(pool, codes):
+    for i, reason in enumerate(REASONS):
+        pool.add_many(codes[i::3], reason, 3, dt=DT)
+
+
+def add_each_batch(pool, codes):
+    with pool.batch():
+        add_each(pool, codes)
+
+
+def add_many_batch(pool, codes):
+    with pool.batch():
+        add_many(pool, codes)
+
+
+CASES = [
+    ("json, add() per code", LegacyJsonPool, {}, add_each),
+    ("json, add_many x3", LegacyJsonPool, {}, add_many),
+    ("log, add() per code", StockPool, {}, add_each),
+    ("log, add() per code, fsync=False", StockPool, dict(fsync=False), add_each),
+    ("log, add() per code in batch()", StockPool, {}, add_each_batch),
+    ("log, add_many x3 in batch()", StockPool, {}, add_many_batch),
+]
+
+
+def expected(codes):
+    return sorted((code, REASONS[i % 3]) for i, code in enumerate(codes))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--codes', type=int, default=3000)
+    parser.add_argument('--legacy', type=int, default=300,
+                        help="旧版本逐只 add 时测试的股票数量")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    codes = ['%06d' % (600000 + i) for i in range(args.codes)]
+    print("codes=%i, best of %i" % (args.codes, args.repeat))
+    for label, cls, kwargs, func in CASES:
+        n = args.legacy if cls is LegacyJsonPool and func is add_each else args.codes
+        best = float('inf')
+        for _ in range(args.repeat):
+            root = tempfile.mkdtemp()
+            try:
+                pool = cls("bench", pool_path=root, **kwargs)
+                t = time.perf_counter()
+                func(pool, codes[:n])
+                best = min(best, time.perf_counter() - t)
+                if cls is StockPool:
+                    pool.close()
+                    shares = StockPool("bench", pool_path=root).shares['level3']
+                else:
+                    with open(pool.path, 'r', encoding='utf-8') as f:
+                        shares = json.load(f)['level3']
+                assert sorted((s['code'], s['reason']) for s in shares) == expected(codes[:n])
+            finally:
+                shutil.rmtree(root)
+        print("%-34s %5i codes %9.1fms %9.0f adds/s" % (label, n, best * 1e3, n / best))
+
+
+if __name__ == "__main__":
+    main()
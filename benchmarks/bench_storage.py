@@ -0,0 +1,97 @@
+# -*- coding: UTF-8 -*-
+"""
+本地缓存存储后端的性能：在合成的全市场日K线上比较 csv / parquet / feather
+的写入耗时、文件大小、全量读取，以及列裁剪 + 过滤读取的耗时。
+
+数据按 KlineStore 的方式分区（klines/D/{code}），每只股票一个文件。
+
+    PYTHONPATH=. python benchmarks/bench_storage.py --codes 1000 --days 500
+"""
+import os
+import time
+import shutil
+import tempfile
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from tma.storage import get_storage
+
+
+def make_klines(n_codes, n_days, seed=0):
+    """合成 n_codes 只股票、每只 n_days 根的日K线"""
+    rng = np.random.RandomState(seed)
+    dates = pd.bdate_range('2016-01-04', periods=n_days).strftime('%Y-%m-%d')
+    frames = {}
+    for i in range(n_codes):
+        code = '%06d' % (600000 + i)
+        close = np.round(10 * np.exp(rng.randn(n_days).cumsum() * 0.02), 2)
+        frames[code] = pd.DataFrame({
+            'date': dates, 'open': close, 'close': close,
+            'high': np.round(close * 1.02, 2), 'low': np.round(close * 0.98, 2),
+            'volume': rng.randint(1e4, 1e7, n_days).astype(float),
+            'code': code})
+    return frames
+
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(d, f))
+               for d, _, files in os.walk(path) for f in files)
+
+
+def timeit(func, repeat):
+    best, res = float('inf'), None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        res = func()
+        best = min(best, time.perf_counter() - t)
+    return best, res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--codes', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--backends', nargs='+', default=['csv', 'parquet', 'feather'])
+    args = parser.parse_args()
+
+    frames = make_klines(args.codes, args.days)
+    keys = ['klines/D/' + code for code in frames]
+    start = frames[keys[0][-6:]]['date'].iloc[-20]
+    columns = ['date', 'close', 'code']
+    filters = [('date', '>=', start)]
+    print("codes=%i days=%i rows=%i" % (args.codes, args.days, args.codes * args.days))
+    print("%-8s %9s %9s %9s %11s" % ("backend", "write", "size", "read", "proj+filter"))
+
+    expected = None
+    for kind in args.backends:
+        root = tempfile.mkdtemp()
+        try:
+            storage = get_storage(kind, root=root)
+            t = time.perf_counter()
+            for key in keys:
+                storage.write(key, frames[key[-6:]])
+            write = time.perf_counter() - t
+
+            read, full = timeit(lambda: storage.read_many(keys), args.repeat)
+            sub, part = timeit(lambda: storage.read_many(keys, columns, filters),
+                               args.repeat)
+            assert len(full) == args.codes * args.days
+            assert len(part) == args.codes * 20 and list(part.columns) == columns
+
+            part = part.sort_values(['code', 'date']).reset_index(drop=True)
+            if expected is None:
+                expected = part
+            else:
+                pd.testing.assert_frame_equal(part, expected, check_dtype=False)
+
+            print("%-8s %8.2fs %7.1fMB %8.2fs %10.3fs" % (
+                kind, write, folder_size(root) / 2 ** 20, read, sub))
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# -*- coding: UTF-8 -*-
+"""
+交易日查询：旧版本（每次调用过滤整个交易日历）与 `TradeDayIndex` 的耗时对比。
+交易日历由程序生成（1991 - 2025 年的工作日），不需要访问网络。
+
+    PYTHONPATH=. python benchmarks/bench_trade_days.py --calls 2000
+"""
+import time
+import random
+import argparse
+from datetime import datetime
+
+import pandas as pd
+
+from tma.utils import TradeCalendar, TradingSessionClock
+
+
+def make_calendar():
+    dates = pd.date_range('1991-01-01', '2025-12-31', freq='D')
+    return pd.DataFrame({'calendarDate': dates.strftime('%Y-%m-%d'),
+                         'isOpen': (dates.dayofweek < 5).astype(int)})
+
+
+# 旧版本的实现，只把全局交易日历改为参数
+# --------------------------------------------------------------------
+
+def legacy_is_trade_day(trade_calendar, date):
+    trade_day = trade_calendar[trade_calendar["isOpen"] == 1]
+    trade_day_list = list(trade_day['calendarDate'])
+    if isinstance(date, datetime):
+        date = str(date.date())
+    if date in trade_day_list:
+        return True
+    else:
+        return False
+
+
+def legacy_get_recent_trade_days(trade_calendar, date, n=10):
+    cal_date = list(trade_calendar['calendarDate'])
+    date_index = cal_date.index(date)
+    if n >= 0:
+        recent_days = cal_date[date_index:date_index + n + 20]
+    else:
+        recent_days = cal_date[date_index + n - 20:date_index + 1]
+        recent_days = recent_days[::-1]
+
+    res = []
+    for d in recent_days:
+        if legacy_is_trade_day(trade_calendar, d):
+            res.append(d)
+        if len(res) == abs(n):
+            break
+    return res
+
+
+def timeit(func, args_list):
+    t = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return (time.perf_counter() - t) / len(args_list)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+
+    data = make_calendar()
+    calendar = TradeCalendar()
+    calendar._data = data
+    index = calendar.day_index
+    clock = TradingSessionClock(calendar)
+
+    random.seed(0)
+    days = [str(d) for d in random.choices(data['calendarDate'].tolist()[40:-40], k=args.calls)]
+    legacy_calls = max(1, args.calls // 20)
+
+    # 结果一致性
+    for d in days[:50]:
+        assert legacy_is_trade_day(data, d) == index.is_trade_day(d)
+        assert legacy_get_recent_trade_days(data, d, 10) == index.recent(d, 10)
+        assert legacy_get_recent_trade_days(data, d, -10) == index.recent(d, -10)
+
+    rows = [
+        ("is_trade_day",
+         timeit(lambda d: legacy_is_trade_day(data, d), [(d,) for d in days[:legacy_calls]]),
+         timeit(index.is_trade_day, [(d,) for d in days])),
+        ("get_recent_trade_days(n=-10)",
+         timeit(lambda d: legacy_get_recent_trade_days(data, d, -10),
+                [(d,) for d in days[:legacy_calls]]),
+         timeit(lambda d: index.recent(d, -10), [(d,) for d in days])),
+    ]
+    print("calendar: %i days, %i trade days" % (len(data), len(index)))
+    print("%-30s %14s %14s %10s" % ("", "legacy", "TradeDayIndex", "speedup"))
+    for name, old, new in rows:
+        print("%-30s %12.1fus %12.2fus %9.0fx" % (name, old * 1e6, new * 1e6, old / new))
+
+    stamps = [datetime.strptime(d + " 10:00:00", "%Y-%m-%d %H:%M:%S") for d in days]
+    print("%-30s %28.2fus" % ("TradeDayIndex.prev", timeit(index.prev, [(d,) for d in days]) * 1e6))
+    print("%-30s %28.2fus" % ("TradeDayIndex.between(1 year)",
+                              timeit(lambda d: index.between(d, str(int(d[:4]) + 1) + d[4:]),
+                                     [(d,) for d in days]) * 1e6))
+    print("%-30s %28.2fus" % ("TradingSessionClock.phase", timeit(clock.phase, [(t,) for t in stamps]) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -25,7 +25,11 @@ setup(
         "tushare", "pandas", "requests", "zb", "retrying", "numpy",
         "bs4", "jieba"
     ],
-    python_requires=">=3",
+    extras_require={
+        "parquet": ["pyarrow"],
+        "async": ["aiohttp"],
+    },
+    python_requires=">=3.7",
     entry_points={}
 )
 
@@ -0,0 +1,64 @@
+# -*- coding: UTF-8 -*-
+import pandas as pd
+import pytest
+
+from tma.utils import trade_calendar, trade_clock
+
+TRADE_DAYS = ['2018-07-02', '2018-07-03', '2018-07-04', '2018-07-05', '2018-07-06']
+
+
+@pytest.fixture
+def calendar(monkeypatch):
+    """用本地交易日替换全局交易日历，避免访问网络"""
+    data = pd.DataFrame({'calendarDate': TRADE_DAYS, 'isOpen': 1})
+    monkeypatch.setattr(trade_calendar, '_data', data)
+    monkeypatch.setattr(trade_calendar, '_index', None)
+    monkeypatch.setattr(trade_clock, '_day', None)
+    monkeypatch.setattr(trade_clock, '_days64_index', None)
+    return trade_calendar
+
+
+class StubServer(object):
+    """本地HTTP服务，按路径返回预先设置的响应，用于离线测试采集接口"""
+
+    def __init__(self):
+        import threading
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+        routes = self.routes = {}
+        hits = self.hits = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                hits.append(self.path)
+                status, body = routes.get(self.path.split('?')[0], (404, None))
+                if body is None:
+                    self.send_response(status)
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = "http://127.0.0.1:%i" % self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def route(self, path, body, status=200):
+        self.routes[path] = (status, body.encode('utf-8') if isinstance(body, str) else body)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    yield server
+    server.close()
@@ -0,0 +1,71 @@
+# -*- coding: UTF-8 -*-
+import pandas as pd
+import pytest
+
+from tma.account import Account, MatchingEngine, Order, BUY, SELL
+
+DAY = '2018-07-02'
+
+
+def make_ticks(rows):
+    return pd.DataFrame(rows, columns=['datetime', 'price'])
+
+
+@pytest.fixture
+def engine(calendar):
+    engine = MatchingEngine()
+    engine.add_ticks('600122', make_ticks([
+        (DAY + ' 09:20:00', 10.50),   # 开盘集合竞价的虚拟成交价
+        (DAY + ' 09:25:00', 10.00),   # 开盘集合竞价撮合
+        (DAY + ' 09:30:03', 10.20),
+        (DAY + ' 14:56:57', 10.10),
+        (DAY + ' 15:00:00', 9.80),    # 收盘集合竞价撮合
+    ]), pre_close=10.0)
+    return engine
+
+
+@pytest.fixture
+def account(tmp_path):
+    return Account('test', fund=100000, mode='strict', path=str(tmp_path))
+
+
+def test_open_auction_market_order_fills_at_auction_price(engine, account):
+    order = account.order('600122', BUY, 1000, dt=DAY + ' 09:16:00')
+    engine.submit(order)
+    engine.run()
+    assert order.status == Order.FILLED
+    assert order.fill_dt == DAY + ' 09:25:00'
+    assert order.fill_price == 10.00
+
+
+def test_close_auction_fills_limit_order(engine, account):
+    order = account.order('600122', BUY, 1000, price=9.90, dt=DAY + ' 14:58:00')
+    engine.submit(order)
+    engine.run()
+    assert order.status == Order.FILLED
+    assert order.fill_dt == DAY + ' 15:00:00'
+    assert order.fill_price == 9.80
+
+
+def test_strict_trade_in_close_auction(calendar, account):
+    account.buy('600122', 1000, price=10.0, dt=DAY + ' 15:00:00')
+    assert account.position('600122') == 1000
+    with pytest.raises(ValueError):
+        account.buy('600122', 1000, price=10.0, dt=DAY + ' 15:00:01')
+
+
+def test_sellable_snapshot_taken_on_first_fill_day(calendar, account):
+    account.buy('600122', 1000, price=10.0, dt=DAY + ' 10:00:00')
+    account.buy('000001', 1000, price=10.0, dt=DAY + ' 10:00:00')
+    engine = MatchingEngine()
+    engine.add_bars(pd.DataFrame({
+        'datetime': [DAY + ' 14:00:00', '2018-07-03 09:30:00'],
+        'code': ['600122', '000001'],
+        'open': 10.0, 'high': 10.2, 'low': 9.9, 'close': 10.0, 'pre_close': 10.0,
+    }))
+    buy = account.order('600122', BUY, 100, dt=DAY + ' 10:30:00')
+    sell = account.order('000001', SELL, 1000, dt='2018-07-03 09:30:00')
+    engine.submit([buy, sell])
+    engine.run()
+    assert buy.status == Order.FILLED
+    assert sell.status == Order.FILLED
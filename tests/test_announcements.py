@@ -0,0 +1,68 @@
+# -*- coding: UTF-8 -*-
+import pytest
+
+from tma.collector.announcements import AnnouncementStore, url_hash
+
+DOCS = [
+    ('600122', '2018-01-05', '关于股东减持股份的公告', '股东计划减持不超过百分之二的股份'),
+    ('600122', '2018-03-10', '年度报告', '公司主营业务收入增长，控股股东未减持'),
+    ('000001', '2018-02-01', '关于回购股份的公告', '公司拟回购股份用于员工持股计划'),
+    ('000001', '2018-04-01', '关于重大资产重组的公告', None),
+]
+
+
+def _announcements():
+    return [{'code': code, 'name': code, 'date': date, 'title': title,
+             'url': 'http://static.cninfo.com.cn/%s-%s.pdf' % (code, date)}
+            for code, date, title, _ in DOCS]
+
+
+@pytest.fixture
+def store(tmp_path):
+    bodies = {}
+    store = AnnouncementStore(path=str(tmp_path), workers=2,
+                              extract=lambda path: bodies[path])
+    # 预先放置PDF文件，跳过下载；正文为None的公告提取失败
+    for a, (_, _, _, body) in zip(_announcements(), DOCS):
+        path = store._pdf_file(url_hash(a['url']))
+        open(path, 'wb').close()
+        if body is not None:
+            bodies[path] = body
+    yield store
+    store.close()
+
+
+def test_add_is_idempotent_and_tracks_failures(store):
+    assert store.add(_announcements()) == 4
+    assert store.add(_announcements()) == 0
+    assert len(store) == 4
+    assert store.stats() == {'pending': 0, 'extracted': 3, 'failed': 1}
+
+
+def test_search_body_title_and_filters(store):
+    store.add(_announcements())
+
+    res = store.search("减持")
+    assert sorted(res['date']) == ['2018-01-05', '2018-03-10']
+    # 标题和正文都命中的公告排在前面
+    assert res['date'].iloc[0] == '2018-01-05'
+    assert list(res.columns) == ['code', 'name', 'date', 'title', 'url', 'path', 'score']
+
+    assert list(store.search("减持", title_only=True)['date']) == ['2018-01-05']
+    assert list(store.search("股份", code='000001')['date']) == ['2018-02-01']
+    assert list(store.search(["股份", "减持"], start_date='2018-01-01',
+                             end_date='2018-01-31')['date']) == ['2018-01-05']
+    assert list(store.search("重组")['date']) == ['2018-04-01']
+    assert store.search("分红").empty
+    with pytest.raises(ValueError):
+        store.search("  ")
+
+
+def test_titles_are_indexed_without_download(store):
+    store.add(_announcements(), download=False)
+    assert store.stats()['pending'] == 4
+    assert store.search("年度报告")['code'].tolist() == ['600122']
+    assert store.search("主营业务").empty
+
+    assert store.process_pending() == 3
+    assert store.search("主营业务")['date'].tolist() == ['2018-03-10']
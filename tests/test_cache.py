@@ -0,0 +1,92 @@
+# -*- coding: UTF-8 -*-
+import time
+import threading
+
+import pandas as pd
+import pytest
+
+from tma.collector import ts
+from tma.collector.cache import QuoteCache
+
+
+def test_single_flight():
+    cache = QuoteCache()
+    calls = []
+    started = threading.Event()
+
+    def loader(keys):
+        calls.append(list(keys))
+        started.set()
+        time.sleep(0.1)
+        return {k: k.upper() for k in keys}
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.get_many("bars", ["a"], loader)))
+    first.start()
+    started.wait()
+    results.append(cache.get_many("bars", ["a"], loader))
+    first.join()
+    assert calls == [["a"]]
+    assert results == [{"a": "A"}, {"a": "A"}]
+
+
+def test_ttl_and_lru():
+    cache = QuoteCache(ttl={"bars": 0.05}, maxsize=2)
+    cache.put("bars", "a", 1)
+    cache.put("bars", "b", 2)
+    cache.put("bars", "c", 3)
+    assert len(cache) == 2
+    assert cache.get("bars", "a", lambda: 10) == 10
+    time.sleep(0.06)
+    assert cache.get("bars", "c", lambda: 30) == 30
+
+
+def test_base_exception_releases_flight():
+    cache = QuoteCache()
+
+    def interrupted(keys):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        cache.get_many("bars", ["a"], interrupted)
+    assert not cache._flights
+
+    done = []
+    t = threading.Thread(target=lambda: done.append(cache.get("bars", "a", lambda: 1)),
+                         daemon=True)
+    t.start()
+    t.join(2)
+    assert done == [1]
+
+
+def test_get_bars_fetches_fresh_by_default(monkeypatch):
+    calls = []
+
+    def load(codes):
+        calls.append(list(codes))
+        row = tuple(str(len(calls)) for _ in ts.QUOTE_COLUMNS) + (codes[0],)
+        return {codes[0]: row}
+
+    monkeypatch.setattr(ts, "_load_bars", load)
+    monkeypatch.setattr(ts, "quote_cache", QuoteCache())
+    assert ts.get_bars("600122").loc[0, 'price'] == "1"
+    assert ts.get_bars("600122").loc[0, 'price'] == "2"
+    # 显式使用缓存时复用上一次的结果
+    assert ts.get_bars("600122", use_cache=True).loc[0, 'price'] == "2"
+    assert len(calls) == 2
+
+
+def test_today_market_cache_is_opt_in(monkeypatch, tmp_path):
+    calls = []
+
+    def get_today_all():
+        calls.append(1)
+        return pd.DataFrame({'code': ['600122'], 'name': ['宏图高科'],
+                             'volume': [float(len(calls))]})
+
+    monkeypatch.setattr(ts.ts, "get_today_all", get_today_all)
+    monkeypatch.setattr(ts, "quote_cache", QuoteCache())
+    assert ts.get_today_market(save=False)['volume'][0] == 1
+    assert ts.get_today_market(save=False)['volume'][0] == 2
+    assert ts.get_today_market(save=False, use_cache=True)['volume'][0] == 2
+    assert len(calls) == 2
@@ -0,0 +1,66 @@
+# -*- coding: UTF-8 -*-
+import threading
+
+import requests
+
+from tma.storage import get_storage
+from tma.collector import cninfo
+from tma.collector.cninfo import LatestAnnouncementSync
+
+
+def _item(n, with_id=True):
+    item = {'adjunctUrl': 'finalpage/%i.PDF' % n, 'announcementTitle': '公告%i' % n,
+            'announcementTime': 1530500000000, 'secCode': '600122', 'secName': '宏图高科'}
+    if with_id:
+        item['announcementId'] = n
+    return item
+
+
+class FakeLatest(object):
+    """按 pageNum、pageSize 分页返回 items 的最新公告接口"""
+
+    def __init__(self, items):
+        self.items = items
+        self.calls = []
+        self.sessions = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, sess, url, data=None, timeout=None, **kwargs):
+        with self._lock:
+            self.calls.append(timeout)
+            self.sessions.add((threading.get_ident(), id(sess)))
+        size = data['pageSize']
+        start = (data['pageNum'] - 1) * size
+        res = {'announcements': self.items[start:start + size],
+               'totalAnnouncement': len(self.items),
+               'hasMore': start + size < len(self.items)}
+        return type('Response', (), {'json': lambda self: res})()
+
+
+def test_parse_latest_pages_concurrently(monkeypatch):
+    fake = FakeLatest([_item(n) for n in range(100, 0, -1)])
+    monkeypatch.setattr(requests.Session, 'post', lambda sess, *a, **k: fake(sess, *a, **k))
+    announcements = cninfo.get_sh_latest()
+    assert [a['id'] for a in announcements] == [str(n) for n in range(100, 0, -1)]
+    assert fake.calls == [cninfo.TIMEOUT] * 4
+    # 每个线程使用各自的 Session
+    threads = {t for t, _ in fake.sessions}
+    assert len({s for _, s in fake.sessions}) == len(threads)
+
+
+def test_sync_with_missing_ids(monkeypatch, tmp_path):
+    items = [_item(5), _item(4, with_id=False), _item(3), _item(2), _item(1)]
+    fake = FakeLatest(items)
+    monkeypatch.setattr(requests.Session, 'post', lambda sess, *a, **k: fake(sess, *a, **k))
+    storage = get_storage("csv", root=str(tmp_path))
+
+    sync = LatestAnnouncementSync("sh", storage=storage)
+    assert len(sync.sync()) == 5
+
+    # 新的同步对象从本地存储恢复；没有 announcementId 的新公告也能识别
+    items.insert(0, _item(7, with_id=False))
+    items.insert(0, _item(8))
+    sync = LatestAnnouncementSync("sh", storage=storage)
+    assert [a['title'] for a in sync.sync()] == ['公告8', '公告7']
+    assert sync.sync() == []
+    assert set(fake.calls) == {cninfo.TIMEOUT}
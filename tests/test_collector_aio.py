@@ -0,0 +1,82 @@
+# -*- coding: UTF-8 -*-
+import asyncio
+
+import aiohttp
+import pytest
+
+from tma.collector import sse, ths, xhn
+from tma.collector.aio import AsyncClient
+
+SH_INDEXES_JS = "\n".join(
+    "_t.push({JC:'%s',ZSDM:'%s',abbr:'sh',ZRSP:'10',DRKP:'10',DRSP:'11',"
+    "DRZD:'11',DRZX:'9',ZDF:'10'});" % (name, code)
+    for name, code in [('上证指数', '000001'), ('上证50', '000016')]
+)
+
+
+def test_sh_indexes_sync_and_async(stub_server, monkeypatch):
+    stub_server.route('/indexQuotes.js', SH_INDEXES_JS)
+    monkeypatch.setattr(sse, 'URL_SH_INDEXES', stub_server.url + '/indexQuotes.js')
+    sync = sse.get_sh_indexes()
+    res = asyncio.run(sse.get_sh_indexes_async())
+    assert res['code'].tolist() == ['000001', '000016']
+    assert res.equals(sync)
+
+
+def test_ths_plates_async(stub_server, monkeypatch):
+    for kind in ths.PLATE_KINDS:
+        stub_server.route('/%s/' % kind,
+                          '<div class="category boxShadow m_links">'
+                          '<a href="http://q.10jqka.com.cn/%s/detail/code/30%s/">板块</a></div>'
+                          % (kind, len(kind)))
+    monkeypatch.setattr(ths, 'URL_PLATES', stub_server.url + '/%s/')
+    plates = asyncio.run(ths.get_ths_plates_async())
+    assert len(plates) == len(ths.PLATE_KINDS)
+    assert set(plates['kind']) == set(ths.PLATE_KINDS.values())
+
+
+def test_xhn_articles_async_shares_one_client(stub_server):
+    day = '2018-06-20'
+    links = ['%s/fortune/2018-06/20/c_%i.htm' % (stub_server.url, i) for i in range(20)]
+    stub_server.route('/', "".join('<a href="%s">标题%i</a>' % (url, i)
+                                   for i, url in enumerate(links)))
+    for i in range(20):
+        stub_server.route('/fortune/2018-06/20/c_%i.htm' % i,
+                          '<div class="h-news">标题%i&#13;\n%s 10:00:00&#13;\n来源：新华网</div>'
+                          '<div id="p-detail">　　正文%i</div>' % (i, day, i))
+    home = xhn.HomePage()
+    home.home_url = stub_server.url + '/'
+
+    async def _run():
+        async with AsyncClient(limit_per_host=4) as client:
+            return await home.get_articles_async(d=[day], client=client)
+
+    articles = asyncio.run(_run())
+    assert sorted(a['title'] for a in articles) == sorted('标题%i' % i for i in range(20))
+    assert all(a['content'].startswith('正文') for a in articles)
+    assert len(stub_server.hits) == 21
+
+
+def test_async_client_does_not_retry_4xx(stub_server):
+    async def _run():
+        async with AsyncClient(retries=3) as client:
+            await client.get_text(stub_server.url + '/missing')
+
+    with pytest.raises(aiohttp.ClientResponseError) as e:
+        asyncio.run(_run())
+    assert e.value.status == 404
+    assert len(stub_server.hits) == 1
+
+
+def test_async_client_retries_5xx_and_429(stub_server):
+    stub_server.route('/busy', 'busy', status=503)
+    stub_server.route('/limited', 'slow down', status=429)
+
+    async def _run(path):
+        async with AsyncClient(retries=2) as client:
+            await client.get_text(stub_server.url + path)
+
+    for path in ('/busy', '/limited'):
+        with pytest.raises(aiohttp.ClientResponseError):
+            asyncio.run(_run(path))
+    assert stub_server.hits == ['/busy', '/busy', '/limited', '/limited']
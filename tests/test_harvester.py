@@ -0,0 +1,84 @@
+# -*- coding: UTF-8 -*-
+import time
+import threading
+
+import pandas as pd
+import pytest
+
+from tma.storage import get_storage
+from tma.collector.store import KlineStore
+from tma.collector.aggregation import KlineHarvester
+from tma.collector.utils import TokenBucket
+
+DATES = ['2018-07-02', '2018-07-03', '2018-07-04']
+
+
+class FakeKlines(object):
+    """记录调用的 get_klines，codes 中的股票总是失败"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, code, freq="D", start_date=None):
+        with self._lock:
+            self.calls.append(code)
+        if code in self.failing:
+            raise IOError("timeout %s" % code)
+        return pd.DataFrame({'date': DATES, 'open': 10.0, 'close': 10.0, 'high': 10.0,
+                             'low': 10.0, 'volume': 100.0, 'code': code})
+
+
+def _harvester(tmp_path, fetch, **kwargs):
+    store = KlineStore(storage=get_storage("csv", root=str(tmp_path)))
+    return KlineHarvester(store=store, fetch=fetch, retries=1,
+                          checkpoint=str(tmp_path / "D.ckpt"), **kwargs)
+
+
+CODES = ['%06d' % i for i in range(1, 21)]
+
+
+def test_concurrent_harvest(tmp_path):
+    fetch = FakeKlines()
+    df = _harvester(tmp_path, fetch, workers=4).harvest(CODES)
+    assert sorted(df['code'].unique()) == CODES
+    assert sorted(fetch.calls) == CODES
+
+
+def test_resume_fetches_only_failed_codes(tmp_path):
+    fetch = FakeKlines(failing=['000003'])
+    harvester = _harvester(tmp_path, fetch, workers=4)
+    df = harvester.harvest(CODES)
+    assert harvester.failed == ['000003']
+    assert len(df) == 3 * (len(CODES) - 1)
+
+    fetch = FakeKlines()
+    harvester = _harvester(tmp_path, fetch, workers=4)
+    df = harvester.harvest(CODES)
+    assert fetch.calls == ['000003']
+    assert sorted(df['code'].unique()) == CODES
+
+
+def test_expired_checkpoint_is_discarded(tmp_path):
+    _harvester(tmp_path, FakeKlines()).harvest(CODES[:3])
+    fetch = FakeKlines()
+    _harvester(tmp_path, fetch, resume_ttl=0).harvest(CODES[:3])
+    assert sorted(fetch.calls) == CODES[:3]
+
+
+def test_rate_limit(tmp_path):
+    # 令牌桶初始有10个令牌，之后每秒生成10个；20个请求至少需要1s
+    t = time.monotonic()
+    _harvester(tmp_path, FakeKlines(), workers=4, rate=10).harvest(CODES)
+    assert time.monotonic() - t >= 0.9
+
+
+def test_token_bucket_rejects_non_positive_rate():
+    for rate in (0, -1):
+        with pytest.raises(ValueError):
+            TokenBucket(rate)
+    bucket = TokenBucket(1)
+    with pytest.raises(ValueError):
+        bucket.set_rate(0)
+    assert bucket.rate == 1
@@ -0,0 +1,75 @@
+# -*- coding: UTF-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from tma.storage import get_storage
+from tma.collector import KlineStore, OHLCVPanel
+from tma.indicator import ShareDayIndicator, MarketShareIndicatorEngine
+
+
+def _klines(code, n, seed, drop=()):
+    rng = np.random.RandomState(seed)
+    dates = pd.bdate_range('2017-01-02', periods=300).strftime('%Y-%m-%d')[-n:]
+    close = np.round(10 + rng.randn(n).cumsum() * 0.1, 2)
+    kls = pd.DataFrame({'date': dates, 'open': np.round(close * 0.99, 2), 'close': close,
+                        'high': np.round(close * 1.02, 2), 'low': np.round(close * 0.97, 2),
+                        'volume': 100.0, 'code': code})
+    return kls.drop(list(drop)).reset_index(drop=True)
+
+
+@pytest.fixture
+def frames():
+    return {
+        '600122': _klines('600122', 300, 1),
+        # 停牌的交易日在面板中为NaN
+        '000001': _klines('000001', 300, 2, drop=range(250, 260)),
+        # 只有30根K线：与 ShareDayIndicator 一样，MA60及以上为全部K线的均值；
+        # N=40/60的指标为NaN
+        '300750': _klines('300750', 30, 3),
+    }
+
+
+@pytest.fixture
+def engine(frames, tmp_path):
+    store = KlineStore("D", storage=get_storage("csv", root=str(tmp_path)))
+    for code, kls in frames.items():
+        store.write(code, kls)
+    store.save_meta()
+    panel = OHLCVPanel.build("D", store=store, path=str(tmp_path / "panel"))
+    last = {code: kls.iloc[-1] for code, kls in frames.items()}
+    quotes = pd.DataFrame({
+        'code': list(last), 'name': list(last),
+        'trade': [r['close'] for r in last.values()],
+        'settlement': [r['open'] for r in last.values()],
+        'high': [r['high'] for r in last.values()],
+        'low': [r['low'] for r in last.values()],
+        'amount': 1e6,
+    })
+    return MarketShareIndicatorEngine(panel=panel, quotes=quotes)
+
+
+def test_matches_share_day_indicator(engine, frames):
+    df = engine.run(['ma', 'lnd']).set_index('CODE')
+    for code in ('600122', '000001'):
+        sdi = ShareDayIndicator(code)
+        sdi.kls = frames[code].copy()
+        sdi.cal_move_average()
+        sdi.cal_latest_nd()
+        for key, value in sdi.features.items():
+            if key in ('DATE', 'CODE'):
+                continue
+            assert df.loc[code, key] == pytest.approx(value, abs=2e-4), (code, key)
+
+
+def test_short_history_is_nan(engine, frames):
+    df = engine.run(['ma', 'lnd']).set_index('CODE')
+    row = df.loc['300750']
+    assert row['MA30_D'] == pytest.approx(frames['300750']['close'].mean(), abs=1e-4)
+    assert row['MA240_D'] == row['MA30_D']
+    assert not np.isnan(row['HIGH_20']) and np.isnan(row['HIGH_40'])
+
+
+def test_unknown_target(engine):
+    with pytest.raises(ValueError):
+        engine.run(['bs'])
@@ -0,0 +1,36 @@
+# -*- coding: UTF-8 -*-
+import os
+import sys
+import json
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ['tma.collector', 'tma.utils', 'tushare', 'pandas']
+
+
+def _run(code, home):
+    env = dict(os.environ, HOME=str(home), PYTHONPATH=ROOT)
+    out = subprocess.run([sys.executable, "-c", code], env=env, check=True,
+                         stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(out)
+
+
+def test_import_is_lazy(tmp_path):
+    loaded = _run("import sys, json, tma\n"
+                  "print(json.dumps([m for m in %r if m in sys.modules]))" % HEAVY,
+                  tmp_path)
+    assert loaded == []
+    # import tma 不加载交易日历缓存
+    data = os.path.join(str(tmp_path), ".tma", "data")
+    assert not [f for f in os.listdir(data) if f.startswith("calendar")]
+
+
+def test_submodule_loaded_on_first_access(tmp_path):
+    loaded = _run("import sys, json, tma\n"
+                  "before = 'tma.storage' in sys.modules\n"
+                  "tma.storage\n"
+                  "print(json.dumps([before, 'tma.storage' in sys.modules,\n"
+                  "                  'tma.collector' in sys.modules]))",
+                  tmp_path)
+    assert loaded == [False, True, False]
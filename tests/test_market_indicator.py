@@ -0,0 +1,46 @@
+# -*- coding: UTF-8 -*-
+import pandas as pd
+
+from tma.indicator.market import (MarketDayIndicator, classify_limits, NONE,
+                                  SEALED, ONE_WORD, TOUCHED)
+
+# code, name, settlement, trade, high, low, volume, 涨停分类, 跌停分类
+ROWS = [
+    ('600001', '一字涨停', 10.0, 11.0, 11.0, 11.0, 100, ONE_WORD, NONE),
+    ('600002', '涨停', 10.0, 11.0, 11.0, 10.5, 100, SEALED, NONE),
+    ('600003', '触及涨停', 10.0, 10.8, 11.0, 10.5, 100, TOUCHED, NONE),
+    ('600004', '*ST股', 10.0, 10.5, 10.5, 10.0, 100, SEALED, NONE),
+    ('600005', '跌停', 10.0, 9.0, 9.5, 9.0, 100, NONE, SEALED),
+    ('600006', '触及跌停', 10.0, 9.5, 9.8, 9.0, 100, NONE, TOUCHED),
+    ('600007', '一字跌停', 10.0, 9.0, 9.0, 9.0, 100, NONE, ONE_WORD),
+    ('600008', '四舍五入', 9.87, 10.86, 10.86, 10.0, 100, SEALED, NONE),
+    ('600009', '停牌', 10.0, 11.0, 11.0, 11.0, 0, NONE, NONE),
+    ('300001', '创业板未涨停', 10.0, 11.0, 11.0, 10.0, 100, NONE, NONE),
+    ('300002', '创业板涨停', 10.0, 12.0, 12.0, 11.0, 100, SEALED, NONE),
+    ('688001', '科创板触及跌停', 10.0, 8.5, 9.0, 8.0, 100, NONE, TOUCHED),
+]
+
+
+def _market():
+    m = pd.DataFrame([r[:7] for r in ROWS], columns=['code', 'name', 'settlement', 'trade',
+                                                       'high', 'low', 'volume'])
+    m['changepercent'] = (m['trade'] / m['settlement'] - 1) * 100
+    m['turnoverratio'] = range(len(m))
+    return m
+
+
+def test_classify_limits():
+    up, down = classify_limits(_market())
+    assert up.tolist() == [r[7] for r in ROWS]
+    assert down.tolist() == [r[8] for r in ROWS]
+
+
+def test_market_day_indicator():
+    mdi = MarketDayIndicator()
+    mdi.m = _market()
+    mdi.run()
+    f = mdi.features
+    assert (f['M002'], f['M003'], f['M004'], f['M005']) == (12, 8, 8, 4)
+    assert f['M009'] == 5 and f['M010'] == 1 and f['M011'] == 1
+    assert f['M013'] == 2 and f['M014'] == 1 and f['M015'] == 2
+    assert f['M012'] == 5 / 6 and f['M016'] == 0.5
@@ -0,0 +1,114 @@
+# -*- coding: UTF-8 -*-
+import numpy as np
+import pytest
+import pandas as pd
+
+from tma.monitor.market import MarketBreadthStream
+
+
+def test_breadth_stream_turnover_from_pre_open_snapshot():
+    # 开盘前的快照：成交量、换手率、最新价都为0
+    snapshot = pd.DataFrame({
+        'code': ['600122', '000001'], 'name': ['宏图高科', '平安银行'],
+        'changepercent': 0.0, 'trade': 0.0, 'open': 0.0, 'high': 0.0,
+        'low': 0.0, 'settlement': [5.0, 10.0], 'volume': 0.0,
+        'turnoverratio': 0.0, 'nmc': [50000.0, 200000.0],
+    })
+    stream = MarketBreadthStream().load_snapshot(snapshot)
+    assert np.allclose(stream.float_shares, [1e8, 2e8])
+
+    stream.ingest(pd.DataFrame({
+        'code': ['600122', '000001'], 'price': [5.1, 9.9],
+        'high': [5.2, 10.0], 'low': [5.0, 9.8], 'volume': [1e6, 4e6],
+    }))
+    assert np.allclose(stream.turnover, [1.0, 2.0])
+
+
+def _random_market(n, rng):
+    pre = np.round(rng.uniform(5, 50, n), 2)
+    codes = ['%06d' % (600000 + i) if i % 4 else '%06d' % (300000 + i) for i in range(n)]
+    return pd.DataFrame({
+        'code': codes, 'name': ['ST%i' % i if i % 10 == 0 else 'S%i' % i for i in range(n)],
+        'changepercent': 0.0, 'trade': 0.0, 'open': 0.0, 'high': 0.0, 'low': 0.0,
+        'settlement': pre, 'volume': 0.0, 'turnoverratio': 0.0,
+        'nmc': rng.uniform(1e5, 1e6, n),
+    })
+
+
+def _random_bars(stream, rng, k):
+    rows = rng.choice(len(stream.codes), k, replace=False)
+    pre = stream.pre_close[rows]
+    limit = np.floor(pre * (1 + stream.rates[rows]) * 100 + 0.5) / 100
+    # 一部分股票直接封在涨停价，其余随机波动
+    price = np.where(rng.rand(k) < 0.2, limit,
+                     np.round(pre * (1 + rng.uniform(-0.1, 0.1, k)), 2))
+    high = np.maximum(np.maximum(stream.high[rows], price),
+                      np.where(rng.rand(k) < 0.1, limit, 0))
+    low = np.where(stream.low[rows] > 0, np.minimum(stream.low[rows], price), price)
+    return pd.DataFrame({'code': stream.codes[rows], 'price': price, 'high': high,
+                         'low': low, 'volume': stream.volume[rows] + rng.randint(1, 1e5, k)})
+
+
+def test_incremental_counters_match_full_recount():
+    rng = np.random.RandomState(0)
+    snapshot = _random_market(400, rng)
+    stream = MarketBreadthStream().load_snapshot(snapshot)
+    for _ in range(20):
+        stream.ingest(_random_bars(stream, rng, 50))
+        features = stream.publish()
+
+        current = snapshot.copy()
+        current['trade'], current['high'], current['low'] = stream.trade, stream.high, stream.low
+        current['volume'], current['changepercent'] = stream.volume, stream.change
+        current['turnoverratio'] = stream.turnover
+        full = MarketBreadthStream().load_snapshot(current)
+        assert (stream.counters == full.counters).all()
+        assert features == full.features
+
+
+def test_poll_publishes_only_on_change():
+    snapshot = _random_market(3, np.random.RandomState(1))
+    bars = pd.DataFrame({'code': snapshot['code'], 'price': snapshot['settlement'] * 1.05,
+                         'high': snapshot['settlement'] * 1.05,
+                         'low': snapshot['settlement'], 'volume': 1000.0})
+    stream = MarketBreadthStream(fetch=lambda codes: bars).load_snapshot(snapshot)
+    pushed = []
+    stream.subscribe(lambda seq, features, latency: pushed.append((seq, features['M003'])))
+    assert stream.poll() == 3
+    assert stream.poll() == 0
+    assert pushed == [(1, 3)]
+
+
+def test_limit_board_monitor_batches_and_cools_down():
+    quotes = pd.DataFrame({
+        'code': ['600122', '000001', '600519'],
+        # 买一 / 卖一挂单金额（万元）= 量（手） * 价 * 100 / 10000
+        'b1_v': [1000.0, 50000.0, 0.0], 'b1_p': [10.0, 10.0, 0.0],
+        'a1_v': [0.0, 200.0, 0.0], 'a1_p': [0.0, 10.0, 0.0],
+    })
+    fetched, pushed = [], []
+
+    def fetch(codes):
+        fetched.append(codes)
+        return quotes
+
+    from tma.monitor.single import LimitBoardMonitor
+    lbm = LimitBoardMonitor(cooldown=60, fetch=fetch,
+                            push=lambda title, content: pushed.append(title))
+    lbm.add('600122', 'zt', threshold=5000).add('000001', 'zt', threshold=5000)
+    lbm.add('000001', 'dt', threshold=100).add('300750', 'zt')
+
+    alerts = lbm.poll(now=0)
+    assert fetched == [['600122', '000001', '300750']]
+    assert [(a['code'], a['kind'], a['money']) for a in alerts] == \
+        [('600122', 'zt', 100.0), ('000001', 'dt', 20.0)]
+    assert len(pushed) == 2
+
+    # 冷却时间内不重复推送
+    assert lbm.poll(now=30) == []
+    assert [a['code'] for a in lbm.poll(now=60)] == ['600122', '000001']
+
+    lbm.remove('000001')
+    assert [a['code'] for a in lbm.poll(now=200)] == ['600122']
+    with pytest.raises(ValueError):
+        lbm.add('600122', 'up')
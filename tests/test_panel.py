@@ -0,0 +1,49 @@
+# -*- coding: UTF-8 -*-
+import os
+
+import numpy as np
+import pandas as pd
+
+from tma.storage import get_storage
+from tma.collector import KlineStore, OHLCVPanel
+
+
+def _klines(code, dates, close):
+    close = np.asarray(close, dtype=float)
+    return pd.DataFrame({'date': dates, 'open': close, 'high': close + 1,
+                         'low': close - 1, 'close': close, 'volume': 100.0,
+                         'code': code})
+
+
+def _store(tmp_path):
+    store = KlineStore("D", storage=get_storage("csv", root=str(tmp_path)))
+    store.write('600122', _klines('600122', ['2018-07-02', '2018-07-03', '2018-07-04'],
+                                  [10, 11, 12]))
+    # 000001 在 07-03 停牌
+    store.write('000001', _klines('000001', ['2018-07-02', '2018-07-04'], [20, 22]))
+    store.save_meta()
+    return store
+
+
+def test_build_layout(tmp_path):
+    store = _store(tmp_path)
+    panel = OHLCVPanel.build("D", store=store, path=str(tmp_path / "panel"))
+    assert panel.shape == (3, 2)
+    assert panel.codes.tolist() == ['000001', '600122']
+    assert panel.series('close', '600122').tolist() == [10, 11, 12]
+    assert np.isnan(panel.cross_section('close', '2018-07-03')[0])
+    assert panel.close[panel.date_slice('2018-07-03')].shape == (2, 2)
+
+
+def test_load_rebuilds_after_journaled_update(tmp_path):
+    store = _store(tmp_path)
+    path = str(tmp_path / "panel")
+    OHLCVPanel.build("D", store=store, path=path)
+    assert OHLCVPanel.load("D", store=store, path=path).series('close', '600122')[-1] == 12
+
+    # 只写入 _meta.log，不重写 _meta.json
+    store.write('600122', _klines('600122', ['2018-07-02', '2018-07-03', '2018-07-04'],
+                                  [10, 11, 13]))
+    assert os.path.exists(store.file_journal)
+    panel = OHLCVPanel.load("D", store=store, path=path)
+    assert panel.series('close', '600122')[-1] == 13
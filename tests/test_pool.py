@@ -0,0 +1,185 @@
+# -*- coding: UTF-8 -*-
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tma.storage import get_storage
+from tma.collector import KlineStore, OHLCVPanel
+from tma.pool import StockPool, PoolAnalyzer
+
+DT = "2018-07-02 10:00:00"
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = StockPool("test", pool_path=str(tmp_path), fsync=False)
+    yield pool
+    pool.close()
+
+
+def test_log_replay_and_hist(pool, tmp_path):
+    pool.add_many(['600122', '000001'], "SS01", 3, dt=DT)
+    pool.add('600122', "SS02", 2, dt=DT)
+    pool.remove('000001', 3)
+    pool.close()
+
+    restored = StockPool("test", pool_path=str(tmp_path))
+    assert [(e['code'], e['level'], e['reason']) for e in restored.query()] == \
+        [('600122', 3, 'SS01'), ('600122', 2, 'SS02')]
+    assert [h['code'] for h in restored.restore_hist()] == ['000001']
+
+
+def test_migrate_legacy_json(tmp_path):
+    shares = {"level1": [], "level2": [],
+              "level3": [{"code": "600122", "dt": DT, "level": 3, "reason": "SS01"}]}
+    with open(str(tmp_path / "old_pool.json"), 'w', encoding='utf-8') as f:
+        json.dump(shares, f)
+    pool = StockPool("old", pool_path=str(tmp_path))
+    assert pool.check('600122', 3) == [dict(shares['level3'][0])]
+
+
+def test_query_indexes(pool):
+    pool.add_many(['600122', '000001'], "SS01", 3, dt=DT)
+    pool.add('600122', "SS02", 2, dt="2018-07-03 10:00:00")
+    assert [e['code'] for e in pool.query(reason="SS01")] == ['600122', '000001']
+    assert [e['reason'] for e in pool.query(code='600122')] == ['SS01', 'SS02']
+    assert [e['level'] for e in pool.query(date='2018-07-03')] == [2]
+    assert pool.query(code='000001', level=2) == []
+
+
+def test_results_are_copies(pool):
+    pool.add('600122', "SS01", 3, dt=DT)
+    pool.check('600122', 3)[0]['level'] = 1
+    pool.query(code='600122')[0]['code'] = '000001'
+    assert pool.query() == [{'code': '600122', 'dt': DT, 'level': 3, 'reason': 'SS01'}]
+    assert pool.query(code='000001') == []
+
+    with pytest.raises(TypeError):
+        pool.shares['level3'][0]['level'] = 1
+    with pytest.raises(TypeError):
+        pool.shares['level1'] = ()
+
+
+def _log_records(pool):
+    with open(pool.path_log, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_batch_rollback_keeps_earlier_pending(pool, tmp_path):
+    pool.add('600122', "SS01", 3, dt=DT)
+    pool.add('000002', "SS01", 3, dt=DT, save=False)
+    with pytest.raises(RuntimeError):
+        with pool.batch():
+            pool.add_many(['000001', '600519'], "SS02", 2, dt=DT)
+            pool.remove('600122', 3)
+            with pool.batch():
+                pool.empty()
+            raise RuntimeError
+
+    assert [e['code'] for e in pool.query()] == ['600122', '000002']
+    assert pool.query(reason="SS02") == [] and pool.query(level=2) == []
+    assert len(_log_records(pool)) == 1
+    assert not pool._batch_depth and not pool._pending_hist
+
+    # 批量开始前暂存的变更仍会提交，撤销的变更不会
+    pool.save()
+    pool.add('300750', "SS03", 1, dt=DT)
+    pool.close()
+    restored = StockPool("test", pool_path=str(tmp_path))
+    assert [e['code'] for e in restored.query()] == ['600122', '000002', '300750']
+    assert restored.restore_hist() == []
+
+
+def test_nested_batch_commits_once(pool):
+    with pool.batch():
+        pool.add_many(['600122', '000001'], "SS01", 3, dt=DT)
+        with pool.batch():
+            pool.remove('000001', 3)
+        assert not os.path.exists(pool.path_log)
+        pool.add('600519', "SS02", 2, dt=DT)
+
+    records = _log_records(pool)
+    assert [r['op'] for r in records] == ['batch']
+    assert [r['op'] for r in records[0]['ops']] == ['add', 'add', 'remove', 'add']
+    assert [h['code'] for h in pool.restore_hist()] == ['000001']
+
+
+def test_torn_batch_is_ignored(pool, tmp_path):
+    pool.add('600122', "SS01", 3, dt=DT)
+    with pool.batch():
+        pool.add_many(['000001', '600519'], "SS02", 2, dt=DT)
+    pool.close()
+    with open(pool.path_log, 'r+', encoding='utf-8') as f:
+        content = f.read()
+        f.seek(0)
+        f.truncate()
+        f.write(content[:-10])
+
+    restored = StockPool("test", pool_path=str(tmp_path))
+    assert [e['code'] for e in restored.query()] == ['600122']
+    restored.add('300750', "SS03", 1, dt=DT)
+    restored.close()
+    assert [e['code'] for e in StockPool("test", pool_path=str(tmp_path)).query()] == \
+        ['600122', '300750']
+
+
+def test_flusher_commits_on_close(tmp_path):
+    pool = StockPool("test", pool_path=str(tmp_path), fsync=False, flush_interval=3600)
+    with pool.batch():
+        pool.add_many(['600122', '000001'], "SS01", 3, dt=DT)
+    pool.remove('000001', 3)
+    assert not os.path.exists(pool.path_log)
+    pool.close()
+    assert pool._flusher is None
+    assert [e['code'] for e in StockPool("test", pool_path=str(tmp_path)).query()] == ['600122']
+
+
+def test_pool_analyzer_returns_and_summary(pool, tmp_path):
+    store = KlineStore("D", storage=get_storage("csv", root=str(tmp_path / "klines")))
+    dates = ['2018-07-02', '2018-07-03', '2018-07-04', '2018-07-05']
+    for code, close in (('600122', [10, 11, 12, 9]), ('000001', [20, np.nan, 22, 18])):
+        keep = ~np.isnan(close)
+        store.write(code, pd.DataFrame({
+            'date': np.array(dates)[keep], 'open': np.array(close)[keep],
+            'high': np.array(close)[keep], 'low': np.array(close)[keep],
+            'close': np.array(close)[keep], 'volume': 100.0, 'code': code}))
+    store.save_meta()
+    panel = OHLCVPanel.build("D", store=store, path=str(tmp_path / "panel"))
+
+    entries = pd.DataFrame([
+        ('600122', '2018-07-02 10:00:00', 3, 'SS01'),
+        # 000001 在 07-03 停牌
+        ('000001', '2018-07-02 14:00:00', 3, 'SS01'),
+        # 早于面板的第一个交易日
+        ('600122', '2018-07-01 10:00:00', 2, 'SS02'),
+        # 非交易日取之前最近的交易日，之后没有K线
+        ('600122', '2018-07-08 10:00:00', 2, 'SS02'),
+        # 不在面板中
+        ('300750', '2018-07-03 10:00:00', 2, 'SS02'),
+    ], columns=['code', 'dt', 'level', 'reason'])
+    analyzer = PoolAnalyzer(panel, horizons=(1, 2))
+    rets = analyzer.returns(entries)
+    assert rets['entry_date'][[0, 1, 3]].tolist() == ['2018-07-02', '2018-07-02', '2018-07-05']
+    assert rets['entry_date'].isna().tolist() == [False, False, True, False, True]
+    np.testing.assert_allclose(rets['entry_price'], [10, 20, np.nan, 9, np.nan])
+    np.testing.assert_allclose(rets['ret_1'], [0.1, np.nan, np.nan, np.nan, np.nan])
+    np.testing.assert_allclose(rets['ret_2'], [0.2, 0.1, np.nan, np.nan, np.nan])
+
+    summary = analyzer.summary(rets)
+    assert list(summary.columns[:4]) == ['ret_1_count', 'ret_1_mean',
+                                         'ret_1_median', 'ret_1_win_rate']
+    row = summary.loc[(3, 'SS01')]
+    assert row['ret_1_count'] == 1 and row['ret_2_count'] == 2
+    assert row['ret_2_mean'] == pytest.approx(0.15)
+    assert row['ret_2_win_rate'] == 1.0
+    assert summary.loc[(2, 'SS02'), 'ret_2_count'] == 0
+
+    # StockPool.performance 使用相同的计算，包含已移出的记录
+    pool.add_many(['600122', '000001'], "SS01", 3, dt=entries['dt'][0])
+    pool.remove('000001', 3)
+    perf = pool.performance(horizons=(1, 2), panel=panel)
+    assert perf.loc[(3, 'SS01'), 'ret_2_count'] == 2
+    assert perf.loc[(3, 'SS01'), 'ret_1_mean'] == pytest.approx(0.1)
@@ -0,0 +1,47 @@
+# -*- coding: UTF-8 -*-
+import pandas as pd
+
+from tma.collector import ts
+from tma.collector.quotes import parse_quotes, code_to_symbol, QUOTE_COLUMNS
+
+
+def sina_line(symbol, name, price):
+    values = [name, '5.000', '4.900', price, '5.200', '4.800', '5.090', '5.100',
+              '1234500', '6300000.000'] + ['1200', '5.090'] * 5 + ['3400', '5.100'] * 5 + \
+             ['2018-07-02', '15:00:00', '00']
+    return 'var hq_str_%s="%s";\n' % (symbol, ",".join(values))
+
+
+TEXT = sina_line('sh600122', '宏图高科', '5.100') + sina_line('sh000001', '上证指数', '2775.560')
+
+
+def test_code_to_symbol_index_alias():
+    assert code_to_symbol('600122') == 'sh600122'
+    assert code_to_symbol('000001') == 'sz000001'
+    assert code_to_symbol('sh') == 'sh000001'
+    assert code_to_symbol('hs300') == 'sh000300'
+    assert code_to_symbol('cyb') == 'sz399006'
+
+
+def test_parse_quotes_typed_and_raw():
+    typed = parse_quotes(TEXT)
+    assert typed['price'].tolist() == [5.1, 2775.56]
+    assert typed['b1_v'].tolist() == [12.0, 12.0]
+    raw = parse_quotes(TEXT, raw=True)
+    assert list(raw.columns) == QUOTE_COLUMNS + ['code']
+    assert raw['price'].tolist() == ['5.100', '2775.560']
+    assert raw['b1_v'].tolist() == ['12', '12']
+    assert raw['code'].tolist() == ['600122', '000001']
+
+
+def test_get_bars_keeps_string_output_and_index_alias(monkeypatch):
+    def fake_quotes(codes, raw=False):
+        text = "".join(line for line in TEXT.splitlines(True)
+                       if any(code_to_symbol(c) in line for c in codes))
+        return parse_quotes(text, raw)
+
+    monkeypatch.setattr(ts, 'get_quotes', fake_quotes)
+    bars = ts.get_bars(['600122', 'sh'], use_cache=False)
+    assert bars['code'].tolist() == ['600122', '000001']
+    assert bars['price'].tolist() == ['5.100', '2775.560']
+    assert all(pd.api.types.is_string_dtype(dtype) for dtype in bars.dtypes)
@@ -0,0 +1,104 @@
+# -*- coding: UTF-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from tma.storage import get_storage
+from tma.collector import KlineStore, OHLCVPanel
+from tma.analyst.rank import WeekRankEngine, TfidfDocRank, IdfTable, \
+    term_document_matrix, mean_top_n
+
+DATES = ['2018-07-06', '2018-07-13', '2018-07-20']
+
+
+@pytest.fixture
+def engine(tmp_path):
+    store = KlineStore("W", storage=get_storage("csv", root=str(tmp_path)))
+    # (open, close)，high = close，low = open；准则 = 涨幅*0.5 + 振幅*0.5 = 涨幅
+    weeks = {
+        '000001': [(10, 11), (11, 12.1), (12.1, 12.1)],
+        '600122': [(10, 12), (12, 12), (12, 15)],
+        '600519': [(10, 10.5), None, (10.5, 10)],
+    }
+    for code, bars in weeks.items():
+        rows = [(d, o, c, c, o if o < c else c, 100.0, code)
+                for d, b in zip(DATES, bars) if b is not None for o, c in [b]]
+        store.write(code, pd.DataFrame(rows, columns=['date', 'open', 'close', 'high',
+                                                      'low', 'volume', 'code']))
+    store.save_meta()
+    panel = OHLCVPanel.build("W", store=store, path=str(tmp_path / "panel"))
+    return WeekRankEngine(panel=panel)
+
+
+def test_top_and_rank_history(engine):
+    assert engine.top('2018-07-06') == [(1, '600122'), (2, '000001'), (3, '600519')]
+    # 600519 第二周没有K线，不参与排序
+    assert engine.top('2018-07-13', n=10) == [(1, '000001'), (2, '600122')]
+    assert engine.rank_history('600519').tolist() == [3, 0, 3]
+
+
+def test_forward_returns_clamps_n(engine):
+    res = engine.forward_returns(n=30)
+    assert res.name == 'top30'
+    # 第一周三只股票下一周的收益率：000001 10%，600122 0%，600519 没有K线
+    assert res.loc['2018-07-06'] == pytest.approx(0.05)
+    # 两周的第一名（600122、000001）下一周都没有涨跌
+    assert engine.forward_returns(n=1).tolist() == pytest.approx([0.0, 0.0])
+
+
+# TFIDF
+# --------------------------------------------------------------------
+NEWS = [
+    '美俄安全对话：会谈5小时，未发布联合声明',
+    '内塔尼亚胡仍盼美国承认戈兰高地归以色列',
+    '缩量盘整中资金调仓换股 金融股5日吸金近60亿元',
+    '资金 资金 资金',
+    '123 abc ！',
+]
+
+
+def test_term_document_matrix_and_mean_top_n():
+    doc_idx, term_idx, counts, vocab = term_document_matrix(
+        [['a', 'b', 'a'], [], ['b', 'c']])
+    assert vocab == ['a', 'b', 'c']
+    assert doc_idx.tolist() == [0, 0, 2, 2]
+    assert term_idx.tolist() == [0, 1, 1, 2]
+    assert counts.tolist() == [2, 1, 1, 1]
+
+    weights = np.array([0.5, 0.2, 0.9, 0.1])
+    # 第0篇：(0.5+0.2+0.2)/3；第1篇没有词；第2篇：(0.9+0.1+0.1)/3
+    assert mean_top_n(doc_idx, weights, 3, 3) == pytest.approx([0.3, 0, 1.1 / 3])
+    assert mean_top_n(doc_idx, weights, 3, 1) == pytest.approx([0.5, 0, 0.9])
+
+
+def test_batch_scores_match_per_document_extract_tags():
+    r = TfidfDocRank(NEWS, N=5)
+    scores = r.scores()
+    docs = r.data_prepare()
+    for i, doc in enumerate(docs[:4]):
+        assert scores[i] == pytest.approx(r.mean_tfidf(doc, top_k=5))
+    # 清理后没有词的文档得分为0
+    assert scores[4] == 0.0
+
+    ranked = r.rank()
+    assert [s for s, _ in ranked] == sorted(scores, reverse=True)
+    assert r.rank(top=2) == ranked[:2]
+
+
+def test_idf_sources(tmp_path):
+    table = IdfTable({'资金': 2.0, '金融': 1.0, '美国': 4.0})
+    path = str(tmp_path / "idf.txt")
+    table.save(path)
+    loaded = IdfTable.load(path)
+    assert loaded.idf_freq == table.idf_freq
+    assert loaded.median_idf == 2.0
+    assert loaded.lookup(['美国', '未知']).tolist() == [4.0, 2.0]
+
+    assert TfidfDocRank(NEWS, N=3, idf=path).scores() == pytest.approx(
+        TfidfDocRank(NEWS, N=3, idf=table).scores())
+
+    # 只出现在一篇文档中的词IDF最大；在所有文档中都出现的词IDF为0
+    corpus = IdfTable.from_tokens([['资金', '金融'], ['资金']])
+    assert corpus.idf_freq == {'资金': 0.0, '金融': pytest.approx(np.log(2))}
+    r = TfidfDocRank(['资金金融', '资金'], N=1, idf="corpus")
+    assert r.scores() == pytest.approx([np.log(2) / 2, 0.0])
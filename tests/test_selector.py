@@ -0,0 +1,94 @@
+# -*- coding: UTF-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from tma.selector import ShareScreener, ScreenRule, compile_expr
+
+MA = ['MA5_D', 'MA10_D', 'MA20_D', 'MA30_D', 'MA60_D', 'MA120_D']
+
+
+@pytest.fixture
+def sdis():
+    rows = [
+        # CODE,    PRICE, MA5, MA10, MA20, MA30, MA60, MA120
+        ('000001', 8.0, 10.0, 10.005, 11, 12, 13, 14),    # SS01 SS02 SS03
+        ('600122', 10.0, 10.0, 10.5, 10, 10, 10, 10),      # 无
+        ('600519', 9.0, 11.0, 12.0, 13, 14, 15, 16),       # SS01 SS03
+        ('300750', 10.0, 10.0, 10.001, 9, 8, 7, 6),        # SS02
+        ('000002', np.nan, 10.0, 11.0, 12, 13, 14, 15),    # SS03
+    ]
+    return pd.DataFrame(rows, columns=['CODE', 'PRICE'] + MA)
+
+
+def _screener():
+    from tma.selector.ma import MA_RULES
+    return ShareScreener(rules=list(MA_RULES.rules.values()))
+
+
+def test_compile_expr_is_elementwise():
+    code, names = compile_expr("MA10_D > MA5_D > PRICE and not abs(PRICE) < lower")
+    assert names == ['MA10_D', 'MA5_D', 'PRICE', 'lower']
+    ns = {'MA10_D': np.array([3, 3, 1, 3]), 'MA5_D': np.array([2, 2, 2, 2]),
+          'PRICE': np.array([1, -1, 1, 3]), 'lower': 0.5}
+    res = eval(code, {'abs': np.abs, '__builtins__': {}}, ns)
+    assert res.tolist() == [True, True, False, False]
+
+    rule = ScreenRule("R", "(a > 1) or b == 0")
+    df = pd.DataFrame({'a': [0, 2, 0], 'b': [0, 1, 1]})
+    assert rule.mask(df).tolist() == [True, True, False]
+    assert rule.reason == "(a > 1) or b == 0"
+    # 常量表达式广播到每一行
+    assert ScreenRule("C", "1 > 0").mask(df).tolist() == [True] * 3
+
+
+def test_unknown_column_and_builtins():
+    df = pd.DataFrame({'a': [1]})
+    with pytest.raises(KeyError):
+        ScreenRule("R", "a > b").mask(df)
+    # 不在 FUNCTIONS 中的内置函数按列名处理
+    with pytest.raises(KeyError):
+        ScreenRule("R", "len(a) > 0").mask(df)
+    with pytest.raises(SyntaxError):
+        compile_expr("a >")
+
+
+def test_rules_match_legacy_conditions(sdis):
+    matrix = _screener().match(sdis)
+    assert list(matrix.columns) == ['SS01', 'SS02', 'SS03']
+    assert list(matrix.index) == list(sdis['CODE'])
+
+    p, ma5, ma10 = sdis['PRICE'], sdis['MA5_D'], sdis['MA10_D']
+    legacy = {
+        'SS01': p < 0.9 * ma5,
+        'SS02': (ma5 - ma10).abs() <= p * 0.001,
+        'SS03': np.logical_and.reduce(
+            [sdis[hi] > sdis[lo] for hi, lo in zip(MA[::-1][:-1], MA[::-1][1:])]),
+    }
+    for name, expected in legacy.items():
+        assert matrix[name].tolist() == list(expected), name
+
+
+def test_screen_reasons_and_how(sdis):
+    screener = _screener()
+
+    @screener.rule("LOW", "价格低于9")
+    def low(df):
+        return df['PRICE'] < 9
+
+    screened = screener.screen(sdis)
+    assert list(screened['CODE']) == ['000001', '600519', '300750', '000002']
+    assert screened['rules'].tolist() == [
+        ('SS01', 'SS02', 'SS03', 'LOW'), ('SS01', 'SS03'), ('SS02',), ('SS03',)]
+    assert screened['reason'].iloc[1] == "；".join(
+        screener.rules[n].reason for n in ('SS01', 'SS03'))
+    assert screener.rules['LOW'].reason == "价格低于9"
+
+    assert list(screener.screen(sdis, how="all")['CODE']) == ['000001']
+    assert list(screener.screen(sdis, rules="SS02")['CODE']) == ['000001', '300750']
+
+    params = ShareScreener(rules=[("PB", "lower < PRICE < upper", "区间")])
+    assert list(params.screen(sdis, lower=8.5, upper=10)['CODE']) == ['600519']
+
+    screener.unregister("LOW")
+    assert list(screener.match(sdis).columns) == ['SS01', 'SS02', 'SS03']
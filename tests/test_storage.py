@@ -0,0 +1,21 @@
+# -*- coding: UTF-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from tma.storage import ParquetStorage
+
+
+def test_parquet_read_many_mixed_dtypes(tmp_path):
+    pytest.importorskip("pyarrow")
+    storage = ParquetStorage(str(tmp_path))
+    storage.write("klines/D/600122", pd.DataFrame({
+        'date': ['2018-07-02'], 'code': ['600122'],
+        'volume': np.array([100], dtype=np.int64)}))
+    storage.write("klines/D/000001", pd.DataFrame({
+        'date': ['2018-07-03'], 'code': ['000001'], 'volume': [150.5]}))
+    df = storage.read_many(["klines/D/600122", "klines/D/000001"],
+                           columns=['code', 'volume'],
+                           filters=[('date', '>=', '2018-07-01')])
+    assert df['code'].tolist() == ['600122', '000001']
+    assert df['volume'].tolist() == [100.0, 150.5]
@@ -0,0 +1,98 @@
+# -*- coding: UTF-8 -*-
+import os
+
+import pandas as pd
+
+from tma.storage import get_storage
+from tma.collector.store import KlineStore
+from tma.collector.aggregation import KlineHarvester
+
+DATES = ['2018-07-02', '2018-07-03', '2018-07-04', '2018-07-05', '2018-07-06']
+
+
+class FakeKlines(object):
+    """按 start_date 返回 closes 对应的日K线"""
+
+    def __init__(self, closes):
+        self.closes = dict(zip(DATES, closes))
+        self.calls = []
+
+    def __call__(self, code, freq="D", start_date=None):
+        self.calls.append(start_date)
+        dates = [d for d in sorted(self.closes) if start_date is None or d >= start_date]
+        close = [self.closes[d] for d in dates]
+        return pd.DataFrame({'date': dates, 'open': close, 'close': close, 'high': close,
+                             'low': close, 'volume': 100.0, 'code': code})
+
+
+def _store(tmp_path):
+    return KlineStore(storage=get_storage("csv", root=str(tmp_path)))
+
+
+def test_incremental_update_from_check_date(tmp_path):
+    store = _store(tmp_path)
+    fetch = FakeKlines([10, 11, 12])
+    store.update('600122', fetch=fetch)
+    assert store.meta['600122'] == {'last_date': '2018-07-04', 'check_date': '2018-07-03',
+                                    'check_close': 11.0}
+
+    # 07-04 是盘中K线，更新后被替换
+    fetch.closes.update({'2018-07-04': 12.5, '2018-07-05': 13, '2018-07-06': 14})
+    kls = store.update('600122', fetch=fetch)
+    assert fetch.calls == [None, '2018-07-03']
+    assert kls['close'].tolist() == [10, 11, 12.5, 13, 14]
+    assert store.last_date('600122') == '2018-07-06'
+
+
+def test_adjusted_price_rewrite_refetches_all(tmp_path):
+    store = _store(tmp_path)
+    store.update('600122', fetch=FakeKlines([10, 11, 12]))
+    # 除权后前复权价格整体改写，校验K线（07-03）的收盘价不一致
+    fetch = FakeKlines([5, 5.5, 6, 6.5, 7])
+    kls = store.update('600122', fetch=fetch)
+    assert fetch.calls == ['2018-07-03', None]
+    assert kls['close'].tolist() == [5, 5.5, 6, 6.5, 7]
+    assert store.read('600122')['close'].tolist() == [5, 5.5, 6, 6.5, 7]
+
+
+def test_meta_journal_replayed_without_save_meta(tmp_path):
+    store = _store(tmp_path)
+    store.update('600122', fetch=FakeKlines([10, 11]))
+    store.update('000001', fetch=FakeKlines([20, 21]))
+    # 模拟中断：没有调用 save_meta，且日志末尾写了一半
+    with open(store.file_journal, 'a', encoding='utf-8') as f:
+        f.write('["600519", {"last_da')
+    assert not os.path.exists(store.file_meta)
+
+    reopened = _store(tmp_path)
+    assert reopened.codes == ['000001', '600122']
+    # 不完整的行被截掉，之后追加的记录不会与其连在一起
+    reopened.update('600519', fetch=FakeKlines([30, 31]))
+    assert _store(tmp_path).codes == ['000001', '600122', '600519']
+    reopened.save_meta()
+    assert not os.path.exists(reopened.file_journal)
+    assert _store(tmp_path).meta == reopened.meta
+
+
+def test_interrupted_harvest_keeps_meta_for_checkpointed_codes(tmp_path):
+    store = _store(tmp_path)
+    checkpoint = str(tmp_path / "D.ckpt")
+
+    class Interrupted(KlineHarvester):
+        def harvest(self, codes, resume=True, full=False):
+            self._prepare_checkpoint(resume=resume)
+            for code in codes:
+                self._harvest_one(code)
+            raise KeyboardInterrupt
+
+    try:
+        Interrupted(store=store, fetch=FakeKlines([10, 11]), checkpoint=checkpoint) \
+            .harvest(['600122', '000001'])
+    except KeyboardInterrupt:
+        pass
+
+    fetch = FakeKlines([10, 11])
+    harvester = KlineHarvester(store=_store(tmp_path), fetch=fetch, checkpoint=checkpoint)
+    df = harvester.harvest(['600122', '000001'])
+    assert fetch.calls == []
+    assert sorted(df['code'].unique()) == ['000001', '600122']
@@ -0,0 +1,109 @@
+# -*- coding: UTF-8 -*-
+from datetime import date, datetime
+
+import pandas as pd
+
+from tma import utils
+from tma.utils import TradeDayIndex
+
+
+# 交易日索引
+# --------------------------------------------------------------------
+
+def test_trade_day_index(calendar):
+    index = calendar.day_index
+    assert len(index) == 5
+    assert utils.is_trade_day('2018-07-02')
+    assert utils.is_trade_day(date(2018, 7, 6))
+    assert not utils.is_trade_day(datetime(2018, 7, 7, 10))
+
+    assert utils.get_recent_trade_days('2018-07-03', n=2) == ['2018-07-03', '2018-07-04']
+    assert utils.get_recent_trade_days('2018-07-03', n=-2) == ['2018-07-03', '2018-07-02']
+    # 非交易日：向后从下一个交易日开始，向前从上一个交易日开始
+    assert utils.get_recent_trade_days('2018-07-07', n=-2) == ['2018-07-06', '2018-07-05']
+    assert utils.get_recent_trade_days('2018-07-01', n=1) == ['2018-07-02']
+
+    assert utils.get_prev_trade_day('2018-07-04') == '2018-07-03'
+    assert utils.get_prev_trade_day('2018-07-07', k=2) == '2018-07-05'
+    assert utils.get_next_trade_day('2018-07-01') == '2018-07-02'
+    assert utils.get_next_trade_day('2018-07-06') is None
+    assert utils.get_prev_trade_day('2018-07-02') is None
+
+    assert utils.get_trade_days_between('2018-07-01', '2018-07-03') == ['2018-07-02', '2018-07-03']
+    assert index.count_between('2018-07-03', '2018-07-08') == 4
+    assert index.count_between('2018-07-08', '2018-07-03') == 0
+
+
+def test_day_index_rebuilt_with_calendar(calendar, monkeypatch):
+    assert '2018-07-09' not in calendar.day_index
+    data = pd.DataFrame({'calendarDate': ['2018-07-06', '2018-07-07', '2018-07-09'],
+                         'isOpen': [1, 0, 1]})
+    monkeypatch.setattr(calendar, '_data', data)
+    monkeypatch.setattr(calendar, '_index', None)
+    assert calendar.day_index.days.tolist() == ['2018-07-06', '2018-07-09']
+    # DataFrame 的属性仍然可以直接访问
+    assert calendar.index.tolist() == [0, 1, 2]
+
+
+def test_trade_day_index_dedupes_and_sorts():
+    index = TradeDayIndex(['2018-07-03', date(2018, 7, 2), '2018-07-03 00:00:00'])
+    assert index.days.tolist() == ['2018-07-02', '2018-07-03']
+
+
+# 交易时段
+# --------------------------------------------------------------------
+
+def _at(hms, day='2018-07-03'):
+    return datetime.strptime(day + ' ' + hms, '%Y-%m-%d %H:%M:%S.%f' if '.' in hms
+                             else '%Y-%m-%d %H:%M:%S')
+
+
+BOUNDARIES = [
+    ('09:14:59', 'closed'),
+    ('09:15:00', 'open_auction'),
+    ('09:24:59.999', 'open_auction'),
+    ('09:25:00', 'open_auction'),
+    ('09:25:00.001', 'pre_open'),
+    ('09:30:00', 'morning'),
+    ('11:29:59', 'morning'),
+    ('11:30:00', 'noon_break'),
+    ('13:00:00', 'afternoon'),
+    ('14:56:59', 'afternoon'),
+    ('14:57:00', 'close_auction'),
+    ('15:00:00', 'close_auction'),
+    ('15:00:00.001', 'closed'),
+]
+
+
+def test_phase_boundaries(calendar):
+    clock = utils.TradingSessionClock(calendar)
+    for hms, phase in BOUNDARIES:
+        assert clock.phase(_at(hms)) == phase, hms
+    assert clock.phase(_at('10:00:00', day='2018-07-07')) == 'closed'
+
+
+def test_label_matches_phase(calendar):
+    clock = utils.TradingSessionClock(calendar)
+    stamps = [_at(hms) for hms, _ in BOUNDARIES] + [_at('10:00:00', day='2018-07-07')]
+    names = [utils.TradingSessionClock.PHASES[c] for c in clock.label(pd.Series(stamps))]
+    assert names == [phase for _, phase in BOUNDARIES] + ['closed']
+
+
+def test_in_session_inclusive(calendar):
+    clock = utils.TradingSessionClock(calendar)
+    assert clock.in_session(_at('09:30:00'))
+    assert not clock.in_session(_at('11:30:00'))
+    assert clock.in_session(_at('11:30:00'), inclusive=True)
+    assert not clock.in_session(_at('11:30:01'), inclusive=True)
+    assert clock.in_session(_at('15:00:00'))
+    assert not clock.in_session(_at('09:25:00'), inclusive=True)
+
+
+def test_seconds_to_open_and_close(calendar):
+    clock = utils.TradingSessionClock(calendar)
+    assert clock.seconds_to_open(_at('09:00:00')) == 30 * 60
+    assert clock.seconds_to_open(_at('12:00:00')) == 3600
+    assert clock.seconds_to_open(_at('10:00:00')) == 0
+    assert clock.seconds_to_close(_at('10:00:00')) == 90 * 60
+    # 收盘后，距离下一个交易日开盘
+    assert clock.seconds_to_open(_at('16:00:00', day='2018-07-05')) == 17.5 * 3600
@@ -0,0 +1,123 @@
+# -*- coding: UTF-8 -*-
+import os
+import json
+import math
+import asyncio
+from urllib.parse import urlsplit, parse_qs
+
+import pytest
+import requests
+
+import tma
+from tma.collector import xueqiu
+from tma.collector.xueqiu import XueqiuCommentCrawler, iter_comments, _done_ids
+
+USER = dict(id=1, city='', description='', followers_count=0, friends_count=0,
+            gender='m', screen_name='u', province='', status_count=0)
+
+
+def _comment(i, replies=0):
+    return dict(text='<p>评论%i</p>' % i, id=i, timeBefore='', reply_count=replies,
+                source='web', user=USER)
+
+
+def _sub(i):
+    return dict(created_at=0, created_ip='', text='回复%i' % i, source='web', user=USER)
+
+
+class FakeXueqiu(object):
+    """按时间倒序分页的评论接口，每页 size 条"""
+
+    def __init__(self, n, size=2, failed_pages=(), failed_subs=()):
+        self.comments = [_comment(i, replies=1) for i in range(n, 0, -1)]
+        self.size = size
+        self.failed_pages = set(failed_pages)
+        self.failed_subs = set(failed_subs)
+
+    def publish(self, i):
+        self.comments.insert(0, _comment(i))
+
+    def get_json(self, url):
+        query = parse_qs(urlsplit(url).query)
+        if url.startswith(xueqiu.SUB_COMMENT_URL.split('?')[0]):
+            i = int(query['id'][0])
+            if i in self.failed_subs:
+                raise requests.HTTPError("500 %s" % url)
+            return {'comments': [_sub(i)]}
+        page = int(query['page'][0])
+        if page in self.failed_pages:
+            raise requests.HTTPError("500 %s" % url)
+        start = (page - 1) * self.size
+        return {'list': self.comments[start:start + self.size],
+                'maxPage': int(math.ceil(len(self.comments) / self.size)),
+                'count': len(self.comments)}
+
+
+def _crawler(fake):
+    crawler = XueqiuCommentCrawler(rate=1000, retries=1)
+    crawler.get_json = fake.get_json
+    return crawler
+
+
+def test_resume_dedupes_by_comment_id(tmp_path):
+    path = str(tmp_path / "comments.jsonl")
+    fake = FakeXueqiu(6)
+    summary = _crawler(fake).crawl('600122', path=path, max_pages=1)
+    assert summary['written'] == 2
+
+    # 新评论使每一页的内容后移一条；按页码跳过会漏掉评论7并重复写入评论5
+    fake.publish(7)
+    summary = _crawler(fake).crawl('600122', path=path)
+    assert summary['written'] == 5
+    ids = [c['id'] for c in iter_comments(path)]
+    assert sorted(ids) == list(range(1, 8))
+
+
+def test_done_ids_tolerates_bad_lines(tmp_path):
+    path = str(tmp_path / "comments.jsonl")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'id': 1}) + "\n")
+        f.write(json.dumps({'page': 1}) + "\n")
+        f.write('{"id": 3')
+    assert _done_ids(path) == {1}
+    assert os.path.getsize(path) == len(json.dumps({'id': 1}) + "\n")
+
+
+def test_get_comments_reports_failed_pages(monkeypatch, tmp_path):
+    fake = FakeXueqiu(6, failed_pages=[2])
+    monkeypatch.setattr(tma, 'DATA_PATH', str(tmp_path))
+    monkeypatch.setattr(xueqiu, 'XueqiuCommentCrawler',
+                        lambda rate: _crawler(fake))
+    res = xueqiu.get_comments('600122')
+    assert res['failed'] == [2]
+    assert [c['id'] for c in res['comment_list']] == [6, 5, 2, 1]
+    assert os.listdir(os.path.join(str(tmp_path), 'xueqiu')) == []
+
+
+def test_get_comments_removes_tmp_file_on_error(monkeypatch, tmp_path):
+    class Broken(XueqiuCommentCrawler):
+        def crawl(self, code, path=None, **kwargs):
+            with open(path, 'w') as f:
+                f.write("{}\n")
+            raise RuntimeError("interrupted")
+
+    monkeypatch.setattr(tma, 'DATA_PATH', str(tmp_path))
+    monkeypatch.setattr(xueqiu, 'XueqiuCommentCrawler', Broken)
+    with pytest.raises(RuntimeError):
+        xueqiu.get_comments('600122')
+    assert os.listdir(os.path.join(str(tmp_path), 'xueqiu')) == []
+
+
+def test_async_keeps_pages_when_sub_comments_fail():
+    fake = FakeXueqiu(4, failed_pages=[2], failed_subs=[4])
+
+    class Client(object):
+        async def get_text(self, url):
+            return ''
+
+        async def get_json(self, url):
+            return fake.get_json(url)
+
+    res = asyncio.run(xueqiu._fetch_comments(Client(), '600122'))
+    assert res['failed'] == [2]
+    assert [(c['id'], len(c['sub_comments'])) for c in res['comment_list']] == [(4, 0), (3, 1)]
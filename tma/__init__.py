@@ -32,24 +32,59 @@ PATH, DATA_PATH, ACCOUNT_PATH, POOL_PATH = set_path()
 # --------------------------------------------------------------------
 DEBUG = False
 
-# 全局日志记录器
-from zb.utils import create_logger
-
-log_file = os.path.join(PATH, "tma.log")
-logger = create_logger(log_file, name='tma', cmd=True)
+# 本地缓存的存储格式，可选值 'auto'、'csv'、'parquet'、'feather'，
+# 参考 `tma.storage.get_storage`
+STORAGE = "auto"
 
 # API - 列表
 # --------------------------------------------------------------------
-from tma.pool import StockPool
-from tma.account import Account
-from tma.rules import RULES
-from tma import selector
-from tma import monitor
-from tma import analyst
-from tma import indicator
-from tma.utils import Calendar
-from tma.utils import (trade_calendar, is_in_trade_time,
-                       is_trade_day, get_recent_trade_days)
+# `import tma` 只做路径配置，不触发任何网络请求；子模块和下列接口在首次
+# 访问时才会导入（PEP 562），以减少冷启动时间。
+
+_SUBMODULES = ('account', 'analyst', 'collector', 'indicator', 'monitor',
+               'pool', 'rules', 'selector', 'sms', 'storage', 'utils')
+
+_LAZY_API = {
+    "StockPool": "tma.pool",
+    "Account": "tma.account",
+    "MatchingEngine": "tma.account",
+    "RULES": "tma.rules",
+    "Calendar": "tma.utils",
+    "trade_calendar": "tma.utils",
+    "is_in_trade_time": "tma.utils",
+    "trade_clock": "tma.utils",
+    "is_trade_day": "tma.utils",
+    "get_recent_trade_days": "tma.utils",
+    "get_prev_trade_day": "tma.utils",
+    "get_next_trade_day": "tma.utils",
+    "get_trade_days_between": "tma.utils",
+}
+
+
+def _create_logger():
+    """全局日志记录器"""
+    from zb.utils import create_logger
+    log_file = os.path.join(PATH, "tma.log")
+    return create_logger(log_file, name='tma', cmd=True)
+
+
+def __getattr__(name):
+    import importlib
+    if name == "logger":
+        value = _create_logger()
+    elif name in _SUBMODULES:
+        value = importlib.import_module("tma." + name)
+    elif name in _LAZY_API:
+        value = getattr(importlib.import_module(_LAZY_API[name]), name)
+    else:
+        raise AttributeError("module 'tma' has no attribute '%s'" % name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBMODULES) | set(_LAZY_API) | {"logger"})
+
 
 # module介绍
 # --------------------------------------------------------------------
@@ -6,64 +6,780 @@ Account - 虚拟账户，用于仿真交易
 仿真交易分为两种模式：
 1）strict - 严格模式，只能在正常交易时间段进行虚拟交易，参照真实交易规则；
 2）loose - 宽松模式，不进行任何限制，允许任意添加交易记录
+
+账户由两个文件组成：
+    account_{name}.meta.json - 账户信息（名称、初始资金、模式、创建日期）
+    account_{name}.csv       - 成交记录，只追加写入，每行一笔成交
+持仓、成本、盈亏都由成交记录一次计算得到，不单独保存。
 ====================================================================
 """
 
 import os
 from datetime import datetime
+from collections import OrderedDict
 import json
+import numpy as np
+import pandas as pd
 
 from tma import ACCOUNT_PATH
-from tma.collector import get_price
+from tma.collector import get_price, get_quotes
+from tma.utils import trade_clock, TradingSessionClock, get_limit_rates, get_limit_prices
+
+FILL_COLUMNS = ['seq', 'dt', 'code', 'side', 'amount', 'price', 'fee']
+FILL_DTYPES = {'seq': np.int64, 'dt': str, 'code': str, 'side': str,
+               'amount': np.int64, 'price': np.float64, 'fee': np.float64}
+BUY, SELL = "BUY", "SELL"
+
+
+def _now():
+    return datetime.now().__str__().split(".")[0]
+
+
+def _seg_cumsum(x, start):
+    """分段累加：start为True的位置开始新的一段"""
+    cs = np.cumsum(x)
+    seg = np.cumsum(start) - 1
+    offset = (cs - x)[start]
+    return cs - offset[seg]
+
+
+# 交易费用：佣金（双向，有最低收费）、印花税（卖出）、过户费（沪市，双向）
+FEES = OrderedDict(
+    commission=0.00025,
+    min_commission=5.0,
+    stamp_tax=0.001,
+    transfer=0.00002,
+)
+
+# 严格模式下允许下单、撮合的时段：开盘集合竞价、连续竞价、收盘集合竞价
+SUBMIT_PHASES = (TradingSessionClock.OPEN_AUCTION,) + TradingSessionClock.IN_SESSION
+
+LOT_SIZE = 100
+
+
+def calc_fees(sides, codes, amounts, prices, fees=None):
+    """批量计算交易费用（四舍五入到分）
+
+    :param sides: array-like
+        BUY / SELL
+    :param codes: array-like
+        股票代码，用于区分沪市、深市
+    :param amounts: array-like
+    :param prices: array-like
+    :param fees: dict 默认值 FEES
+    :return: np.ndarray of float64
+    """
+    fees = dict(FEES, **(fees or {}))
+    value = np.asarray(amounts, dtype=np.float64) * np.asarray(prices, dtype=np.float64)
+    sell = np.asarray(sides, dtype=object) == SELL
+    sh = np.char.startswith(np.asarray(codes).astype(str), '6')
+    total = np.maximum(value * fees['commission'], fees['min_commission'])
+    total += np.where(sell, value * fees['stamp_tax'], 0.0)
+    total += np.where(sh, value * fees['transfer'], 0.0)
+    return np.round(total, 2)
+
+
+def check_order(side, amount, sellable=0, held=0, lot=LOT_SIZE):
+    """按交易规则检查订单，返回错误信息，通过检查时返回None
+
+    买入数量必须是 lot 的整数倍；卖出数量必须是 lot 的整数倍（一次卖出
+    全部零股的除外），且不能超过可卖数量（T+1）。
+    """
+    if amount <= 0:
+        return "委托数量必须大于0"
+    if side == BUY:
+        if amount % lot:
+            return "买入数量必须是%i股的整数倍" % lot
+    elif side == SELL:
+        if amount > sellable:
+            return "可卖数量为%i，不能卖出%i（T+1）" % (sellable, amount)
+        if amount % lot and amount != held:
+            return "卖出数量必须是%i股的整数倍，或者一次卖出全部零股" % lot
+    else:
+        return "side 的可选值为 BUY、SELL"
+    return None
 
 
 class Order(object):
-    """订单对象"""
-    pass
+    """订单对象
+
+    :param account: :class: `Account`
+    :param code: str
+    :param side: str
+        BUY / SELL
+    :param amount: int
+        委托数量（单位：股）
+    :param price: float 默认值 None
+        限价，None表示市价
+    :param dt: str
+        下单时间
+
+    订单状态 status：PENDING - 待撮合；FILLED - 已成交；REJECTED - 不符合
+    交易规则或资金、持仓不足；UNFILLED - 行情数据结束时仍未成交。
+    成交后 fill_dt、fill_price、fee 记录成交信息，reason 记录拒绝或未成交的原因。
+    """
+    PENDING, FILLED, REJECTED, UNFILLED = "PENDING", "FILLED", "REJECTED", "UNFILLED"
+
+    def __init__(self, account, code, side, amount, price=None, dt=None):
+        self.account = account
+        self.code = str(code)
+        self.side = side
+        self.amount = int(amount)
+        self.price = price
+        self.dt = dt or _now()
+        self.status = self.PENDING
+        self.fill_dt = None
+        self.fill_price = None
+        self.fee = None
+        self.reason = None
+
+    def _finish(self, status, reason=None):
+        self.status = status
+        self.reason = reason
+
+    def __repr__(self):
+        return "<Order %s %s %s %i@%s %s>" % (self.account.name, self.side, self.code,
+                                             self.amount, self.price or "MKT", self.status)
 
 
 class Account:
-    def __init__(self, name, fund=-1, mode="strict"):
+    """虚拟账户
+
+    :param name: str
+        账户名称
+    :param fund: float 默认值 -1
+        初始资金，-1表示不限制资金大小
+    :param mode: str 默认值 strict
+        仿真交易模式，可选值 strict、loose
+    :param path: str 默认值 `tma.ACCOUNT_PATH`
+        账户文件所在目录
+
+    使用方法：
+        account = Account("test", fund=100000)
+        account.buy("600122", 1000, price=5.3)
+        account.sell("600122", 500, price=5.6)
+        account.positions()      # 持仓、成本、已实现/未实现盈亏
+        account.summary()        # 资金、市值、权益
+        account.equity_curve()   # 基于日K线面板的每日权益
+    """
+
+    def __init__(self, name, fund=-1, mode="strict", path=None):
         self.name = name
         self.mode = mode
         self.fund = fund
-        self.path = os.path.join(ACCOUNT_PATH, "account_%s.json" % self.name)
+        if path is None:
+            path = ACCOUNT_PATH
+        self.path = os.path.join(path, "account_%s.json" % self.name)
+        self.path_meta = os.path.join(path, "account_%s.meta.json" % self.name)
+        self.path_ledger = os.path.join(path, "account_%s.csv" % self.name)
+        self._fills = pd.DataFrame({c: pd.Series(dtype=t) for c, t in FILL_DTYPES.items()},
+                                   columns=FILL_COLUMNS)
+        self._new = []
+        self._cache = None
         self._read_info()
 
+    # 账户信息与成交记录
+    # --------------------------------------------------------------------
     def _read_info(self):
-        if os.path.exists(self.path):
-            self.info = json.load(open(self.path, 'r'))
+        if os.path.exists(self.path_meta):
+            with open(self.path_meta, 'r', encoding='utf-8') as f:
+                self.info = json.load(f)
+            self.fund = self.info['fund']
+            self.mode = self.info.get('mode', self.mode)
+            if os.path.exists(self.path_ledger):
+                self._fills = pd.read_csv(self.path_ledger, dtype=FILL_DTYPES,
+                                          keep_default_na=False)
+        elif os.path.exists(self.path):
+            self._migrate()
         else:
             self.info = {
                 "name": self.name,
-                "path": self.path,
                 "fund": self.fund,  # 把fund设置为-1表示不限制资金大小
-                "trades": {},
+                "mode": self.mode,
                 "create_date": datetime.now().date().__str__(),
             }
+            self._save_info()
 
     def _save_info(self):
-        json.dump(self.info, open(self.path, 'w'), indent=2)
+        tmp = self.path_meta + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.info, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, self.path_meta)
+
+    def _migrate(self):
+        """旧版本的账户文件（account_{name}.json）转换为成交记录"""
+        with open(self.path, 'r') as f:
+            old = json.load(f)
+        self.fund = old.get('fund', self.fund)
+        self.info = {
+            "name": self.name,
+            "fund": self.fund,
+            "mode": self.mode,
+            "create_date": old.get('create_date', datetime.now().date().__str__()),
+        }
+        records = [r for trades in old.get('trades', {}).values() for r in trades]
+        records.sort(key=lambda r: r['date'])
+        self._save_info()
+        self.record([(r['date'], r['code'], r.get('kind', BUY), r['amount'],
+                      r['price'], 0) for r in records])
+
+    def record(self, fills):
+        """追加成交记录，不做任何检查
+
+        :param fills: list
+            元素为 (dt, code, side, amount, price, fee)
+        :return: None
+        """
+        if not fills:
+            return
+        seq = len(self._fills) + len(self._new)
+        rows = [(seq + i, str(dt), str(code), side, int(amount), float(price),
+                 float(fee)) for i, (dt, code, side, amount, price, fee) in enumerate(fills)]
+        header = not os.path.exists(self.path_ledger)
+        with open(self.path_ledger, 'a', encoding='utf-8') as f:
+            if header:
+                f.write(",".join(FILL_COLUMNS) + "\n")
+            f.writelines("%i,%s,%s,%s,%i,%r,%r\n" % row for row in rows)
+        self._new.extend(rows)
+        self._cache = None
+
+    @property
+    def fills(self):
+        """全部成交记录，:class: `pd.DataFrame`"""
+        if self._new:
+            new = pd.DataFrame({
+                c: np.array(v, dtype=object if FILL_DTYPES[c] is str else FILL_DTYPES[c])
+                for c, v in zip(FILL_COLUMNS, zip(*self._new))
+            })
+            self._fills = new if len(self._fills) == 0 else \
+                pd.concat([self._fills, new], ignore_index=True)
+            self._new = []
+        return self._fills
+
+    # 交易
+    # --------------------------------------------------------------------
+    def buy(self, code, amount, price=None, dt=None, fee=None):
+        """买入
 
-    def buy(self, code, amount, price=None):
+        严格模式下检查交易时间和交易单位，并按 FEES 计算交易费用；
+        需要考虑涨跌停的成交请使用 `MatchingEngine`。
+
+        :param code: str
+            股票代码
+        :param amount: int
+            买入数量（单位：股）
+        :param price: float 默认值 None
+            成交价格，默认为最新价格
+        :param dt: str 默认值 datetime.now()
+            成交时间
+        :param fee: float 默认值 None
+            交易费用；严格模式下默认按 FEES 计算，宽松模式下默认为0
+        """
+        self._trade(code, BUY, amount, price, dt, fee)
+
+    def sell(self, code, amount, price=None, dt=None, fee=None):
+        """卖出，参数同 `buy`；卖出数量不能超过持仓数量，严格模式下不能超过可卖数量（T+1）"""
+        self._trade(code, SELL, amount, price, dt, fee)
+
+    def _trade(self, code, side, amount, price, dt, fee):
+        dt = dt or _now()
+        held = self.position(code) if side == SELL else 0
+        if side == SELL and amount > held:
+            raise ValueError("%s 的持仓数量为 %i，不能卖出 %i" % (code, held, amount))
+        if self.mode == "strict":
+            if trade_clock.label([dt])[0] not in SUBMIT_PHASES:
+                raise ValueError("%s 不在交易时间内" % dt)
+            sellable = self.sellable(code, dt[:10]) if side == SELL else 0
+            error = check_order(side, amount, sellable, held)
+            if error:
+                raise ValueError("%s：%s" % (code, error))
         if not price:
             price = get_price(code)
-        record = {
-            "code": code,
-            "amount": amount,
-            "price": price,
-            "date": datetime.now().date().__str__(),
-            "kind": "BUY"
+        if fee is None:
+            fee = calc_fees([side], [code], [amount], [price])[0] \
+                if self.mode == "strict" else 0
+        self.record([(dt, code, side, amount, price, fee)])
+
+    def order(self, code, side, amount, price=None, dt=None):
+        """创建订单，由 `MatchingEngine` 撮合成交
+
+        :param side: str
+            BUY / SELL
+        :param price: float 默认值 None
+            限价，None表示市价
+        :param dt: str 默认值 datetime.now()
+            下单时间
+        :return: :class: `Order`
+        """
+        return Order(self, code, side, amount, price, dt or _now())
+
+    def sellable(self, code, date):
+        """code在date日期的可卖数量：date之前买入的持仓，减去date当天已经卖出的数量"""
+        return self.holdings(date).get(code, (0, 0))[1]
+
+    def holdings(self, date):
+        """所有股票的持仓数量和date日期的可卖数量
+
+        :return: dict
+            {股票代码: (持仓数量, 可卖数量)}
+        """
+        f = self.fills
+        if len(f) == 0:
+            return {}
+        cid, codes = pd.factorize(f['code'].to_numpy(dtype=object))
+        day = f['dt'].to_numpy(dtype='U10')
+        amount = f['amount'].to_numpy(dtype=np.float64)
+        buy = (f['side'] == BUY).to_numpy()
+        qty = np.where(buy, amount, -amount)
+        n = len(codes)
+        held = np.bincount(cid, qty, minlength=n)
+        sellable = np.bincount(cid, np.where(day < date, qty, 0.0), minlength=n) - \
+            np.bincount(cid, np.where((day == date) & ~buy, amount, 0.0), minlength=n)
+        return {c: (int(h), int(v)) for c, h, v in zip(codes, held, sellable)}
+
+    def cash(self):
+        """可用资金；fund为-1（不限制资金）时返回 inf"""
+        if self.fund == -1:
+            return np.inf
+        f = self.fills
+        if len(f) == 0:
+            return float(self.fund)
+        value = f['amount'].to_numpy(dtype=np.float64) * f['price'].to_numpy()
+        flow = np.where(f['side'].to_numpy(dtype=object) == BUY, -value, value) - \
+            f['fee'].to_numpy()
+        return float(self.fund + flow.sum())
+
+    # 持仓与盈亏
+    # --------------------------------------------------------------------
+    def _ledger(self):
+        """按股票、成交顺序排列的成交明细，以及每笔成交后的持仓、持仓成本、已实现盈亏
+
+        采用移动加权平均成本：买入时成本增加 成交金额+费用；卖出时成本按
+        卖出数量占持仓的比例减少，即 C_t = a_t * C_{t-1} + b_t，其中
+        买入 a=1、b=成交金额+费用，卖出 a=卖出后持仓/卖出前持仓、b=0。
+        持仓归零时成本归零并开始新的一段，段内用累乘和累加一次算出所有 C_t。
+        """
+        if self._cache is not None:
+            return self._cache
+        fills = self.fills
+        cid, codes = pd.factorize(fills['code'].to_numpy(dtype=object), sort=True)
+        # 成交记录本身按 seq 排列，稳定排序后同一股票内仍按成交顺序排列
+        order = np.argsort(cid, kind='stable')
+        cid = cid[order]
+        buy = (fills['side'].to_numpy(dtype=object) == BUY)[order]
+        amount = fills['amount'].to_numpy(dtype=np.float64)[order]
+        price = fills['price'].to_numpy()[order]
+        fee = fills['fee'].to_numpy()[order]
+        n = len(cid)
+
+        first = np.ones(n, dtype=bool)
+        first[1:] = cid[1:] != cid[:-1]
+        qty = np.where(buy, amount, -amount)
+        pos = _seg_cumsum(qty, first)
+        pos_prev = pos - qty
+
+        start = first | (pos_prev <= 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a = np.where(buy, 1.0, pos / pos_prev)
+        flat = a <= 0
+        log_a = _seg_cumsum(np.log(np.where(flat, 1.0, a)), start)
+        b = np.where(buy, amount * price + fee, 0.0)
+        if n == 0 or log_a.min() > -700:
+            cost = np.exp(log_a) * _seg_cumsum(b * np.exp(-log_a), start)
+        else:
+            # 段内成本的缩放倍数超出浮点数的范围，逐笔计算
+            cost = np.empty(n)
+            for i in range(n):
+                prev = 0.0 if start[i] else cost[i - 1]
+                cost[i] = prev * a[i] + b[i]
+        cost[flat] = 0.0
+        cost_prev = np.concatenate(([0.0], cost[:-1]))
+        cost_prev[first] = 0.0
+        realized = np.where(buy, 0.0, amount * price - fee - (cost_prev - cost))
+
+        self._cache = {
+            "codes": np.asarray(codes, dtype=object), "cid": cid, "order": order,
+            "position": pos, "cost": cost, "realized": realized, "fee": fee,
         }
-        if code not in self.info['trades'].keys():
-            self.info['trades'][code] = []
-        self.info['trades'][code].append(record)
-        self._save_info()
+        return self._cache
+
+    def ledger(self):
+        """成交明细，按股票、成交顺序排列，增加每笔成交后的 position（持仓）、
+        cost（持仓成本）和 realized（该笔成交的已实现盈亏）字段"""
+        led = self._ledger()
+        f = self.fills.iloc[led['order']].reset_index(drop=True)
+        f['position'] = led['position'].astype(np.int64)
+        f['cost'] = led['cost']
+        f['realized'] = led['realized']
+        return f
+
+    def position(self, code):
+        """code的当前持仓数量"""
+        fills = self.fills
+        f = fills[fills['code'] == code]
+        return int(np.where(f['side'] == BUY, f['amount'], -f['amount']).sum())
+
+    def positions(self, prices=None, all_codes=False):
+        """持仓及盈亏
+
+        :param prices: dict or :class: `pd.Series` 默认值 None
+            {股票代码: 价格}；默认为一次批量请求所有持仓股票的实时行情
+        :param all_codes: bool 默认值 False
+            是否包含已经清仓的股票
+        :return: :class: `pd.DataFrame`
+            index为股票代码，字段 ['amount', 'avg_cost', 'cost', 'realized',
+            'price', 'market_value', 'unrealized', 'fee']
+        """
+        led = self._ledger()
+        codes, cid = led['codes'], led['cid']
+        last = np.ones(len(cid), dtype=bool)
+        last[:-1] = cid[:-1] != cid[1:]
+        amount = led['position'][last].astype(np.int64)
+        cost = led['cost'][last]
+        realized = np.bincount(cid, weights=led['realized'], minlength=len(codes))
+        fee = np.bincount(cid, weights=led['fee'], minlength=len(codes))
+        keep = slice(None) if all_codes else amount > 0
+        codes, amount, cost = codes[keep], amount[keep], cost[keep]
+
+        held = codes[amount > 0].tolist()
+        if prices is None and held:
+            quotes = get_quotes(held)
+            prices = dict(zip(quotes['code'], quotes['price']))
+        prices = pd.Series(prices if prices is not None else {}, dtype=np.float64)
+        price = prices.reindex(codes).to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_cost = np.where(amount > 0, cost / amount, np.nan)
+        market_value = amount * price
+        return pd.DataFrame({
+            'amount': amount, 'avg_cost': avg_cost, 'cost': cost,
+            'realized': realized[keep], 'price': price,
+            'market_value': market_value, 'unrealized': market_value - cost,
+            'fee': fee[keep],
+        }, index=pd.Index(codes, name='code'))
+
+    def summary(self, prices=None):
+        """账户概况：现金、持仓市值、权益、已实现/未实现盈亏、费用
+
+        fund为-1（不限制资金）时，现金从0开始计算，可能为负数
+        """
+        f = self.fills
+        amount = f['amount'].to_numpy(dtype=np.float64) * f['price'].to_numpy()
+        flow = np.where(f['side'] == BUY, -amount, amount) - f['fee'].to_numpy()
+        cash = max(self.fund, 0) + flow.sum()
+        pos = self.positions(prices, all_codes=True)
+        market_value = pos['market_value'].sum()
+        return {
+            "fund": self.fund,
+            "cash": round(float(cash), 4),
+            "market_value": round(float(market_value), 4),
+            "equity": round(float(cash + market_value), 4),
+            "realized": round(float(pos['realized'].sum()), 4),
+            "unrealized": round(float(pos['unrealized'].sum()), 4),
+            "fee": round(float(pos['fee'].sum()), 4),
+        }
+
+    def equity_curve(self, panel=None, start_date=None, end_date=None):
+        """每日收盘后的账户权益
+
+        :param panel: :class: `tma.collector.OHLCVPanel` 默认值 OHLCVPanel.load("D")
+            日K线面板，停牌日使用之前最近的收盘价
+        :param start_date: str 默认值 None
+            开始日期，默认为第一笔成交的日期
+        :param end_date: str 默认值 None
+        :return: :class: `pd.DataFrame`
+            index为日期，字段 ['cash', 'market_value', 'equity']
+        """
+        if panel is None:
+            from tma.collector import OHLCVPanel
+            panel = OHLCVPanel.load("D")
+        f = self.fills
+        if len(f) == 0:
+            return pd.DataFrame(columns=['cash', 'market_value', 'equity'])
+        if start_date is None:
+            start_date = f['dt'].min()[:10]
+        rows = panel.date_slice(start_date, end_date)
+        dates = panel.dates[rows]
+
+        # 每笔成交计入成交日（非交易日计入下一个交易日）的收盘后
+        codes, col = np.unique(f['code'].to_numpy(), return_inverse=True)
+        day = np.searchsorted(dates, np.asarray(f['dt'], dtype='U10'), side='left')
+        day = np.clip(day, 0, len(dates))
+        amount = f['amount'].to_numpy(dtype=np.float64)
+        qty = np.where(f['side'] == BUY, amount, -amount)
+        value = amount * f['price'].to_numpy()
+        flow = np.where(f['side'] == BUY, -value, value) - f['fee'].to_numpy()
+
+        pos = np.zeros((len(dates) + 1, len(codes)))
+        np.add.at(pos, (day, col), qty)
+        pos = np.cumsum(pos, axis=0)[:len(dates)]
+        cash = np.zeros(len(dates) + 1)
+        np.add.at(cash, day, flow)
+        cash = max(self.fund, 0) + np.cumsum(cash)[:len(dates)]
+
+        cols = pd.Index(panel.codes).get_indexer(codes)
+        close = np.full((len(dates), len(codes)), np.nan)
+        ok = cols >= 0
+        close[:, ok] = panel.close[rows][:, cols[ok]]
+        close = pd.DataFrame(close).ffill().to_numpy()
+        market_value = np.nansum(pos * np.nan_to_num(close), axis=1)
+        return pd.DataFrame({'cash': cash, 'market_value': market_value,
+                             'equity': cash + market_value},
+                            index=pd.Index(dates, name='date'))
+
+
+class MatchingEngine(object):
+    """模拟撮合引擎
+
+    用分笔数据（`tma.collector.ts.get_ticks`）或K线撮合多个账户的订单：
+    每个订单与其下单时间之后的行情逐一比较，买单在价格不高于限价、且未
+    封死涨停的第一笔行情成交，卖单在价格不低于限价、且未封死跌停的第一笔
+    行情成交；K线按 开盘价 -> 限价 的顺序确定成交价格。所有订单的候选成交
+    按时间排序后在一个事件循环中依次处理，检查资金、T+1可卖数量和交易单位，
+    成交记录按账户批量写入。
+
+    严格模式（Account.mode == "strict"）的账户还需满足：下单时间处于
+    SUBMIT_PHASES 中的时段，交易数量为 LOT_SIZE 的整数倍，卖出不超过
+    可卖数量（T+1）。分笔数据只使用连续竞价时段，以及开盘、收盘集合竞价
+    的撮合时刻（09:25:00、15:00:00）的成交；开盘集合竞价期间的虚拟
+    成交价不参与撮合。
+
+    :param clock: :class: `tma.utils.TradingSessionClock` 默认值 trade_clock
+    :param fees: dict 默认值 None
+        交易费用参数，会覆盖 FEES 中的同名项
+    :param lot: int 默认值 100
+        交易单位
+    :param panel: :class: `tma.collector.OHLCVPanel` 默认值 None
+        日K线面板，用于在 load_ticks 时确定昨收价（涨跌停价格）
+
+    使用方法：
+        engine = MatchingEngine()
+        engine.load_ticks(['600122', '000001'], date='2018-07-02')
+        engine.submit([
+            account_a.order('600122', BUY, 1000, price=5.3, dt='2018-07-02 10:00:00'),
+            account_b.order('000001', SELL, 500, dt='2018-07-02 13:05:00'),
+        ])
+        orders = engine.run()
+        engine.report(orders)
+    """
+
+    def __init__(self, clock=None, fees=None, lot=LOT_SIZE, panel=None):
+        self.clock = clock if clock is not None else trade_clock
+        self.fees = fees
+        self.lot = lot
+        self.panel = panel
+        self.market = {}
+        self.orders = []
+
+    # 行情
+    # --------------------------------------------------------------------
+    def _add(self, code, time, open_, high, low, up, down):
+        """添加code的行情事件，time为 datetime64[us] 对应的 int64"""
+        data = dict(time=time, open=open_, high=high, low=low,
+                    up=np.where(np.isnan(up), np.inf, up),
+                    down=np.where(np.isnan(down), -np.inf, down))
+        old = self.market.get(code)
+        if old is not None:
+            data = {k: np.concatenate([old[k], v]) for k, v in data.items()}
+        order = np.argsort(data['time'], kind='stable')
+        self.market[code] = {k: v[order] for k, v in data.items()}
+
+    def add_ticks(self, code, ticks, pre_close=None, name=None):
+        """添加分笔数据
+
+        :param ticks: :class: `pd.DataFrame`
+            至少包含 datetime、price 字段，如 `get_ticks` 的返回值
+        :param pre_close: float 默认值 None
+            昨收价，用于计算涨跌停价格；为None时不检查涨跌停
+        :param name: str 默认值 None
+            股票名称，用于识别ST股的涨跌幅限制
+        """
+        time = np.asarray(ticks['datetime'], dtype='datetime64[us]')
+        price = np.asarray(ticks['price'], dtype=np.float64)
+        phases = self.clock.label(time)
+        sec = (time - time.astype('datetime64[D]')).astype(np.int64)
+        auction = (phases == TradingSessionClock.OPEN_AUCTION) & \
+            (sec != TradingSessionClock.OPEN_MATCH * 1000000)
+        keep = np.isin(phases, SUBMIT_PHASES) & ~auction & (price > 0)
+        time, price = time[keep].astype(np.int64), price[keep]
+        up, down = get_limit_prices([np.nan if pre_close is None else pre_close],
+                                    get_limit_rates([code], None if name is None else [name]))
+        n = len(time)
+        self._add(code, time, price, price, price,
+                  np.full(n, up[0]), np.full(n, down[0]))
+
+    def load_ticks(self, codes, date, pre_close=None, source="spider"):
+        """通过 `get_ticks` 获取并添加多只股票date日期的分笔数据
+
+        :param pre_close: dict 默认值 None
+            {股票代码: 昨收价}；为None时从 panel 中读取前一个交易日的收盘价
+        """
+        from tma.collector.ts import get_ticks
+        if isinstance(codes, str):
+            codes = [codes]
+        pre_close = dict(pre_close or {})
+        if self.panel is not None:
+            row = int(np.searchsorted(self.panel.dates, date, side='left')) - 1
+            for code in codes:
+                col = self.panel.code_index.get(code)
+                if code not in pre_close and row >= 0 and col is not None:
+                    pre_close[code] = float(self.panel.close[row, col])
+        for code in codes:
+            self.add_ticks(code, get_ticks(code, source=source, date=date),
+                           pre_close.get(code))
+
+    def add_bars(self, bars, names=None):
+        """添加K线
+
+        :param bars: :class: `pd.DataFrame`
+            字段 code、open、high、low、close，以及 datetime（K线开始时间）或
+            date（日K线，开始时间为当日 09:30）；可选 pre_close，缺省时使用
+            同一股票上一根K线的收盘价
+        :param names: dict 默认值 None
+            {股票代码: 股票名称}，用于识别ST股的涨跌幅限制
+        """
+        bars = bars.copy()
+        if 'datetime' in bars.columns:
+            time = np.asarray(bars['datetime'], dtype='datetime64[us]')
+        else:
+            time = np.asarray(bars['date'].astype(str) + "T09:30:00", dtype='datetime64[us]')
+        bars['_time'] = time.astype(np.int64)
+        bars['code'] = bars['code'].astype(str)
+        bars = bars.sort_values(['code', '_time'], kind='stable')
+        if 'pre_close' not in bars.columns:
+            bars['pre_close'] = bars.groupby('code')['close'].shift(1)
+        codes = bars['code'].to_numpy(dtype=str)
+        name_arr = None if names is None else [names.get(c, "") for c in codes]
+        up, down = get_limit_prices(bars['pre_close'].to_numpy(dtype=np.float64),
+                                    get_limit_rates(codes, name_arr))
+        bounds = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1], True])
+        cols = [bars[c].to_numpy(dtype=np.float64) for c in ('open', 'high', 'low')]
+        time = bars['_time'].to_numpy()
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            self._add(codes[a], time[a:b], cols[0][a:b], cols[1][a:b], cols[2][a:b],
+                      up[a:b], down[a:b])
+
+    # 撮合
+    # --------------------------------------------------------------------
+    def submit(self, orders):
+        """提交订单，在下一次 run 时撮合"""
+        if isinstance(orders, Order):
+            orders = [orders]
+        self.orders.extend(orders)
+
+    def _match(self, order, t):
+        """order在行情中的第一笔可成交事件，返回 (时间, 价格)，无法成交时返回None"""
+        ev = self.market.get(order.code)
+        if ev is None:
+            return None
+        s = int(np.searchsorted(ev['time'], t, side='left'))
+        if order.side == BUY:
+            limit = order.price or np.inf
+            low = ev['low'][s:]
+            ok = (low <= limit) & (low < ev['up'][s:] - 1e-6)
+        else:
+            limit = order.price or 0.0
+            high = ev['high'][s:]
+            ok = (high >= limit) & (high > ev['down'][s:] + 1e-6)
+        if not ok.any():
+            return None
+        j = s + int(np.argmax(ok))
+        if order.side == BUY:
+            price = max(min(ev['open'][j], limit), ev['low'][j])
+        else:
+            price = min(max(ev['open'][j], limit), ev['high'][j])
+        return int(ev['time'][j]), float(price)
+
+    def run(self):
+        """撮合所有待撮合的订单
+
+        :return: list
+            本次撮合的订单，status 等字段已更新
+        """
+        orders = [o for o in self.orders if o.status == Order.PENDING]
+        self.orders = []
+        if not orders:
+            return orders
+        times = np.asarray([o.dt for o in orders], dtype='datetime64[us]')
+        phases = self.clock.label(times)
+        times = times.astype(np.int64)
 
-    def sell(self):
-        pass
+        matched = []
+        for i, o in enumerate(orders):
+            strict = o.account.mode == "strict"
+            if strict and phases[i] not in SUBMIT_PHASES:
+                o._finish(Order.REJECTED, "%s 不在交易时间内" % o.dt)
+                continue
+            if strict and o.side == BUY:
+                error = check_order(BUY, o.amount, lot=self.lot)
+                if error:
+                    o._finish(Order.REJECTED, error)
+                    continue
+            res = self._match(o, times[i])
+            if res is None:
+                o._finish(Order.UNFILLED, "没有行情数据、价格未达到限价或涨跌停无法成交")
+                continue
+            matched.append((res[0], i, res[1]))
 
+        # 所有账户的候选成交按时间排序后依次处理
+        matched.sort()
+        fees = calc_fees([orders[i].side for _, i, _ in matched],
+                         [orders[i].code for _, i, _ in matched],
+                         [orders[i].amount for _, i, _ in matched],
+                         [p for _, _, p in matched], self.fees)
+        cash, holdings, state, fills = {}, {}, {}, OrderedDict()
+        for (t, i, price), fee in zip(matched, fees):
+            o = orders[i]
+            acc = o.account
+            dt = np.datetime_as_string(np.datetime64(t, 'us'), unit='s').replace('T', ' ')
+            day = dt[:10]
+            if id(acc) not in cash:
+                cash[id(acc)] = acc.cash()
+            key = (id(acc), o.code)
+            st = state.get(key)
+            if st is None:
+                # 账户的成交记录在撮合结束后才写入，按首次成交的日期取快照
+                if (id(acc), day) not in holdings:
+                    holdings[(id(acc), day)] = acc.holdings(day)
+                held, sellable = holdings[(id(acc), day)].get(o.code, (0, 0))
+                st = state[key] = {'day': day, 'held': held, 'sellable': sellable}
+            elif st['day'] != day:
+                st['day'], st['sellable'] = day, st['held']
 
+            value = o.amount * price
+            if o.side == BUY:
+                if value + fee > cash[id(acc)]:
+                    o._finish(Order.REJECTED, "资金不足")
+                    continue
+                cash[id(acc)] -= value + fee
+                st['held'] += o.amount
+            else:
+                if acc.mode == "strict":
+                    error = check_order(SELL, o.amount, st['sellable'], st['held'], self.lot)
+                elif o.amount > st['held']:
+                    error = "持仓数量为%i，不能卖出%i" % (st['held'], o.amount)
+                else:
+                    error = None
+                if error:
+                    o._finish(Order.REJECTED, error)
+                    continue
+                cash[id(acc)] += value - fee
+                st['held'] -= o.amount
+                st['sellable'] -= o.amount
 
+            o.fill_dt, o.fill_price, o.fee = dt, price, float(fee)
+            o._finish(Order.FILLED)
+            fills.setdefault(id(acc), (acc, []))[1].append(
+                (dt, o.code, o.side, o.amount, price, float(fee)))
 
+        for acc, rows in fills.values():
+            acc.record(rows)
+        return orders
 
+    @staticmethod
+    def report(orders):
+        """订单列表转换为 :class: `pd.DataFrame`"""
+        columns = ['account', 'code', 'side', 'amount', 'price', 'dt', 'status',
+                   'fill_dt', 'fill_price', 'fee', 'reason']
+        return pd.DataFrame([(o.account.name, o.code, o.side, o.amount, o.price, o.dt,
+                              o.status, o.fill_dt, o.fill_price, o.fee, o.reason)
+                             for o in orders], columns=columns)
@@ -5,6 +5,6 @@ analyst - 数据分析模块
 ====================================================================
 """
 
-from .rank import WeekRank
+from .rank import WeekRank, WeekRankEngine, TfidfDocRank, IdfTable, build_idf
 
 
@@ -4,11 +4,17 @@
 analyst.rank - 一些排序模型
 ====================================================================
 """
+import os
 import re
+import math
+import jieba
 import jieba.analyse
 import string
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
 from tma.collector.aggregation import agg_market_klines
+from tma.collector import KlineStore, OHLCVPanel
 
 
 class BaseRank:
@@ -34,64 +40,306 @@ class BaseRank:
         return self.rank(top=100)
 
 
+class WeekRankEngine(object):
+    """全市场周排序引擎
+
+    基于周K线面板（`OHLCVPanel('W')`），一次算出所有股票、所有周的
+    周涨幅、周振幅和排序准则，并保存每一周的排序结果：
+
+        order[w, i] - 第w周排名第i+1的股票在面板中的列号
+        ranks[w, c] - 第w周股票c的名次（从1开始，当周没有K线为0）
+
+    任意一周的前N名、任意一只股票的历史名次都是直接的数组索引。
+    排序结果与面板保存在同一目录（rank_order.npy、rank.npy），面板重建后
+    自动重新计算。
+
+    排序准则：周涨幅 * 0.5 + 周振幅 * 0.5
+
+    :param panel: :class: `OHLCVPanel` 默认值 None
+        周K线面板，默认为 `OHLCVPanel.load("W")`
+    :param refresh: bool 默认值 False
+        是否先刷新周K线
+    """
+
+    def __init__(self, panel=None, refresh=False):
+        if panel is None:
+            if refresh or not KlineStore("W").meta:
+                agg_market_klines(k_freq="W", refresh=True)
+            panel = OHLCVPanel.load("W")
+        self.panel = panel
+        self.dates = panel.dates
+        self.codes = panel.codes
+        self._compute()
+
+    def _compute(self):
+        p = self.panel
+        o, c = p.open.astype(np.float64), p.close.astype(np.float64)
+        h, l = p.high.astype(np.float64), p.low.astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.change_rate = (c - o) / o
+            self.wave_rate = (h - l) / l
+        self.criterion = 0.5 * self.change_rate + 0.5 * self.wave_rate
+        self.criterion[~np.isfinite(self.criterion)] = np.nan
+        self.valid = ~np.isnan(self.criterion)
+        self.n_valid = self.valid.sum(axis=1)
+        self.order, self.ranks = self._load_ranks()
+
+    def _rank_files(self):
+        return (os.path.join(self.panel.path, "rank_order.npy"),
+                os.path.join(self.panel.path, "rank.npy"))
+
+    def _load_ranks(self):
+        file_order, file_rank = self._rank_files()
+        meta = os.path.join(self.panel.path, "_meta.json")
+        if os.path.exists(file_rank) and \
+                os.path.getmtime(file_rank) >= os.path.getmtime(meta):
+            return np.load(file_order), np.load(file_rank)
+
+        # NaN 排在最后；-criterion 使准则大的排在前面
+        key = np.where(self.valid, -self.criterion, np.inf)
+        order = np.argsort(key, axis=1, kind='stable').astype(np.int32)
+        ranks = np.zeros(order.shape, dtype=np.int32)
+        np.put_along_axis(ranks, order,
+                          np.arange(1, order.shape[1] + 1, dtype=np.int32)[None, :],
+                          axis=1)
+        ranks[~self.valid] = 0
+        for path, arr in zip(self._rank_files(), (order, ranks)):
+            with open(path + ".tmp", 'wb') as f:
+                np.save(f, arr)
+            os.replace(path + ".tmp", path)
+        return order, ranks
+
+    # 查询
+    # --------------------------------------------------------------------
+    def week_index(self, date):
+        if date not in self.panel.date_index:
+            raise ValueError("%s 不是周K线的日期" % date)
+        return self.panel.date_index[date]
+
+    def top(self, date, n=None):
+        """date所在周的前n名，返回 [(名次, 股票代码), ...]"""
+        w = self.week_index(date)
+        k = int(self.n_valid[w]) if n is None else min(n, int(self.n_valid[w]))
+        return list(enumerate(self.codes[self.order[w, :k]].tolist(), 1))
+
+    def frame(self, date, sort_by='criterion'):
+        """date所在周所有股票的排序指标
+
+        :return: :class: `pd.DataFrame`
+            字段 ['date', 'code', 'change_rate', 'wave_rate', 'criterion']，
+            按sort_by从大到小排列
+        """
+        import pandas as pd
+        w = self.week_index(date)
+        idx = self.order[w, :int(self.n_valid[w])]
+        df = pd.DataFrame({
+            "date": date,
+            "code": self.codes[idx],
+            "change_rate": self.change_rate[w, idx],
+            "wave_rate": self.wave_rate[w, idx],
+            "criterion": self.criterion[w, idx],
+        })
+        if sort_by != 'criterion':
+            df = df.sort_values(sort_by, ascending=False, kind='stable')
+        return df.reset_index(drop=True)
+
+    def rank_history(self, code):
+        """股票code每一周的名次，当周没有K线为0
+
+        :return: :class: `pd.Series` index为日期
+        """
+        import pandas as pd
+        return pd.Series(self.ranks[:, self.panel.code_index[code]],
+                         index=self.dates, name=code)
+
+    def forward_returns(self, n=30):
+        """每一周排名前n的股票下一周的平均收益率（按周收盘价计算）
+
+        :return: :class: `pd.Series` index为排序所在周的日期
+        """
+        import pandas as pd
+        name = "top%i" % n
+        n = min(n, self.order.shape[1])
+        close = self.panel.close.astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ret = close[1:] / close[:-1] - 1
+        top = self.order[:-1, :n]
+        picked = np.take_along_axis(ret, top, axis=1)
+        picked[np.arange(n)[None, :] >= self.n_valid[:-1, None]] = np.nan
+        with np.errstate(invalid='ignore'):
+            mean = np.nanmean(np.where(np.isfinite(picked), picked, np.nan), axis=1)
+        return pd.Series(mean, index=self.dates[:-1], name=name)
+
+
 class WeekRank(BaseRank):
     """
     排序准则：周涨幅 * 0.5 + 周振幅 * 0.5
     """
 
-    def __init__(self, date, refresh=False):
+    def __init__(self, date, refresh=False, engine=None):
         """周排序
 
         :param date: str
             每周最后一个交易日的日期，如："2018-08-03"
         :param refresh: bool 默认值 False
             是否刷新数据
+        :param engine: :class: `WeekRankEngine` 默认值 None
+            周排序引擎；对多个周排序时传入同一个引擎，避免重复加载数据
         """
         desc = "以涨幅和振幅为依据的周排序方法"
         super().__init__(name='week_top', desc=desc)
         # 参数
         self.date = date
         self.refresh = refresh
+        self.engine = engine
         # 数据及计算结果
         self.latest_mkls = None
 
     def data_prepare(self):
         """获取排序需要的数据，按照排序准则进行计算"""
-        mkls = agg_market_klines(k_freq='W',
-                                 refresh=self.refresh)
-        latest_mkls = mkls[mkls["date"] == self.date]
-        latest_mkls["change"] = latest_mkls["close"] - latest_mkls['open']
-        latest_mkls["change_rate"] = latest_mkls["change"] / latest_mkls["open"]
-        latest_mkls["wave"] = latest_mkls["high"] - latest_mkls['low']
-        latest_mkls["wave_rate"] = latest_mkls["wave"] / latest_mkls["low"]
-        latest_mkls['criterion'] = 0.5 * latest_mkls["change_rate"] + \
-                                   0.5 * latest_mkls["wave_rate"]
-        latest_mkls.drop(['open', 'close', 'high', 'low',
-                          'volume', 'change', 'wave', ], axis=1, inplace=True)
-        latest_mkls.sort_values('criterion', ascending=False, inplace=True)
-        self.latest_mkls = latest_mkls.reset_index(drop=True)
+        if self.engine is None:
+            self.engine = WeekRankEngine(refresh=self.refresh)
+        self.latest_mkls = self.engine.frame(self.date)
 
     def rank(self, top=None):
         """默认的排序，即 周涨幅 * 0.5 + 周振幅 * 0.5"""
-        if not self.latest_mkls:
+        if self.latest_mkls is None:
             self.data_prepare()
         if top is None:
             top_shares = list(self.latest_mkls['code'])
         else:
-            indexes = range(top)
-            top_shares = list(self.latest_mkls.loc[indexes, 'code'])
+            top_shares = list(self.latest_mkls['code'][:top])
         return list(enumerate(top_shares, 1))
 
     def rank_by_change_rate(self):
         """以周涨跌幅为依据的排序"""
-        if not self.latest_mkls:
+        if self.latest_mkls is None:
             self.data_prepare()
-        wr = self.latest_mkls
-        wr.sort_values('change_rate', ascending=False, inplace=True)
+        wr = self.latest_mkls.sort_values('change_rate', ascending=False)
         wr = wr.reset_index(drop=True)
         return wr
 
 
+# TFIDF
+# --------------------------------------------------------------------
+
+def tokenize(doc):
+    """分词，过滤规则与 `jieba.analyse.extract_tags` 相同：去掉单字和停用词"""
+    stop_words = jieba.analyse.default_tfidf.stop_words
+    return [w for w in jieba.cut(doc)
+            if len(w.strip()) >= 2 and w.lower() not in stop_words]
+
+
+def tokenize_all(documents, processes=1):
+    """对所有文档分词，processes大于1时使用进程池"""
+    if processes > 1 and len(documents) > 1:
+        with ProcessPoolExecutor(processes) as executor:
+            return list(executor.map(tokenize, documents, chunksize=32))
+    return [tokenize(doc) for doc in documents]
+
+
+class IdfTable(object):
+    """IDF表，文件格式与jieba的IDF文件相同：每行一个“词 IDF值”
+
+    :param idf_freq: dict
+        {词: IDF值}
+    :param median_idf: float 默认值 None
+        不在表中的词使用的IDF值，默认为所有IDF值的中位数
+    """
+
+    def __init__(self, idf_freq, median_idf=None):
+        self.idf_freq = idf_freq
+        if median_idf is None:
+            values = sorted(idf_freq.values())
+            median_idf = values[len(values) // 2] if values else 0.0
+        self.median_idf = median_idf
+
+    @classmethod
+    def default(cls):
+        """jieba自带的IDF表"""
+        tfidf = jieba.analyse.default_tfidf
+        return cls(tfidf.idf_freq, tfidf.median_idf)
+
+    @classmethod
+    def from_tokens(cls, tokens):
+        """由分词后的语料计算IDF：log(文档总数 / 包含该词的文档数)"""
+        df = {}
+        for words in tokens:
+            for w in set(words):
+                df[w] = df.get(w, 0) + 1
+        n = len(tokens)
+        return cls({w: math.log(n / c) for w, c in df.items()})
+
+    @classmethod
+    def load(cls, path):
+        idf_freq = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    word, value = line.rsplit(' ', 1)
+                    idf_freq[word] = float(value)
+        return cls(idf_freq)
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for word, value in self.idf_freq.items():
+                f.write("%s %.6f\n" % (word, value))
+        os.replace(tmp, path)
+
+    def lookup(self, words):
+        """words对应的IDF值数组"""
+        get = self.idf_freq.get
+        median = self.median_idf
+        return np.fromiter((get(w, median) for w in words), dtype=np.float64,
+                           count=len(words))
+
+
+def build_idf(documents, path=None, processes=1):
+    """由语料（如多日的新闻）计算IDF表，指定path时保存为缓存文件"""
+    table = IdfTable.from_tokens(tokenize_all(documents, processes=processes))
+    if path is not None:
+        table.save(path)
+    return table
+
+
+def term_document_matrix(tokens):
+    """稀疏词-文档矩阵（COO格式）
+
+    :param tokens: list of list
+        每篇文档分词后的词列表
+    :return: tuple
+        (doc_idx, term_idx, counts, vocab)；第doc_idx篇文档中词vocab[term_idx]
+        出现了counts次，三个数组按 (doc_idx, term_idx) 排序
+    """
+    vocab = {}
+    term_ids = np.fromiter((vocab.setdefault(w, len(vocab))
+                            for words in tokens for w in words),
+                           dtype=np.int64)
+    lens = np.fromiter((len(words) for words in tokens), dtype=np.int64,
+                       count=len(tokens))
+    doc_ids = np.repeat(np.arange(len(tokens), dtype=np.int64), lens)
+    n_terms = max(len(vocab), 1)
+    keys, counts = np.unique(doc_ids * n_terms + term_ids, return_counts=True)
+    return keys // n_terms, keys % n_terms, counts.astype(np.float64), list(vocab)
+
+
+def mean_top_n(doc_idx, weights, n_docs, N):
+    """每篇文档前N个最大权重的平均值；不足N个词时用最小的一个补足，没有词时为0"""
+    order = np.lexsort((-weights, doc_idx))
+    d, w = doc_idx[order], weights[order]
+    starts = np.searchsorted(d, np.arange(n_docs))
+    rank = np.arange(len(d)) - starts[d]
+    top = rank < N
+    total = np.bincount(d[top], weights=w[top], minlength=n_docs)
+    k = np.minimum(np.bincount(d, minlength=n_docs), N)
+    last = np.zeros(n_docs)
+    has = k > 0
+    last[has] = w[starts[has] + k[has] - 1]
+    return np.where(has, (total + (N - k) * last) / N, 0.0)
+
+
 class TfidfDocRank(BaseRank):
     """基于TFIDF的文档重要性排序
 
@@ -102,6 +350,11 @@ class TfidfDocRank(BaseRank):
          '缩量盘整中资金调仓换股 金融股5日吸金近60亿元']
     :param N: int, 默认值 10
         从每篇文档中取出的重要关键词的数量
+    :param idf: 默认值 None
+        IDF来源：None 使用jieba自带的IDF表；"corpus" 由documents计算；
+        str 为IDF缓存文件路径（参考 `build_idf`）；也可以是 `IdfTable`
+    :param processes: int, 默认值 1
+        分词的进程数量
 
     ========================================================
     核心思想：
@@ -118,14 +371,21 @@ class TfidfDocRank(BaseRank):
         step 3. 按照“文档词均tfidf值”，从大到小排序
     输出:
         文档排序结果
+
+    批量计算：
+        所有文档只分词一次，构建稀疏词-文档矩阵，所有文档的tfidf值和
+        前N个关键词的平均值通过数组运算一次算出（`scores`）。
     ========================================================
     """
 
-    def __init__(self, documents, N=10):
+    def __init__(self, documents, N=10, idf=None, processes=1):
         desc = "基于TFIDF的文档重要性排序"
         super().__init__(name='tfidf_doc_rank', desc=desc)
         self.documents = documents
         self.N = N
+        self.idf = idf
+        self.processes = processes
+        self.tokens = None
 
     def data_prepare(self):
         docs = self.documents
@@ -152,11 +412,31 @@ class TfidfDocRank(BaseRank):
         total = sum([x[1] for x in kw])
         return total / len(kw)
 
+    def _get_idf(self):
+        if self.idf is None:
+            return IdfTable.default()
+        if isinstance(self.idf, IdfTable):
+            return self.idf
+        if self.idf == "corpus":
+            return IdfTable.from_tokens(self.tokens)
+        return IdfTable.load(self.idf)
+
+    def scores(self):
+        """所有文档的词均tfidf值，顺序同documents"""
+        if self.tokens is None:
+            self.tokens = tokenize_all(self.data_prepare(),
+                                       processes=self.processes)
+        doc_idx, term_idx, counts, vocab = term_document_matrix(self.tokens)
+        n_docs = len(self.tokens)
+        doc_total = np.bincount(doc_idx, weights=counts, minlength=n_docs)
+        idf = self._get_idf().lookup(vocab)
+        weights = counts / doc_total[doc_idx] * idf[term_idx]
+        return mean_top_n(doc_idx, weights, n_docs, self.N)
+
     def rank(self, top=None, reverse=True):
-        docs = self.data_prepare()
-        results = [(self.mean_tfidf(doc, top_k=self.N), self.documents[i])
-                   for i, doc in enumerate(docs)]
-        results = sorted(results, key=lambda x: x[0], reverse=reverse)
+        scores = self.scores()
+        order = np.argsort(-scores if reverse else scores, kind='stable')
+        results = [(float(scores[i]), self.documents[i]) for i in order]
         if not top:
             return results
         else:
@@ -16,7 +16,25 @@ from .ts import (klines, bars, ticks, today_market,
 # 上海证券交易所官网采集数据接口
 from .sse import get_sh_indexes
 
+# 批量实时行情
+from .quotes import QuoteBatcher, get_quotes
+from .cache import QuoteCache, quote_cache
+
 from .aggregation import agg_market_klines
+from .store import KlineStore
+from .panel import OHLCVPanel
 
 # 巨潮资讯网
-from .cninfo import get_sh_latest, get_sz_latest, get_announcements
+from .cninfo import (get_sh_latest, get_sz_latest, get_announcements,
+                     LatestAnnouncementSync)
+from .announcements import AnnouncementStore
+
+# 异步采集接口，需要安装 aiohttp
+from .aio import AsyncClient, run_sync
+from .sse import get_sh_indexes_async
+from .cninfo import (get_announcements_async, get_announcements_many,
+                     get_sh_latest_async, get_sz_latest_async)
+from .xueqiu import get_comments_async, get_comments_concurrent
+
+# 雪球评论并发采集
+from .xueqiu import XueqiuCommentCrawler, iter_comments
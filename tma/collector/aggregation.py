@@ -6,8 +6,12 @@ collector.aggregation - 聚合数据采集
 ====================================================================
 """
 import os
+import time
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
+from retrying import retry
 import pandas as pd
 
 import tma
@@ -15,49 +19,177 @@ import tma
 from tma.utils import debug_print
 from tma.collector.ts import get_klines
 from tma.collector.ts import get_all_codes
+from tma.collector.utils import TokenBucket
+from tma.collector.store import KlineStore
+from tma.storage import get_storage
 
+# 旧版本的全市场K线缓存
+KEY_LEGACY = "market_klines_%s"
 
-def agg_market_klines(k_freq="D", refresh=True, cache=True):
+
+class KlineHarvester(object):
+    """全市场K线并发采集器
+
+    使用有界线程池并发更新 `KlineStore` 中的K线，所有请求共用一个令牌桶
+    限流，单只股票失败后按指数退避重试。每只股票更新成功后立即记入检查点
+    文件，中断后再次运行时跳过已完成的股票。
+
+    :param k_freq: str 默认值 D
+        K线周期，可选值参考 `tma.collector.ts.get_klines`
+    :param workers: int 默认值 1
+        并发线程数量
+    :param rate: float 默认值 None
+        每秒最多发出的请求数量，None 表示不限流
+    :param retries: int 默认值 3
+        单只股票的最大尝试次数
+    :param store: :class: `KlineStore` 默认值 None
+        K线存储，默认为 `KlineStore(k_freq)`
+    :param checkpoint: str 默认值 None
+        检查点文件，默认为 `DATA_PATH/market_klines_{k_freq}.ckpt`
+    :param resume_ttl: int 默认值 3600 * 12
+        检查点的有效期（单位：s），超过有效期的检查点会被丢弃
+    :param fetch: callable 默认值 get_klines
+        K线获取函数，签名同 `get_klines(code, freq, start_date)`
+    """
+
+    def __init__(self, k_freq="D", workers=1, rate=None, retries=3, store=None,
+                 checkpoint=None, resume_ttl=3600 * 12, fetch=None):
+        self.k_freq = k_freq
+        self.workers = max(1, int(workers))
+        self.limiter = TokenBucket(rate) if rate else None
+        self.retries = retries
+        self.store = store if store is not None else KlineStore(k_freq)
+        if checkpoint is None:
+            checkpoint = os.path.join(tma.DATA_PATH,
+                                      "market_klines_%s.ckpt" % k_freq)
+        self.checkpoint = checkpoint
+        self.resume_ttl = resume_ttl
+        self.fetch = fetch if fetch is not None else get_klines
+        self.failed = []
+        self._ckpt_lock = threading.Lock()
+
+    # 检查点
+    # --------------------------------------------------------------------
+    def _prepare_checkpoint(self, resume=True):
+        """准备检查点文件，返回已经完成的股票代码"""
+        if resume and os.path.exists(self.checkpoint):
+            with open(self.checkpoint, 'r', encoding='utf-8') as f:
+                lines = f.read().split("\n")
+            if time.time() - float(lines[0]) < self.resume_ttl:
+                return set(x for x in lines[1:] if x)
+        with open(self.checkpoint, 'w', encoding='utf-8') as f:
+            f.write("%f\n" % time.time())
+        return set()
+
+    def _mark_done(self, code):
+        with self._ckpt_lock:
+            with open(self.checkpoint, 'a', encoding='utf-8') as f:
+                f.write(code + "\n")
+
+    def clear_checkpoint(self):
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    # 采集
+    # --------------------------------------------------------------------
+    def _fetch_limited(self, code, **kwargs):
+        if self.limiter is not None:
+            self.limiter.acquire()
+        return self.fetch(code, **kwargs)
+
+    def _harvest_one(self, code, full=False):
+        update = retry(stop_max_attempt_number=self.retries,
+                       wait_exponential_multiplier=500,
+                       wait_exponential_max=10000)(self.store.update)
+        kls = update(code, fetch=self._fetch_limited, full=full)
+        self._mark_done(code)
+        return kls
+
+    def harvest(self, codes, resume=True, full=False):
+        """更新codes的K线
+
+        :param codes: list
+            股票代码列表
+        :param resume: bool 默认值 True
+            是否从检查点恢复
+        :param full: bool 默认值 False
+            是否强制重新获取全部K线，默认只获取本地缺失的K线
+        :return: :class: `pd.DataFrame`
+            所有获取成功的股票的K线
+        """
+        # 检查点中没有元信息的股票（旧版本中断时可能出现）重新获取
+        done = self._prepare_checkpoint(resume=resume) & set(self.store.meta)
+        todo = [code for code in codes if code not in done]
+        shares_kls = [self.store.read(code) for code in codes if code in done]
+        self.failed = []
+
+        desc = "agg_market_klines_%s" % self.k_freq
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self._harvest_one, code, full): code
+                       for code in todo}
+            for future in tqdm(as_completed(futures), total=len(futures),
+                               ncols=100, desc=desc):
+                try:
+                    shares_kls.append(future.result())
+                except Exception:
+                    if tma.DEBUG:
+                        traceback.print_exc()
+                    self.failed.append(futures[future])
+        self.store.save_meta()
+
+        if tma.DEBUG:
+            msg = "agg_market_klines(k_freq='%s') 运行结果：总共有%i只股票，" \
+                  "其中未获取到k线的股票数量是%i" % (
+                      self.k_freq, len(codes), len(self.failed)
+                  )
+            debug_print(msg, level='INFO')
+        shares_kls = [kls for kls in shares_kls if len(kls) > 0]
+        if not shares_kls:
+            return pd.DataFrame()
+        return pd.concat(shares_kls, ignore_index=True)
+
+
+def agg_market_klines(k_freq="D", refresh=True, cache=True,
+                      workers=1, rate=None, resume=True, full=False):
     """获取整个市场全部股票的K线
 
     :param k_freq: str 默认值 D
         K线周期，可选值参考 `tma.collector.ts.get_klines`
     :param refresh: bool 默认值 True
         是否刷新数据。
-        全市场所有股票K线的获取需要较长的时间，默认情况下，获取的数据会
-        缓存到用户目录下的`.tma/data`文件夹。当 refresh 为 False 且
-        存在对应k_freq的K线数据时，直接读取缓存数据。
+        全市场所有股票K线的获取需要较长的时间，获取的数据保存在用户目录下
+        `.tma/data`文件夹中的 `KlineStore`。当 refresh 为 False 且存在对应
+        k_freq的K线数据时，直接读取本地数据。
+        刷新时只获取 `KlineStore` 中缺失的K线，复权价格发生改写的股票
+        会重新获取全部K线。
     :param cache: bool 默认值 True
-        是否缓存数据到用户目录下。
+        已废弃，K线总是保存在 `KlineStore` 中，保留该参数只为兼容旧版本。
+    :param workers: int 默认值 1
+        并发获取K线的线程数量
+    :param rate: float 默认值 None
+        每秒最多发出的请求数量，None 表示不限流
+    :param resume: bool 默认值 True
+        是否从上一次中断的位置继续采集，参考 `KlineHarvester`
+    :param full: bool 默认值 False
+        是否强制重新获取所有股票的全部K线
     :return: :class: `pd.DataFrame`
         字段列表:
         ['date', 'open', 'close', 'high', 'low', 'volume', 'code']
     """
-    FILE_CACHE = os.path.join(tma.DATA_PATH,
-                              "market_klines_%s.csv" % k_freq)
-    if os.path.exists(FILE_CACHE) and not refresh:
-        df = pd.read_csv(FILE_CACHE, encoding='utf-8', dtype={"code": str})
-        return df
+    store = KlineStore(k_freq)
+    if not store.meta and get_storage().exists(KEY_LEGACY % k_freq):
+        # 用旧版的全市场缓存初始化K线库，避免首次刷新时重新获取全部K线
+        storage = get_storage()
+        store.import_frame(storage.read(KEY_LEGACY % k_freq))
+        storage.remove(KEY_LEGACY % k_freq)
+    if store.meta and not refresh:
+        return store.read_many()
 
     shares = get_all_codes()
-    shares_kls = []
-    failed = []
-    for share in tqdm(shares, ncols=100, desc="agg_market_klines_%s" % k_freq):
-        try:
-            kls = get_klines(share, freq=k_freq)
-            shares_kls.append(kls)
-        except:
-            if tma.DEBUG:
-                traceback.print_exc()
-            failed.append(share)
-    if tma.DEBUG:
-        msg = "agg_market_klines(k_freq='%s') 运行结果：总共有%i只股票，" \
-              "其中未获取到k线的股票数量是%i" % (
-                  k_freq, len(shares), len(failed)
-              )
-        debug_print(msg, level='INFO')
-    df = pd.concat(shares_kls, ignore_index=True)
-    if cache:
-        # 缓存数据
-        df.to_csv(FILE_CACHE, index=False, encoding='utf-8')
+    harvester = KlineHarvester(k_freq=k_freq, workers=workers, rate=rate,
+                               store=store)
+    df = harvester.harvest(shares, resume=resume, full=full)
+    if not harvester.failed:
+        # 全部获取成功后才清理检查点，失败的股票在下一次运行时重新获取
+        harvester.clear_checkpoint()
     return df
@@ -0,0 +1,181 @@
+# -*- coding: UTF-8 -*-
+
+"""
+collector.aio - 异步采集基础设施
+
+所有异步采集接口共用一个 `AsyncClient`：底层是一个 aiohttp 连接池，
+每个域名有独立的并发上限，每个请求有超时时间；连接错误、超时、429 和
+5xx 响应按指数退避重试，其他 4xx 响应直接抛出异常。
+需要安装 aiohttp：pip install tma[async]
+====================================================================
+"""
+import asyncio
+import threading
+from urllib.parse import urlsplit
+
+# 各域名的默认并发上限，未配置的域名使用 AsyncClient.limit_per_host
+HOST_LIMITS = {
+    "www.cninfo.com.cn": 8,
+    "xueqiu.com": 4,
+}
+
+
+# 除 5xx 外需要重试的响应状态码；其他 4xx 重试也不会成功
+RETRY_STATUS = frozenset([429])
+
+
+def _import_aiohttp():
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError("异步采集接口需要安装 aiohttp：pip install aiohttp")
+    return aiohttp
+
+
+class AsyncClient(object):
+    """异步HTTP客户端
+
+    :param limit: int 默认值 100
+        连接池的最大连接数量
+    :param limit_per_host: int 默认值 8
+        单个域名的默认并发上限
+    :param host_limits: dict 默认值 None
+        各域名的并发上限，会覆盖 HOST_LIMITS 中的同名项
+    :param timeout: float 默认值 10
+        单个请求的超时时间（单位：s）
+    :param retries: int 默认值 3
+        单个请求的最大尝试次数
+    :param headers: dict 默认值 None
+        默认请求头，默认为 `zb.crawlers.utils.get_header()`
+
+    使用方法：
+        async with AsyncClient() as client:
+            data = await client.get_json(url)
+    """
+
+    def __init__(self, limit=100, limit_per_host=8, host_limits=None,
+                 timeout=10, retries=3, headers=None):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.host_limits = dict(HOST_LIMITS)
+        if host_limits:
+            self.host_limits.update(host_limits)
+        self.timeout = timeout
+        self.retries = max(1, int(retries))
+        self.headers = headers
+        self.session = None
+        self._semaphores = {}
+
+    async def open(self):
+        if self.session is None:
+            aiohttp = _import_aiohttp()
+            if self.headers is None:
+                from zb.crawlers.utils import get_header
+                self.headers = get_header()
+            connector = aiohttp.TCPConnector(limit=self.limit, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(
+                connector=connector, headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _semaphore(self, url):
+        host = urlsplit(url).hostname
+        if host not in self._semaphores:
+            limit = self.host_limits.get(host, self.limit_per_host)
+            self._semaphores[host] = asyncio.Semaphore(limit)
+        return self._semaphores[host]
+
+    # 请求
+    # --------------------------------------------------------------------
+    async def request(self, method, url, as_json=True, as_bytes=False, **kwargs):
+        """发送请求并返回解析后的结果
+
+        :param method: str
+            GET / POST
+        :param url: str
+        :param as_json: bool 默认值 True
+            True 返回解析后的JSON，False 返回文本
+        :param as_bytes: bool 默认值 False
+            True 返回原始的响应内容，如 Excel 文件
+        :param kwargs:
+            传给 `aiohttp.ClientSession.request` 的其他参数，如 params、data、headers
+        """
+        await self.open()
+        for attempt in range(self.retries):
+            try:
+                async with self._semaphore(url):
+                    async with self.session.request(method, url, **kwargs) as res:
+                        res.raise_for_status()
+                        if as_bytes:
+                            return await res.read()
+                        if as_json:
+                            return await res.json(content_type=None)
+                        return await res.text()
+            except Exception as e:
+                if attempt == self.retries - 1 or not self._retryable(e):
+                    raise
+                await asyncio.sleep(min(0.5 * 2 ** attempt, 10))
+
+    @staticmethod
+    def _retryable(e):
+        """连接错误、超时、429 和 5xx 可以重试"""
+        aiohttp = _import_aiohttp()
+        if isinstance(e, aiohttp.ClientResponseError):
+            return e.status in RETRY_STATUS or e.status >= 500
+        return isinstance(e, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError,
+                              asyncio.TimeoutError))
+
+    async def get_json(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post_json(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def get_text(self, url, **kwargs):
+        return await self.request("GET", url, as_json=False, **kwargs)
+
+    async def get_bytes(self, url, **kwargs):
+        return await self.request("GET", url, as_bytes=True, **kwargs)
+
+
+async def _with_client(client, func, *args, **kwargs):
+    """client为None时创建临时的 AsyncClient，调用结束后关闭"""
+    if client is not None:
+        return await func(client, *args, **kwargs)
+    async with AsyncClient() as client:
+        return await func(client, *args, **kwargs)
+
+
+def run_sync(coro):
+    """在同步代码中运行协程；当前线程已有运行中的事件循环时，在新线程中运行"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    result = {}
+
+    def _run():
+        try:
+            result['value'] = asyncio.run(coro)
+        except BaseException as e:
+            result['error'] = e
+
+    t = threading.Thread(target=_run)
+    t.start()
+    t.join()
+    if 'error' in result:
+        raise result['error']
+    return result['value']
@@ -0,0 +1,277 @@
+# -*- coding: UTF-8 -*-
+
+"""
+collector.announcements - 公告本地库与全文检索
+
+公告PDF只下载一次（按URL的哈希去重），文本只提取一次，标题和正文写入
+SQLite FTS5 全文索引。FTS5 自带的分词器不能切分中文，因此写入索引前先用
+jieba 分词（cut_for_search），索引中保存的是以空格分隔的词。
+====================================================================
+"""
+import os
+import hashlib
+import sqlite3
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import requests
+import jieba
+import pandas as pd
+
+import tma
+from tma.collector.utils import save_pdf
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    url_hash TEXT UNIQUE,
+    url TEXT,
+    code TEXT,
+    name TEXT,
+    date TEXT,
+    title TEXT,
+    path TEXT,
+    status INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_docs_code_date ON docs (code, date);
+CREATE INDEX IF NOT EXISTS idx_docs_date ON docs (date);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5 (
+    title, body, tokenize = 'unicode61'
+);
+"""
+
+# docs.status
+PENDING, EXTRACTED, FAILED = 0, 1, -1
+
+
+def url_hash(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def segment(text):
+    """中文分词，返回以空格分隔的词，用于写入全文索引"""
+    return " ".join(w for w in jieba.cut_for_search(text) if w.strip())
+
+
+def _match_query(keywords):
+    """关键词转换为 FTS5 查询：每个关键词分词后作为短语，多个关键词之间为“且”"""
+    if isinstance(keywords, str):
+        keywords = keywords.split()
+    phrases = []
+    for kw in keywords:
+        words = [w.replace('"', '""') for w in jieba.cut(kw) if w.strip()]
+        if words:
+            phrases.append('"%s"' % " ".join(words))
+    return " AND ".join(phrases)
+
+
+class AnnouncementStore(object):
+    """公告本地库
+
+    目录结构（默认为 `DATA_PATH/announcements`）：
+        pdf/{hash[:2]}/{hash}.pdf - 公告原文
+        index.db                  - 元信息和全文索引
+
+    :param path: str 默认值 None
+        本地库目录
+    :param extract: callable 默认值 `tma.utils.pdf2text`
+        文本提取函数，签名为 extract(pdf_path) -> str
+    :param workers: int 默认值 4
+        并发下载的线程数量
+    :param processes: int 默认值 1
+        正文分词的进程数量；分词是写入索引时最耗时的步骤，大于1时使用进程池
+    :param chunk_size: int 默认值 64KB
+        下载时的分块大小
+
+    使用方法：
+        store = AnnouncementStore()
+        store.add(get_announcements('600122', start_date='2016-01-01'))
+        store.search("减持", code='600122')
+    """
+
+    def __init__(self, path=None, extract=None, workers=4, processes=1,
+                 chunk_size=1 << 16):
+        if path is None:
+            path = os.path.join(tma.DATA_PATH, "announcements")
+        self.path = path
+        self.pdf_path = os.path.join(path, "pdf")
+        if not os.path.exists(self.pdf_path):
+            os.makedirs(self.pdf_path)
+        if extract is None:
+            from tma.utils import pdf2text
+            extract = pdf2text
+        self.extract = extract
+        self.workers = max(1, int(workers))
+        self.processes = max(1, int(processes))
+        self.chunk_size = chunk_size
+        self.db = sqlite3.connect(os.path.join(path, "index.db"),
+                                  check_same_thread=False)
+        self.db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def _pdf_file(self, h):
+        folder = os.path.join(self.pdf_path, h[:2])
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, h + ".pdf")
+
+    # 写入
+    # --------------------------------------------------------------------
+    def add(self, announcements, download=True):
+        """添加公告；已存在的公告（URL相同）直接跳过
+
+        :param announcements: list
+            公告列表，字段同 `get_announcements`
+        :param download: bool 默认值 True
+            是否立即下载并提取新公告的正文；为False时只索引标题
+        :return: int
+            新增的公告数量
+        """
+        added = 0
+        with self._lock, self.db:
+            for a in announcements:
+                h = url_hash(a['url'])
+                cur = self.db.execute(
+                    "INSERT OR IGNORE INTO docs (url_hash, url, code, name, date, "
+                    "title, path) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (h, a['url'], a['code'], a.get('name'), a['date'],
+                     a['title'], self._pdf_file(h))
+                )
+                if cur.rowcount:
+                    added += 1
+                    self.db.execute(
+                        "INSERT INTO docs_fts (rowid, title, body) VALUES (?, ?, '')",
+                        (cur.lastrowid, segment(a['title']))
+                    )
+        if download:
+            self.process_pending()
+        return added
+
+    def _session(self):
+        sess = getattr(self._local, 'session', None)
+        if sess is None:
+            sess = self._local.session = requests.Session()
+        return sess
+
+    def _download_extract(self, row):
+        doc_id, url, path = row
+        try:
+            if not os.path.exists(path):
+                save_pdf(url, path, chunk_size=self.chunk_size,
+                         session=self._session())
+            return doc_id, self.extract(path) or ""
+        except Exception:
+            if tma.DEBUG:
+                traceback.print_exc()
+            return doc_id, None
+
+    def process_pending(self, limit=None, batch=200):
+        """下载并提取所有尚未处理的公告的正文
+
+        :param limit: int 默认值 None
+            最多处理的公告数量
+        :param batch: int 默认值 200
+            每批处理的公告数量，每批结束后提交一次
+        :return: int
+            成功提取正文的公告数量
+        """
+        sql = "SELECT id, url, path FROM docs WHERE status = ? ORDER BY id"
+        if limit:
+            sql += " LIMIT %i" % int(limit)
+        rows = self.db.execute(sql, (PENDING,)).fetchall()
+        done = 0
+        pool = ProcessPoolExecutor(self.processes) if self.processes > 1 else None
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for i in range(0, len(rows), batch):
+                    results = list(executor.map(self._download_extract,
+                                                rows[i: i + batch]))
+                    ok = [(doc_id, text) for doc_id, text in results
+                          if text is not None]
+                    texts = [text for _, text in ok]
+                    if pool is not None:
+                        bodies = list(pool.map(segment, texts, chunksize=8))
+                    else:
+                        bodies = [segment(text) for text in texts]
+                    with self._lock, self.db:
+                        self.db.executemany(
+                            "UPDATE docs_fts SET body = ? WHERE rowid = ?",
+                            [(body, doc_id) for (doc_id, _), body in zip(ok, bodies)])
+                        self.db.executemany(
+                            "UPDATE docs SET status = ? WHERE id = ?",
+                            [(EXTRACTED if text is not None else FAILED, doc_id)
+                             for doc_id, text in results])
+                    done += len(ok)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return done
+
+    def retry_failed(self):
+        """把提取失败的公告重新标记为待处理"""
+        with self._lock, self.db:
+            self.db.execute("UPDATE docs SET status = ? WHERE status = ?",
+                            (PENDING, FAILED))
+        return self.process_pending()
+
+    # 查询
+    # --------------------------------------------------------------------
+    def search(self, keywords, code=None, start_date=None, end_date=None,
+               title_only=False, limit=50):
+        """全文检索
+
+        :param keywords: str or list
+            关键词，多个关键词之间为“且”的关系，如 "减持 股东" 或 ["减持", "股东"]
+        :param code: str or list 默认值 None
+            股票代码
+        :param start_date: str 默认值 None
+            开始日期，如 "2016-01-01"
+        :param end_date: str 默认值 None
+            结束日期
+        :param title_only: bool 默认值 False
+            是否只检索标题
+        :param limit: int 默认值 50
+        :return: :class: `pd.DataFrame`
+            字段 ['code', 'name', 'date', 'title', 'url', 'path', 'score']，
+            按相关度排序
+        """
+        query = _match_query(keywords)
+        if not query:
+            raise ValueError("keywords 不能为空")
+        if title_only:
+            query = "title : (%s)" % query
+        where, params = ["docs_fts MATCH ?"], [query]
+        if code is not None:
+            codes = [code] if isinstance(code, str) else list(code)
+            where.append("d.code IN (%s)" % ",".join("?" * len(codes)))
+            params.extend(codes)
+        if start_date is not None:
+            where.append("d.date >= ?")
+            params.append(start_date)
+        if end_date is not None:
+            where.append("d.date <= ?")
+            params.append(end_date)
+        sql = "SELECT d.code, d.name, d.date, d.title, d.url, d.path, " \
+              "bm25(docs_fts) AS score FROM docs_fts " \
+              "JOIN docs d ON d.id = docs_fts.rowid " \
+              "WHERE %s ORDER BY score LIMIT ?" % " AND ".join(where)
+        params.append(int(limit))
+        rows = self.db.execute(sql, params).fetchall()
+        return pd.DataFrame(rows, columns=['code', 'name', 'date', 'title',
+                                           'url', 'path', 'score'])
+
+    def stats(self):
+        """各处理状态的公告数量"""
+        rows = self.db.execute("SELECT status, COUNT(*) FROM docs GROUP BY status")
+        names = {PENDING: "pending", EXTRACTED: "extracted", FAILED: "failed"}
+        res = {v: 0 for v in names.values()}
+        for status, n in rows:
+            res[names[status]] = n
+        return res
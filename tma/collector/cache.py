@@ -0,0 +1,194 @@
+# -*- coding: UTF-8 -*-
+
+"""
+collector.cache - 进程内行情缓存
+
+同一进程内的多个指标、监控任务共用一份行情数据：按 (数据类型, 键) 缓存，
+每种数据类型有各自的有效期，超过容量时淘汰最久未使用的条目。多个线程
+同时请求同一份尚未缓存的数据时，只有一个线程真正发出请求，其余线程
+等待并共用其结果。
+====================================================================
+"""
+import time
+import threading
+from collections import OrderedDict
+
+# 各数据类型的默认有效期（单位：s）
+DEFAULT_TTL = {
+    "bars": 3,
+    "market": 30,
+    "indices": 60,
+    "basics": 3600 * 24,
+}
+
+
+class _Flight(object):
+    """一个正在进行中的请求"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class QuoteCache(object):
+    """线程安全的行情缓存
+
+    :param ttl: dict 默认值 None
+        各数据类型的有效期（单位：s），会覆盖 DEFAULT_TTL 中的同名项；
+        未配置的数据类型有效期为 default_ttl
+    :param default_ttl: float 默认值 3
+    :param maxsize: int 默认值 20000
+        最多缓存的条目数量
+
+    使用方法：
+        cache = QuoteCache(ttl={"bars": 1})
+        df = cache.get("indices", "all", get_indices)
+        rows = cache.get_many("bars", codes, lambda missing: {...})
+        cache.stats()
+    """
+
+    def __init__(self, ttl=None, default_ttl=3, maxsize=20000):
+        self.ttl = dict(DEFAULT_TTL)
+        if ttl:
+            self.ttl.update(ttl)
+        self.default_ttl = default_ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def set_ttl(self, kind, seconds):
+        """设置数据类型kind的有效期"""
+        with self._lock:
+            self.ttl[kind] = seconds
+
+    # 内部方法，调用时必须持有锁
+    # --------------------------------------------------------------------
+    def _lookup(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return False, None
+        value, expire = item
+        if time.monotonic() >= expire:
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def _store(self, key, value):
+        ttl = self.ttl.get(key[0], self.default_ttl)
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    # 读取
+    # --------------------------------------------------------------------
+    def get(self, kind, key, loader):
+        """读取一条数据，未缓存或已过期时调用 loader() 获取
+
+        :param kind: str
+            数据类型，如 bars、market、indices、basics
+        :param key: hashable
+            键，如股票代码
+        :param loader: callable
+            无参数的数据获取函数
+        """
+        return self.get_many(kind, [key], lambda keys: {key: loader()})[key]
+
+    def get_many(self, kind, keys, loader):
+        """批量读取，未缓存的键通过一次 loader 调用获取
+
+        :param kind: str
+            数据类型
+        :param keys: list
+            键列表
+        :param loader: callable
+            签名为 loader(missing_keys) -> dict，返回 {键: 数据}；
+            没有返回的键视为不存在，结果中对应的值为 None
+        :return: dict
+            {键: 数据}
+        """
+        result, owned, waiting = {}, [], {}
+        with self._lock:
+            for key in keys:
+                ck = (kind, key)
+                hit, value = self._lookup(ck)
+                if hit:
+                    self.hits += 1
+                    result[key] = value
+                elif ck in self._flights:
+                    self.hits += 1
+                    waiting[key] = self._flights[ck]
+                else:
+                    self.misses += 1
+                    self._flights[ck] = _Flight()
+                    owned.append(key)
+
+        if owned:
+            try:
+                loaded = loader(owned)
+            except BaseException as e:
+                # 包括 KeyboardInterrupt、SystemExit：必须移除请求并唤醒等待的线程，
+                # 否则之后请求这些键的线程会一直阻塞
+                with self._lock:
+                    for key in owned:
+                        flight = self._flights.pop((kind, key))
+                        flight.error = e
+                        flight.event.set()
+                raise
+            with self._lock:
+                for key in owned:
+                    value = loaded.get(key)
+                    if value is not None:
+                        self._store((kind, key), value)
+                    flight = self._flights.pop((kind, key))
+                    flight.value = value
+                    flight.event.set()
+                    result[key] = value
+
+        for key, flight in waiting.items():
+            result[key] = flight.wait()
+        return result
+
+    def put(self, kind, key, value):
+        """直接写入一条数据，如强制刷新后的最新结果"""
+        with self._lock:
+            self._store((kind, key), value)
+
+    # 其他
+    # --------------------------------------------------------------------
+    def invalidate(self, kind=None):
+        """清除数据类型kind的缓存，kind为None时清除全部"""
+        with self._lock:
+            if kind is None:
+                self._data.clear()
+            else:
+                for key in [k for k in self._data if k[0] == kind]:
+                    del self._data[key]
+
+    def stats(self):
+        """命中次数、未命中次数、命中率和当前条目数量"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0,
+                "size": len(self._data),
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+quote_cache = QuoteCache()
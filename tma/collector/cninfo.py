@@ -7,86 +7,63 @@ collector.cninfo - 采集巨潮咨询网的数据
 ====================================================================
 """
 
+import math
+import asyncio
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from datetime import timedelta
+import pandas as pd
 
+from tma.storage import get_storage
+from tma.collector.aio import _with_client, run_sync
 
-# 获取上交所、深交所所有股票的最新公告
-# --------------------------------------------------------------------
+URL_SH_LATEST = "http://www.cninfo.com.cn/cninfo-new/disclosure/sse_latest"
+URL_SZ_LATEST = "http://www.cninfo.com.cn/cninfo-new/disclosure/szse_latest"
+URL_QUERY = "http://www.cninfo.com.cn/cninfo-new/announcement/query"
 
-def _parse_latest(url, params):
-    announcements = []
-    while True:
-        params['pageNum'] += 1
-        res = requests.post(url, data=params).json()
-        for items in res['classifiedAnnouncements']:
-            # print(item)
-            for item in items:
-                announcement = {
-                    "url": "http://www.cninfo.com.cn/" + item['adjunctUrl'],
-                    "title": item['announcementTitle'],
-                    "date": datetime.fromtimestamp(
-                        item['announcementTime'] / 1000).date().__str__(),
-                    "code": item['secCode'],
-                    "name": item['secName']
-                }
-                announcements.append(announcement)
-        if not res['hasMore']:
-            break
-    return announcements
+# 单个请求的超时时间（单位：s）
+TIMEOUT = 10
 
 
-def get_sh_latest():
-    """获取上交所的最新公告列表"""
-    url = "http://www.cninfo.com.cn/cninfo-new/disclosure/sse_latest"
-    params = {
-        "column": "sse",
-        "columnTitle": "沪市公告",
-        "pageNum": 0,
-        "pageSize": 30,
-        "tabName": "latest"
+def _parse_item(item):
+    return {
+        "id": str(item.get('announcementId', '')),
+        "url": "http://www.cninfo.com.cn/" + item['adjunctUrl'],
+        "title": item['announcementTitle'],
+        "date": datetime.fromtimestamp(
+            item['announcementTime'] / 1000).date().__str__(),
+        "code": item['secCode'],
+        "name": item['secName']
     }
-    announcements = _parse_latest(url, params)
-    return announcements
 
 
-def get_sz_latest():
-    """获取深交所的最新公告列表"""
-    url = 'http://www.cninfo.com.cn/cninfo-new/disclosure/szse_latest'
-    params = {
+def _latest_params(market):
+    if market == "sh":
+        return {
+            "column": "sse",
+            "columnTitle": "沪市公告",
+            "pageNum": 0,
+            "pageSize": 30,
+            "tabName": "latest"
+        }
+    return {
         "column": "szse",
         "columnTitle": "深市公告",
         "pageNum": 0,
         "pageSize": 30,
         "tabName": "latest"
     }
-    announcements = _parse_latest(url, params)
-    return announcements
 
 
-# 获取指定股票一段时间内的所有公告
-# --------------------------------------------------------------------
-def get_announcements(code, start_date=None, end_date=None):
-    """获取公告列表
-
-    :param code: str
-        股票代码，如：600122
-    :param start_date: str
-        开始时间，如："2017-08-10"，默认值为今日想前推三十天的日期
-    :param end_date: str
-        结束时间，如："2018-08-10"，默认值为今日日期
-    :return: announcements
-    """
+def _query_params(code, start_date=None, end_date=None):
     if not start_date:
         start_date = datetime.now().date() - timedelta(days=30)
         start_date = str(start_date)
     if not end_date:
         end_date = datetime.now().date().__str__()
-
-    url = "http://www.cninfo.com.cn/cninfo-new/announcement/query"
-
-    params = {
+    return {
         "stock": code,
         "searchkey": None,
         "category": None,
@@ -100,22 +77,279 @@ def get_announcements(code, start_date=None, end_date=None):
         "seDate": "%s ~ %s" % (start_date, end_date)
     }
 
+
+def _form(params):
+    """aiohttp 的表单数据不接受None，与 requests 一样去掉值为None的字段"""
+    return {k: v for k, v in params.items() if v is not None}
+
+
+# 获取上交所、深交所所有股票的最新公告
+# --------------------------------------------------------------------
+
+def _latest_items(res):
+    """最新公告列表中一页的公告，classifiedAnnouncements 按公司分组"""
+    groups = res.get('classifiedAnnouncements')
+    if groups is None:
+        return [_parse_item(item) for item in res.get('announcements') or []]
+    return [_parse_item(item) for items in groups for item in items]
+
+
+def _total_pages(res, page_size):
+    """由第一页返回的公告总数计算总页数，接口没有返回总数时为None"""
+    total = res.get('totalAnnouncement') or res.get('totalRecordNum')
+    if not total:
+        return None
+    return int(math.ceil(int(total) / page_size))
+
+
+def _key(announcement):
+    """公告的唯一标识：announcementId；接口没有返回时使用公告链接"""
+    return announcement['id'] or announcement['url']
+
+
+def _dedupe(announcements):
+    """并发翻页期间有新公告发布时，相邻两页可能有重复的公告"""
+    seen = set()
+    result = []
+    for a in announcements:
+        key = _key(a)
+        if key not in seen:
+            seen.add(key)
+            result.append(a)
+    return result
+
+
+def _parse_latest(url, params, workers=8, timeout=TIMEOUT):
+    """获取最新公告列表的全部页
+
+    先请求第一页得到公告总数，其余页在线程池中并发请求，每个线程使用
+    各自的 requests.Session；接口没有返回公告总数时按 hasMore 逐页请求。
+    """
+    local = threading.local()
+
+    def _page(num):
+        sess = getattr(local, 'session', None)
+        if sess is None:
+            sess = local.session = requests.Session()
+        return sess.post(url, data=dict(params, pageNum=num), timeout=timeout).json()
+
+    first = _page(1)
+    pages = [first]
+    n = _total_pages(first, params['pageSize'])
+    if first['hasMore'] and n is not None and n > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pages.extend(executor.map(_page, range(2, n + 1)))
+    elif first['hasMore']:
+        num = 1
+        while pages[-1]['hasMore']:
+            num += 1
+            pages.append(_page(num))
+    return _dedupe([a for res in pages for a in _latest_items(res)])
+
+
+def get_sh_latest():
+    """获取上交所的最新公告列表"""
+    announcements = _parse_latest(URL_SH_LATEST, _latest_params("sh"))
+    return announcements
+
+
+def get_sz_latest():
+    """获取深交所的最新公告列表"""
+    announcements = _parse_latest(URL_SZ_LATEST, _latest_params("sz"))
+    return announcements
+
+
+class LatestAnnouncementSync(object):
+    """沪深最新公告的增量同步
+
+    已经同步过的公告保存在本地（存储键 `announcements/latest_{market}`）。
+    同步时从第一页开始逐页请求，遇到本地已有的公告（announcementId，
+    接口没有返回时为公告链接）即停止，因此每分钟轮询一次通常只需要一到两个请求；本地没有任何
+    公告时，并发获取全部页。
+
+    :param market: str 默认值 sh
+        sh - 沪市公告；sz - 深市公告
+    :param storage: :class: `tma.storage.BaseStorage` 默认值 get_storage()
+    :param keep: int 默认值 20000
+        本地最多保存的公告数量
+    :param timeout: float 默认值 10
+        单个请求的超时时间（单位：s）
+
+    使用方法：
+        sync = LatestAnnouncementSync("sh")
+        new = sync.sync()   # 上一次同步之后发布的公告
+    """
+    COLUMNS = ["id", "url", "title", "date", "code", "name"]
+
+    def __init__(self, market="sh", storage=None, keep=20000, timeout=TIMEOUT):
+        if market not in ("sh", "sz"):
+            raise ValueError("market 可选值为 ['sh', 'sz']，当前值为 '%s'" % market)
+        self.market = market
+        self.url = URL_SH_LATEST if market == "sh" else URL_SZ_LATEST
+        self.storage = storage if storage is not None else get_storage()
+        self.key = "announcements/latest_%s" % market
+        self.keep = keep
+        self.timeout = timeout
+        if self.storage.exists(self.key):
+            self.data = self.storage.read(self.key)
+            self.data['id'] = self.data['id'].map(self._str_id)
+        else:
+            self.data = pd.DataFrame(columns=self.COLUMNS)
+        self.known_ids = self._known(self.data)
+        self.requests = 0
+
+    @staticmethod
+    def _str_id(x):
+        """CSV中的 id 列读取为数值，有空值时为float，如 1205.0、nan"""
+        if pd.isnull(x):
+            return ''
+        if isinstance(x, float) and x.is_integer():
+            return str(int(x))
+        return str(x)
+
+    @staticmethod
+    def _known(data):
+        """本地已有公告的唯一标识，参考 `_key`"""
+        return set(_key(a) for a in data[['id', 'url']].to_dict('records'))
+
+    def _fetch_new(self, max_pages=None):
+        params = _latest_params(self.market)
+        sess = requests.Session()
+        new = []
+        num = 0
+        while max_pages is None or num < max_pages:
+            num += 1
+            res = sess.post(self.url, data=dict(params, pageNum=num),
+                            timeout=self.timeout).json()
+            self.requests += 1
+            items = _latest_items(res)
+            fresh = [a for a in items if _key(a) not in self.known_ids]
+            new.extend(fresh)
+            if len(fresh) < len(items) or not res['hasMore']:
+                break
+        return _dedupe(new)
+
+    def sync(self, max_pages=None):
+        """同步最新公告，返回本次新增的公告
+
+        :param max_pages: int 默认值 None
+            最多请求的页数，None 表示直到遇到本地已有的公告为止
+        :return: list
+            新增公告，字段同 `get_announcements`，按发布时间由新到旧排列
+        """
+        if not self.known_ids:
+            new = _parse_latest(self.url, _latest_params(self.market),
+                                timeout=self.timeout)
+        else:
+            new = self._fetch_new(max_pages=max_pages)
+        if new:
+            df = pd.DataFrame(new, columns=self.COLUMNS)
+            self.data = pd.concat([df, self.data], ignore_index=True)
+            self.data = self.data.iloc[:self.keep]
+            self.known_ids = self._known(self.data)
+            self.storage.write(self.key, self.data)
+        return new
+
+
+# 获取指定股票一段时间内的所有公告
+# --------------------------------------------------------------------
+def get_announcements(code, start_date=None, end_date=None):
+    """获取公告列表
+
+    :param code: str
+        股票代码，如：600122
+    :param start_date: str
+        开始时间，如："2017-08-10"，默认值为今日想前推三十天的日期
+    :param end_date: str
+        结束时间，如："2018-08-10"，默认值为今日日期
+    :return: announcements
+    """
+    params = _query_params(code, start_date, end_date)
     announcements = []
 
     while True:
         params['pageNum'] += 1
-        res = requests.post(url, data=params).json()
+        res = requests.post(URL_QUERY, data=params, timeout=TIMEOUT).json()
         for item in res['announcements']:
-            announcement = {
-                "url": "http://www.cninfo.com.cn/" + item['adjunctUrl'],
-                "title": item['announcementTitle'],
-                "date": datetime.fromtimestamp(
-                    item['announcementTime'] / 1000).date().__str__(),
-                "code": item['secCode'],
-                "name": item['secName']
-            }
-            announcements.append(announcement)
+            announcements.append(_parse_item(item))
         if not res['hasMore']:
             break
 
     return announcements
+
+
+# 异步接口
+# --------------------------------------------------------------------
+
+async def _fetch_announcements(client, code, start_date=None, end_date=None):
+    params = _query_params(code, start_date, end_date)
+    announcements = []
+    while True:
+        params['pageNum'] += 1
+        res = await client.post_json(URL_QUERY, data=_form(params))
+        for item in res['announcements']:
+            announcements.append(_parse_item(item))
+        if not res['hasMore']:
+            break
+    return announcements
+
+
+async def _fetch_many(client, codes, start_date, end_date):
+    tasks = [_fetch_announcements(client, code, start_date, end_date)
+             for code in codes]
+    results = await asyncio.gather(*tasks)
+    return [a for res in results for a in res]
+
+
+async def get_announcements_async(codes, start_date=None, end_date=None,
+                                  client=None):
+    """异步获取多只股票的公告列表，各股票并发请求
+
+    :param codes: str or list
+        股票代码，如：600122 或 ['600122', '000001']
+    :param start_date: str
+        开始时间，默认值为今日向前推三十天的日期
+    :param end_date: str
+        结束时间，默认值为今日日期
+    :param client: :class: `tma.collector.aio.AsyncClient` 默认值 None
+        异步HTTP客户端，默认创建一个临时客户端
+    :return: announcements list
+        字段同 `get_announcements`，按codes的顺序排列
+    """
+    if isinstance(codes, str):
+        codes = [codes]
+    return await _with_client(client, _fetch_many, codes, start_date, end_date)
+
+
+def get_announcements_many(codes, start_date=None, end_date=None):
+    """`get_announcements_async` 的同步版本"""
+    return run_sync(get_announcements_async(codes, start_date, end_date))
+
+
+async def _fetch_latest(client, url, params):
+    async def _page(num):
+        return await client.post_json(url, data=_form(dict(params, pageNum=num)))
+
+    first = await _page(1)
+    pages = [first]
+    n = _total_pages(first, params['pageSize'])
+    if first['hasMore'] and n is not None and n > 1:
+        pages.extend(await asyncio.gather(*[_page(i) for i in range(2, n + 1)]))
+    elif first['hasMore']:
+        num = 1
+        while pages[-1]['hasMore']:
+            num += 1
+            pages.append(await _page(num))
+    return _dedupe([a for res in pages for a in _latest_items(res)])
+
+
+async def get_sh_latest_async(client=None):
+    """异步获取上交所的最新公告列表"""
+    return await _with_client(client, _fetch_latest, URL_SH_LATEST,
+                              _latest_params("sh"))
+
+
+async def get_sz_latest_async(client=None):
+    """异步获取深交所的最新公告列表"""
+    return await _with_client(client, _fetch_latest, URL_SZ_LATEST,
+                              _latest_params("sz"))
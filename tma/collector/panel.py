@@ -0,0 +1,147 @@
+# -*- coding: UTF-8 -*-
+
+"""
+collector.panel - 全市场OHLCV面板数据
+
+把 `KlineStore` 中的长格式K线转换为 [n_dates x n_codes] 的 float32 矩阵，
+每个字段保存为一个 .npy 文件，以只读内存映射的方式打开。多个进程打开
+同一个面板时共享操作系统的页缓存，截面切片和时间序列切片都是零拷贝的视图。
+====================================================================
+"""
+import os
+import json
+import time
+import numpy as np
+
+import tma
+from tma.collector.store import KlineStore
+
+
+class OHLCVPanel(object):
+    """全市场OHLCV面板
+
+    :param k_freq: str 默认值 D
+        K线周期，可选值参考 `tma.collector.ts.get_klines`
+    :param path: str 默认值 None
+        面板目录，默认为 `DATA_PATH/panel/{k_freq}`
+
+    使用方法：
+        panel = OHLCVPanel.load("D")
+        panel.cross_section('close', '2018-08-03')  # 某一天所有股票的收盘价
+        panel.series('close', '600122')             # 某只股票的收盘价序列
+        panel.close[-20:]                           # 最近20根K线的收盘价矩阵
+    """
+    FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, k_freq="D", path=None):
+        self.k_freq = k_freq
+        if path is None:
+            path = self.default_path(k_freq)
+        self.path = path
+        file_meta = os.path.join(self.path, "_meta.json")
+        if not os.path.exists(file_meta):
+            raise FileNotFoundError("%s 不存在，请先调用 OHLCVPanel.build()"
+                                    % file_meta)
+        with open(file_meta, 'r') as f:
+            self.meta = json.load(f)
+        self.dates = np.load(os.path.join(self.path, "dates.npy"))
+        self.codes = np.load(os.path.join(self.path, "codes.npy"))
+        self.date_index = {d: i for i, d in enumerate(self.dates.tolist())}
+        self.code_index = {c: i for i, c in enumerate(self.codes.tolist())}
+        self._fields = {}
+
+    @staticmethod
+    def default_path(k_freq):
+        return os.path.join(tma.DATA_PATH, "panel", k_freq)
+
+    # 构建
+    # --------------------------------------------------------------------
+    @classmethod
+    def build(cls, k_freq="D", store=None, path=None):
+        """从 `KlineStore` 构建面板并保存为 .npy 文件"""
+        if store is None:
+            store = KlineStore(k_freq)
+        if path is None:
+            path = cls.default_path(k_freq)
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        kls = store.read_many(columns=['date', 'code'] + list(cls.FIELDS))
+        dates = np.unique(kls['date'].to_numpy().astype(str))
+        codes = np.unique(kls['code'].to_numpy().astype(str))
+        rows = np.searchsorted(dates, kls['date'].to_numpy().astype(str))
+        cols = np.searchsorted(codes, kls['code'].to_numpy().astype(str))
+
+        def _save(name, arr):
+            tmp = os.path.join(path, ".%s.npy.tmp" % name)
+            with open(tmp, 'wb') as f:
+                np.save(f, arr)
+            os.replace(tmp, os.path.join(path, "%s.npy" % name))
+
+        for field in cls.FIELDS:
+            arr = np.full((len(dates), len(codes)), np.nan, dtype=np.float32)
+            arr[rows, cols] = kls[field].to_numpy(dtype=np.float32)
+            _save(field, arr)
+        _save("dates", dates)
+        _save("codes", codes)
+        with open(os.path.join(path, "_meta.json"), 'w') as f:
+            json.dump({"k_freq": k_freq, "built": time.time(),
+                       "shape": [len(dates), len(codes)]}, f)
+        return cls(k_freq, path=path)
+
+    @classmethod
+    def load(cls, k_freq="D", store=None, path=None):
+        """打开面板；面板不存在或早于 `KlineStore` 的最后一次更新时重新构建"""
+        if path is None:
+            path = cls.default_path(k_freq)
+        if store is None:
+            store = KlineStore(k_freq)
+        file_meta = os.path.join(path, "_meta.json")
+        # 逐只更新的元信息先追加到 _meta.log，因此同时比较两者的修改时间
+        if not os.path.exists(file_meta) or os.path.getmtime(file_meta) <= store.mtime:
+            return cls.build(k_freq, store=store, path=path)
+        return cls(k_freq, path=path)
+
+    # 访问
+    # --------------------------------------------------------------------
+    @property
+    def shape(self):
+        return len(self.dates), len(self.codes)
+
+    def field(self, name):
+        """字段 name 的 [n_dates x n_codes] 只读内存映射矩阵"""
+        if name not in self.FIELDS:
+            raise ValueError("name 可选值为 %s，当前值为 '%s'"
+                             % (str(self.FIELDS), name))
+        if name not in self._fields:
+            self._fields[name] = np.load(os.path.join(self.path, "%s.npy" % name),
+                                         mmap_mode='r')
+        return self._fields[name]
+
+    open = property(lambda self: self.field('open'))
+    high = property(lambda self: self.field('high'))
+    low = property(lambda self: self.field('low'))
+    close = property(lambda self: self.field('close'))
+    volume = property(lambda self: self.field('volume'))
+
+    def cross_section(self, name, date):
+        """date日期所有股票的 name 字段（零拷贝视图），顺序同 `self.codes`"""
+        return self.field(name)[self.date_index[date]]
+
+    def series(self, name, code):
+        """code的 name 字段时间序列（零拷贝视图），顺序同 `self.dates`"""
+        return self.field(name)[:, self.code_index[code]]
+
+    def date_slice(self, start_date=None, end_date=None):
+        """日期区间 [start_date, end_date] 对应的行切片，可直接用于索引矩阵"""
+        start = 0 if start_date is None else \
+            int(np.searchsorted(self.dates, start_date, side='left'))
+        end = len(self.dates) if end_date is None else \
+            int(np.searchsorted(self.dates, end_date, side='right'))
+        return slice(start, end)
+
+    def to_frame(self, name):
+        """字段 name 转换为 `pd.DataFrame`，index为日期，columns为股票代码"""
+        import pandas as pd
+        return pd.DataFrame(self.field(name), index=self.dates,
+                            columns=self.codes, copy=False)
@@ -0,0 +1,199 @@
+# -*- coding: UTF-8 -*-
+
+"""
+collector.quotes - 批量实时行情
+====================================================================
+"""
+import re
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from retrying import retry
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+# 新浪实时行情接口，单次请求最多800只股票
+HQ_URL = "http://hq.sinajs.cn/rn=%s&list=%s"
+HQ_HEADERS = {
+    "Host": "hq.sinajs.cn",
+    "Referer": "https://finance.sina.com.cn/",
+}
+SHARD_SIZE = 800
+
+# 字段与 tushare.get_realtime_quotes 一致
+QUOTE_COLUMNS = [
+    'name', 'open', 'pre_close', 'price', 'high', 'low', 'bid', 'ask',
+    'volume', 'amount', 'b1_v', 'b1_p', 'b2_v', 'b2_p', 'b3_v', 'b3_p',
+    'b4_v', 'b4_p', 'b5_v', 'b5_p', 'a1_v', 'a1_p', 'a2_v', 'a2_p',
+    'a3_v', 'a3_p', 'a4_v', 'a4_p', 'a5_v', 'a5_p', 'date', 'time',
+]
+STR_COLUMNS = ('name', 'date', 'time', 'code')
+FLOAT_COLUMNS = [c for c in QUOTE_COLUMNS if c not in STR_COLUMNS]
+# 委买/委卖量的单位转换为手
+LOT_COLUMNS = [c for c in QUOTE_COLUMNS if c.endswith('_v')]
+
+_RE_QUOTE = re.compile(r'hq_str_(?:sh|sz|bj)(\w+?)="(.*?)";')
+
+# tushare 中的指数简称，同 `tushare.stock.cons.INDEX_LIST`
+INDEX_SYMBOLS = {
+    'sh': 'sh000001', 'sz': 'sz399001', 'hs300': 'sh000300', 'sz50': 'sh000016',
+    'zxb': 'sz399005', 'cyb': 'sz399006', 'zx300': 'sz399008', 'zh500': 'sh000905',
+}
+
+
+def code_to_symbol(code):
+    """股票代码转换为新浪行情的代码，如 600122 -> sh600122、hs300 -> sh000300"""
+    code = str(code)
+    if code in INDEX_SYMBOLS:
+        return INDEX_SYMBOLS[code]
+    if code[:2] in ('sh', 'sz', 'bj'):
+        return code
+    return ('sh' if code[0] in '569' else 'sz') + code
+
+
+def parse_quotes(text, raw=False):
+    """解析新浪实时行情接口的返回内容
+
+    :param text: str
+    :param raw: bool 默认值 False
+        是否保留接口返回的字符串，与 `tushare.get_realtime_quotes` 的输出一致
+    :return: :class: `pd.DataFrame`
+        字段同 `tushare.get_realtime_quotes`，除 name、date、time、code
+        外均已转换为 float（raw为True时全部为字符串）；委买/委卖量的单位为手；
+        停牌或不存在的股票不在结果中
+    """
+    rows, codes = [], []
+    n = len(QUOTE_COLUMNS)
+    for code, row in _RE_QUOTE.findall(text):
+        values = row.split(',')
+        if len(values) < n:
+            continue
+        rows.append(values[:n])
+        codes.append(code)
+
+    cols = np.array(rows, dtype=object).reshape(len(rows), n).T
+    data = {}
+    for col, values in zip(QUOTE_COLUMNS, cols):
+        if raw and col in LOT_COLUMNS:
+            data[col] = np.array([x[:-2] for x in values], dtype=object)
+            continue
+        if raw or col in STR_COLUMNS:
+            data[col] = values
+            continue
+        try:
+            data[col] = values.astype(np.float64)
+        except ValueError:
+            data[col] = pd.to_numeric(values, errors='coerce').astype(np.float64)
+        if col in LOT_COLUMNS:
+            data[col] = np.floor(data[col] / 100)
+    data['code'] = np.array(codes, dtype=object)
+    return pd.DataFrame(data, columns=QUOTE_COLUMNS + ['code'])
+
+
+class QuoteBatcher(object):
+    """批量实时行情获取器
+
+    任意数量的股票代码自动切分为不超过 shard_size 的分片，各分片在线程池中
+    并发请求；每个工作线程持有一个 requests.Session，复用TCP连接。
+
+    :param workers: int 默认值 4
+        并发请求的线程数量
+    :param shard_size: int 默认值 800
+        单次请求的最大股票数量
+    :param timeout: float 默认值 10
+        单次请求的超时时间（单位：s）
+    :param retries: int 默认值 3
+        单个分片的最大尝试次数
+
+    使用方法：
+        batcher = QuoteBatcher()
+        quotes = batcher.fetch(['600122', '000001', ...])
+    """
+
+    def __init__(self, workers=4, shard_size=SHARD_SIZE, timeout=10, retries=3):
+        self.workers = max(1, int(workers))
+        self.shard_size = min(int(shard_size), SHARD_SIZE)
+        self.timeout = timeout
+        self.retries = retries
+        self._local = threading.local()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """当前线程的 requests.Session"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(HQ_HEADERS)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+        return session
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def shards(self, codes):
+        """去重后按 shard_size 切分"""
+        codes = list(dict.fromkeys(str(c) for c in codes))
+        return [codes[i: i + self.shard_size]
+                for i in range(0, len(codes), self.shard_size)]
+
+    def _fetch_shard(self, codes, raw=False):
+        url = HQ_URL % (random.random(), ",".join(code_to_symbol(c) for c in codes))
+        response = self.session.get(url, timeout=self.timeout)
+        response.encoding = 'GBK'
+        return parse_quotes(response.text, raw)
+
+    def fetch(self, codes, raw=False):
+        """获取codes的实时行情
+
+        :param codes: str or list
+            股票代码，也可以是 INDEX_SYMBOLS 中的指数简称
+        :param raw: bool 默认值 False
+            参考 `parse_quotes`
+        :return: :class: `pd.DataFrame`
+            字段同 `parse_quotes`，顺序同codes（已去重）
+        """
+        if isinstance(codes, str):
+            codes = [codes]
+        fetch_shard = retry(stop_max_attempt_number=self.retries,
+                            wait_exponential_multiplier=200,
+                            wait_exponential_max=2000)(self._fetch_shard)
+        shards = self.shards(codes)
+        if len(shards) == 0:
+            return parse_quotes("", raw)
+        if len(shards) == 1:
+            return fetch_shard(shards[0], raw)
+        results = list(self.executor.map(lambda shard: fetch_shard(shard, raw), shards))
+        return pd.concat(results, ignore_index=True)
+
+    __call__ = fetch
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+_batcher = None
+
+
+def get_quotes(codes, raw=False):
+    """获取任意数量股票的实时行情，参考 `QuoteBatcher.fetch`"""
+    global _batcher
+    if _batcher is None:
+        _batcher = QuoteBatcher()
+    return _batcher.fetch(codes, raw)
+
+
+quotes = get_quotes
@@ -10,11 +10,12 @@ collector.sse - 采集上海证券交易所的数据
 import requests
 import pandas as pd
 
+from tma.collector.aio import _with_client
 
-def get_sh_indexes():
-    """获取上海证券交易所所有指数的实时行情"""
-    url = "http://www.sse.com.cn/js/common/indexQuotes.js"
-    res = requests.get(url).text
+URL_SH_INDEXES = "http://www.sse.com.cn/js/common/indexQuotes.js"
+
+
+def _parse_sh_indexes(res):
     lines = res.split("\n")
     lines = [x.replace('_t.push(', "").strip(");'") for x in lines if "_t.push(" in x]
     lines = [
@@ -38,3 +39,21 @@ def get_sh_indexes():
 
     # index_sh.astype()
     return index_sh
+
+
+def get_sh_indexes():
+    """获取上海证券交易所所有指数的实时行情"""
+    res = requests.get(URL_SH_INDEXES).text
+    return _parse_sh_indexes(res)
+
+
+async def get_sh_indexes_async(client=None):
+    """`get_sh_indexes` 的异步版本
+
+    :param client: :class: `tma.collector.aio.AsyncClient` 默认值 None
+        异步HTTP客户端，默认创建一个临时客户端
+    """
+    async def _fetch(client):
+        return _parse_sh_indexes(await client.get_text(URL_SH_INDEXES))
+
+    return await _with_client(client, _fetch)
@@ -0,0 +1,191 @@
+# -*- coding: UTF-8 -*-
+
+"""
+collector.store - K线本地存储
+
+每只股票、每个K线周期单独保存一个文件（格式由 `tma.storage` 决定），
+并记录最后一根K线的日期，刷新时只请求缺失的K线。
+====================================================================
+"""
+import os
+import json
+import threading
+import pandas as pd
+
+from tma.storage import get_storage
+from tma.collector.ts import get_klines
+
+
+class KlineStore(object):
+    """按股票代码、K线周期分别存储的K线库
+
+    存储键为 `klines/{k_freq}/{code}`，同一目录下的 `_meta.json` 中记录
+    每只股票的最后一根K线日期（last_date），以及用于检测复权价格改写的
+    校验K线（倒数第二根K线的日期 check_date 和收盘价 check_close）。
+    每次写入K线后，该股票的元信息立即追加到 `_meta.log`，读取元信息时
+    在 `_meta.json` 的基础上重放，`save_meta` 时合并；因此批量更新中断时，
+    已写入的K线不会丢失元信息。
+
+    增量更新时从 check_date 开始请求K线：如果校验K线的收盘价与本地
+    记录一致，用新K线替换 check_date 之后的部分（最后一根K线可能是
+    盘中未完成的K线）；否则说明复权价格被改写，重新获取该股票的全部K线。
+
+    :param k_freq: str 默认值 D
+        K线周期，可选值参考 `tma.collector.ts.get_klines`
+    :param storage: :class: `tma.storage.BaseStorage` 默认值 get_storage()
+        存储后端
+    :param tolerance: float 默认值 0.0005
+        校验K线收盘价允许的误差
+    """
+
+    def __init__(self, k_freq="D", storage=None, tolerance=0.0005):
+        self.k_freq = k_freq
+        self.storage = storage if storage is not None else get_storage()
+        self.prefix = "klines/%s" % k_freq
+        self.path = os.path.join(self.storage.root, self.prefix)
+        os.makedirs(self.path, exist_ok=True)
+        self.tolerance = tolerance
+        self.file_meta = os.path.join(self.path, "_meta.json")
+        self.file_journal = os.path.join(self.path, "_meta.log")
+        self._lock = threading.Lock()
+        self.meta = self._read_meta()
+
+    # 元信息
+    # --------------------------------------------------------------------
+    def _read_meta(self):
+        meta = {}
+        if os.path.exists(self.file_meta):
+            with open(self.file_meta, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        if os.path.exists(self.file_journal):
+            valid = 0
+            with open(self.file_journal, 'rb') as f:
+                for line in f:
+                    try:
+                        code, entry = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        # 中断时可能留下不完整的最后一行
+                        break
+                    meta[code] = entry
+                    valid += len(line)
+            if valid < os.path.getsize(self.file_journal):
+                # 截掉不完整的部分，之后追加的记录才能从新的一行开始
+                with open(self.file_journal, 'r+b') as f:
+                    f.truncate(valid)
+        return meta
+
+    def _journal(self, code, entry):
+        with open(self.file_journal, 'a', encoding='utf-8') as f:
+            f.write(json.dumps([code, entry]) + "\n")
+
+    def save_meta(self):
+        """把元信息合并保存到 `_meta.json`；批量更新结束后调用一次即可"""
+        with self._lock:
+            with open(self.file_meta + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(self.meta, f)
+            os.replace(self.file_meta + ".tmp", self.file_meta)
+            if os.path.exists(self.file_journal):
+                os.remove(self.file_journal)
+
+    @property
+    def mtime(self):
+        """元信息的最后修改时间（`_meta.json` 和 `_meta.log` 中较晚的一个），
+        没有元信息时返回0"""
+        return max([os.path.getmtime(path) for path in (self.file_meta, self.file_journal)
+                    if os.path.exists(path)] or [0])
+
+    @property
+    def codes(self):
+        return sorted(self.meta.keys())
+
+    def last_date(self, code):
+        """code最后一根K线的日期，本地没有数据时返回None"""
+        meta = self.meta.get(code)
+        return meta['last_date'] if meta else None
+
+    # 读写
+    # --------------------------------------------------------------------
+    def _key(self, code):
+        return "%s/%s" % (self.prefix, code)
+
+    def read(self, code, columns=None, filters=None):
+        """读取单只股票的K线，参数参考 `tma.storage.BaseStorage.read`"""
+        return self.storage.read(self._key(code), columns=columns,
+                                 filters=filters)
+
+    def read_many(self, codes=None, columns=None, filters=None):
+        """读取多只股票的K线，codes为None时读取全部
+
+        如：读取两只股票2018年以来的收盘价
+        store.read_many(['600122', '000001'], columns=['date', 'code', 'close'],
+                        filters=[('date', '>=', '2018-01-01')])
+        """
+        if codes is None:
+            codes = self.codes
+        keys = [self._key(code) for code in codes if code in self.meta]
+        return self.storage.read_many(keys, columns=columns, filters=filters)
+
+    def write(self, code, kls):
+        """覆盖写入单只股票的K线，并更新元信息"""
+        kls = kls.sort_values('date').reset_index(drop=True)
+        self.storage.write(self._key(code), kls)
+        check = kls.iloc[-2] if len(kls) > 1 else kls.iloc[-1]
+        entry = {
+            "last_date": str(kls['date'].iloc[-1]),
+            "check_date": str(check['date']),
+            "check_close": float(check['close']),
+        }
+        with self._lock:
+            self.meta[code] = entry
+            self._journal(code, entry)
+        return kls
+
+    def import_frame(self, df):
+        """导入长格式的全市场K线（如旧版的 market_klines_{k_freq}.csv）"""
+        for code, kls in df.groupby('code'):
+            if len(kls) > 0:
+                self.write(code, kls)
+        self.save_meta()
+
+    # 增量更新
+    # --------------------------------------------------------------------
+    def update(self, code, fetch=None, full=False):
+        """更新单只股票的K线，只请求本地缺失的部分
+
+        :param code: str
+            股票代码
+        :param fetch: callable 默认值 get_klines
+            K线获取函数，签名同 `get_klines(code, freq, start_date)`
+        :param full: bool 默认值 False
+            是否强制重新获取全部K线
+        :return: :class: `pd.DataFrame`
+            更新后code的全部K线
+        """
+        if fetch is None:
+            fetch = get_klines
+        meta = self.meta.get(code)
+        if full or meta is None or not self.storage.exists(self._key(code)):
+            return self._fetch_full(code, fetch)
+
+        new = fetch(code, freq=self.k_freq, start_date=meta['check_date'][:10])
+        if new is None or len(new) == 0:
+            return self.read(code)
+
+        check = new.loc[new['date'] == meta['check_date'], 'close']
+        if len(check) == 0 or \
+                abs(float(check.iloc[0]) - meta['check_close']) > self.tolerance:
+            # 复权价格被改写，重新获取该股票的全部K线
+            return self._fetch_full(code, fetch)
+
+        old = self.read(code)
+        first = new['date'].iloc[0]
+        kls = pd.concat([old[old['date'] < first], new], ignore_index=True)
+        return self.write(code, kls)
+
+    def _fetch_full(self, code, fetch):
+        kls = fetch(code, freq=self.k_freq)
+        if kls is None:
+            raise ValueError("%s 的K线获取结果为 None" % code)
+        if len(kls) == 0:
+            return kls
+        return self.write(code, kls)
@@ -7,8 +7,15 @@ collector.szse - 采集深圳证券交易所的数据
 ====================================================================
 """
 
+import io
+import asyncio
 import pandas as pd
 
+from tma.collector.aio import _with_client
+
+URL_INDEX_SHARES = "http://www.szse.cn/api/report/ShowReport?" \
+                   "SHOWTYPE=xlsx&CATALOGID=1747_zs&TABKEY=tab1&ZSDM={code}"
+
 
 #
 # --------------------------------------------------------------------
@@ -26,8 +33,30 @@ def get_index_shares(code):
     “计算标志”为1时，表示该样本的成交量、成交金额纳入指数的成交量、成交金额，
     同时也纳入指数点位的计算。
     """
-    excel_url = "http://www.szse.cn/api/report/ShowReport?" \
-                "SHOWTYPE=xlsx&CATALOGID=1747_zs&TABKEY=" \
-                "tab1&ZSDM={code}".format(code=code)
+    excel_url = URL_INDEX_SHARES.format(code=code)
     shares = pd.read_excel(excel_url, dtype={"证券代码": str})
     return shares
+
+
+async def _fetch_index_shares(client, codes):
+    async def _one(code):
+        content = await client.get_bytes(URL_INDEX_SHARES.format(code=code))
+        return pd.read_excel(io.BytesIO(content), dtype={"证券代码": str})
+
+    return await asyncio.gather(*[_one(code) for code in codes])
+
+
+async def get_index_shares_async(codes, client=None):
+    """异步获取多个指数的样本股列表，各指数并发请求
+
+    :param codes: str or list
+        指数代码，如：399678 或 ['399678', '399006']
+    :param client: :class: `tma.collector.aio.AsyncClient` 默认值 None
+        异步HTTP客户端，默认创建一个临时客户端
+    :return: dict
+        {指数代码: 样本股列表}，样本股列表同 `get_index_shares`
+    """
+    if isinstance(codes, str):
+        codes = [codes]
+    shares = await _with_client(client, _fetch_index_shares, codes)
+    return dict(zip(codes, shares))
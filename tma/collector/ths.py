@@ -5,16 +5,25 @@ collector.ths - 采集同花顺数据
 
 官网：http://www.10jqka.com.cn
 数据中心：http://data.10jqka.com.cn/
+
+异步接口（*_async）与同步接口共用解析函数；资金流、板块行情需要渲染
+JavaScript（requests_html），没有异步版本。
 ====================================================================
 """
 
+import asyncio
 import requests
 from bs4 import BeautifulSoup
-from requests_html import HTMLSession
 from zb.crawlers.utils import get_header
 import re
 import pandas as pd
 
+from tma.collector.aio import _with_client
+
+URL_ZAO_PAN = "http://stock.10jqka.com.cn/zaopan/"
+URL_PLATES = "http://q.10jqka.com.cn/%s/"
+URL_F10 = "http://basic.10jqka.com.cn/{code}/"
+
 
 headers = {'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
            'Accept-Encoding': 'gzip, deflate',
@@ -34,12 +43,30 @@ def http_requests(url):
                          % str(response.status_code))
 
 
+async def http_requests_async(url, client):
+    """`http_requests` 的异步版本，状态码不是200时由client抛出异常"""
+    return BeautifulSoup(await client.get_text(url, headers=get_header()), 'lxml')
+
+
 def zao_pan():
     """获取同花顺早盘必读信息"""
-    url = "http://stock.10jqka.com.cn/zaopan/"
-    response = requests.get(url, headers=get_header())
-    html = BeautifulSoup(response.text, 'lxml')
+    response = requests.get(URL_ZAO_PAN, headers=get_header())
+    return _parse_zao_pan(BeautifulSoup(response.text, 'lxml'))
+
+
+async def zao_pan_async(client=None):
+    """`zao_pan` 的异步版本
 
+    :param client: :class: `tma.collector.aio.AsyncClient` 默认值 None
+        异步HTTP客户端，默认创建一个临时客户端
+    """
+    async def _fetch(client):
+        return _parse_zao_pan(await http_requests_async(URL_ZAO_PAN, client))
+
+    return await _with_client(client, _fetch)
+
+
+def _parse_zao_pan(html):
     # 名人名言
     wisdom = html.find('div', {'class': "select-content"}).text.strip()
 
@@ -58,39 +85,58 @@ def zao_pan():
 
 # 板块数据
 # --------------------------------------------------------------------
+PLATE_KINDS = {
+    'gn': "概念板块",
+    'dy': "地域板块",
+    'thshy': "同花顺行业",
+    'zjhhy': "证监会行业"
+}
+
+
+def _parse_plates(text, kind):
+    html = BeautifulSoup(text, "lxml")
+    results = html.find("div", {"class": "category boxShadow m_links"}).find_all("a")
+    plates = []
+    for a in results:
+        url = a['href']
+        plates.append({
+            "name": a.text,
+            "code": url.strip("/").split('/')[-1],
+            "url": url,
+            "kind": PLATE_KINDS[kind]
+        })
+    return plates
+
+
 def get_ths_plates():
     """获取同花顺所有概念列表
 
     :return: pd.DataFrame
         ['code', 'kind', 'name', 'url']
     """
-    plate_kinds = {
-        'gn': "概念板块",
-        'dy': "地域板块",
-        'thshy': "同花顺行业",
-        'zjhhy': "证监会行业"
-    }
     plates = []
-    for kind in plate_kinds.keys():
-        url = "http://q.10jqka.com.cn/%s/" % kind
-        response = requests.get(url, headers=headers)
-        html = BeautifulSoup(response.text, "lxml")
-
-        results = html.find("div", {"class": "category boxShadow m_links"}).find_all("a")
-
-        for a in results:
-            url = a['href']
-            plate = {
-                "name": a.text,
-                "code": url.strip("/").split('/')[-1],
-                "url": url,
-                "kind": plate_kinds[kind]
-            }
-            plates.append(plate)
-
+    for kind in PLATE_KINDS.keys():
+        response = requests.get(URL_PLATES % kind, headers=headers)
+        plates.extend(_parse_plates(response.text, kind))
     return pd.DataFrame(plates)
 
 
+async def get_ths_plates_async(client=None):
+    """`get_ths_plates` 的异步版本，各板块类型并发请求
+
+    :param client: :class: `tma.collector.aio.AsyncClient` 默认值 None
+        异步HTTP客户端，默认创建一个临时客户端
+    """
+    async def _fetch(client):
+        kinds = list(PLATE_KINDS.keys())
+        texts = await asyncio.gather(*[client.get_text(URL_PLATES % kind, headers=headers)
+                                       for kind in kinds])
+        return pd.DataFrame([p for text, kind in zip(texts, kinds)
+                             for p in _parse_plates(text, kind)])
+
+    return await _with_client(client, _fetch)
+
+
 def get_plate_fund_flow(kind):
     """获取同花顺最新的行业/概念资金流
 
@@ -109,6 +155,8 @@ def get_plate_fund_flow(kind):
     url_template = "http://data.10jqka.com.cn/funds/{kind}/field/" \
                    "tradezdf/order/desc/page/{page}/ajax/1/"
 
+    from requests_html import HTMLSession
+
     i = 1
     results = []
     session = HTMLSession()
@@ -157,6 +205,8 @@ def get_plate_shares(plate_code, kind='gn'):
     if kind not in kind_values:
         raise ValueError("kind参数的取值必须在 %s 中" % kind_values)
 
+    from requests_html import HTMLSession
+
     i = 1
     results = []
     session = HTMLSession()
@@ -192,8 +242,7 @@ def get_plate_shares(plate_code, kind='gn'):
 class ThsF10(object):
     def __init__(self, code):
         self.code = code
-        self.base_url = "http://basic.10jqka.com.cn/" \
-                        "{code}/".format(code=code)
+        self.base_url = URL_F10.format(code=code)
 
     def get_company_info(self):
         """
@@ -202,10 +251,18 @@ class ThsF10(object):
 
         :return:
         """
-        base_url = self.base_url
-        url = base_url + "company.html"
-        html = http_requests(url)
+        return self._parse_company_info(http_requests(self.base_url + "company.html"))
+
+    async def get_company_info_async(self, client=None):
+        """`get_company_info` 的异步版本"""
+        async def _fetch(client):
+            html = await http_requests_async(self.base_url + "company.html", client)
+            return self._parse_company_info(html)
 
+        return await _with_client(client, _fetch)
+
+    @staticmethod
+    def _parse_company_info(html):
         # 公司基本资料
         table1 = html.find('table', {"class": "m_table"})
         table1_info = [x for x in table1.text.strip().split('\n')
@@ -238,10 +295,18 @@ class ThsF10(object):
         }
 
     def get_concept_info(self):
-        base_url = self.base_url
-        url = base_url + "concept.html"
-        html = http_requests(url)
+        return self._parse_concept_info(http_requests(self.base_url + "concept.html"))
+
+    async def get_concept_info_async(self, client=None):
+        """`get_concept_info` 的异步版本"""
+        async def _fetch(client):
+            html = await http_requests_async(self.base_url + "concept.html", client)
+            return self._parse_concept_info(html)
+
+        return await _with_client(client, _fetch)
 
+    @staticmethod
+    def _parse_concept_info(html):
         def _clear(data):
             # 清理多余的数据
             while 1:
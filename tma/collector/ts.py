@@ -13,6 +13,9 @@ import pandas as pd
 import tushare as ts
 
 from tma import DATA_PATH
+from tma.storage import get_storage
+from tma.collector.cache import quote_cache
+from tma.collector.quotes import get_quotes, code_to_symbol, INDEX_SYMBOLS, QUOTE_COLUMNS
 
 TS_PRO_API = "http://api.tushare.pro"
 FILE_TOKEN = os.path.join(DATA_PATH, "tushare_pro.token")
@@ -23,27 +26,22 @@ def set_token(token):
         f.write(token)
 
 
-def query_pro(api_name, fields='', **kwargs):
-    """通过 tushare pro api 获取数据
-
-    :param api_name: str
-    :param fields: list
-    :return: pd.DataFrame
-    """
+def _pro_request(api_name, fields, params):
     if not os.path.exists(FILE_TOKEN):
         raise EnvironmentError("%s 文件不存在，请先调用"
                                "set_token()配置token" % FILE_TOKEN)
     with open(FILE_TOKEN, 'r') as f:
         token = f.readline()
 
-    req_params = {
+    return {
         'api_name': api_name,
         'token': token,
-        'params': kwargs,
+        'params': params,
         'fields': fields
     }
 
-    result = requests.post(TS_PRO_API, json=req_params).json()
+
+def _pro_result(result):
     if result['code'] != 0:
         raise Exception(result['msg'])
     else:
@@ -53,24 +51,63 @@ def query_pro(api_name, fields='', **kwargs):
         return pd.DataFrame(items, columns=columns)
 
 
+def query_pro(api_name, fields='', **kwargs):
+    """通过 tushare pro api 获取数据
+
+    :param api_name: str
+    :param fields: list
+    :return: pd.DataFrame
+    """
+    req_params = _pro_request(api_name, fields, kwargs)
+    result = requests.post(TS_PRO_API, json=req_params).json()
+    return _pro_result(result)
+
+
+async def query_pro_async(api_name, fields='', client=None, **kwargs):
+    """`query_pro` 的异步版本
+
+    :param client: :class: `tma.collector.aio.AsyncClient` 默认值 None
+        异步HTTP客户端，默认创建一个临时客户端
+    """
+    from tma.collector.aio import _with_client
+
+    async def _query(client):
+        req_params = _pro_request(api_name, fields, kwargs)
+        return _pro_result(await client.post_json(TS_PRO_API, json=req_params))
+
+    return await _with_client(client, _query)
+
+
 # --------------------------------------------------------------------
 
 def get_market_basic(cache=True, use_cache=False):
-    """返回A股所有股票的基础信息"""
-    FILE_BASIC = os.path.join(DATA_PATH, "market_basic.csv")
+    """返回A股所有股票的基础信息
+
+    use_cache 为 True 时优先使用进程内缓存（`quote_cache` 中的 basics），
+    其次使用本地缓存文件
+    """
+    if use_cache:
+        basic_df = quote_cache.get("basics", "all",
+                                   lambda: _get_market_basic(cache, True))
+        return basic_df.copy()
+    basic_df = _get_market_basic(cache, False)
+    quote_cache.put("basics", "all", basic_df)
+    return basic_df.copy()
+
+
+def _get_market_basic(cache, use_cache):
+    KEY_BASIC = "market_basic"
+    storage = get_storage()
 
-    if os.path.exists(FILE_BASIC):
-        now_t = time.time()
-        modify_t = os.path.getmtime(FILE_BASIC)
-        if use_cache and now_t - modify_t < 3600 * 12:
-            basic_df = pd.read_csv(FILE_BASIC, dtype={"code": str})
-            return basic_df
+    modify_t = storage.mtime(KEY_BASIC)
+    if use_cache and modify_t and time.time() - modify_t < 3600 * 12:
+        return storage.read(KEY_BASIC)
 
     basic_df = ts.get_stock_basics()
     basic_df.reset_index(inplace=True)
     basic_df['code'] = basic_df['code'].astype(str)
     if cache:
-        basic_df.to_csv(FILE_BASIC, encoding='utf-8', index=False)
+        storage.write(KEY_BASIC, basic_df)
     return basic_df
 
 
@@ -82,19 +119,30 @@ def get_all_codes():
 
 # --------------------------------------------------------------------
 
-def get_indices():
-    """指数行情接口"""
-    return ts.get_index()
+def get_indices(use_cache=False):
+    """指数行情接口
+
+    :param use_cache: bool 默认值 False
+        是否使用进程内缓存（`quote_cache` 中的 indices，有效期默认60s）；
+        为False时总是重新请求，并用结果刷新缓存
+    """
+    if not use_cache:
+        indices = ts.get_index()
+        quote_cache.put("indices", "all", indices)
+        return indices.copy()
+    return quote_cache.get("indices", "all", ts.get_index).copy()
 
 
-def get_price(code):
+def get_price(code, use_cache=False):
     """获取一只股票的最新价格
 
     :param code: str
         股票代码，如：600122
+    :param use_cache: bool 默认值 False
+        是否使用进程内缓存，参考 `get_bars`
     :return: float
     """
-    data = ts.get_realtime_quotes(code)
+    data = get_bars(code, use_cache=use_cache)
     return float(data.loc[0, 'price'])
 
 
@@ -144,9 +192,46 @@ def get_ticks(code, source="spider", date=None, cons=None):
 ticks = get_ticks
 
 
-def get_bars(codes):
-    """获取codes的实时quotes"""
-    return ts.get_realtime_quotes(codes)
+def get_bars(codes, use_cache=False):
+    """获取codes的实时quotes
+
+    :param codes: str or list
+        股票代码，也可以是tushare中的指数简称，如 sh、sz、hs300、sz50、zxb、cyb
+    :param use_cache: bool 默认值 False
+        是否使用进程内缓存（`quote_cache` 中的 bars，有效期默认3s）；只有
+        未缓存或已过期的股票才会通过 `get_quotes` 批量请求。为False时总是
+        重新请求，并用结果刷新缓存
+    :return: pd.DataFrame
+        字段同 `get_quotes`，与 `tushare.get_realtime_quotes` 一样全部为字符串；
+        需要float字段时请直接使用 `get_quotes`
+    """
+    if isinstance(codes, str):
+        codes = [codes]
+    codes = [str(c) for c in codes]
+    if not use_cache:
+        rows = _load_bars(codes)
+        for code, row in rows.items():
+            quote_cache.put("bars", code, row)
+    else:
+        rows = quote_cache.get_many("bars", codes, _load_bars)
+    records = [rows[c] for c in dict.fromkeys(codes) if rows.get(c) is not None]
+    return pd.DataFrame.from_records(records, columns=QUOTE_COLUMNS + ['code'])
+
+
+def _load_bars(codes):
+    # 指数简称单独请求：返回的code为指数代码，如 sh -> 000001，会与股票代码重复
+    rows = {}
+    for group in ([c for c in codes if c not in INDEX_SYMBOLS],
+                  [c for c in codes if c in INDEX_SYMBOLS]):
+        if not group:
+            continue
+        quotes = get_quotes(group, raw=True)
+        got = dict(zip(quotes['code'], quotes.itertuples(index=False, name=None)))
+        for code in group:
+            row = got.get(code_to_symbol(code)[2:])
+            if row is not None:
+                rows[code] = row
+    return rows
 
 
 bars = get_bars
@@ -202,7 +287,7 @@ def filter_st(tm):
 
 
 def get_today_market(filters=None, save=True,
-                     use_latest=False, interval=600):
+                     use_latest=False, interval=600, use_cache=False):
     """返回最近一个交易日所有股票的交易数据
 
     :param filters: list 默认为 ['tp']
@@ -214,28 +299,35 @@ def get_today_market(filters=None, save=True,
     :param interval: int 默认 600
         更新行情的最小间隔（单位：s），即：如果DATA_PATH路径下的latest_market的修改时间
         与当前时间的间隔小于interval设定的数值，且use_latest为True，
-        将使用latest_market.csv中的行情
+        将使用latest_market缓存中的行情
+    :param use_cache: bool 默认为 False
+        是否使用进程内缓存（`quote_cache` 中的 market，有效期默认30s），
+        同一轮播报中的多个指标可以共用一次全市场行情请求；为False时总是
+        重新请求，并用结果刷新缓存
     :return: pd.DataFrame
         最新的市场行情
     """
     if filters is None:
         filters = ['tp']
-    tm_csv = os.path.join(DATA_PATH, 'latest_market.csv')
-    if use_latest and os.path.exists(tm_csv) \
-            and time.time() - os.path.getmtime(tm_csv) < interval:
-        tm = pd.read_csv(tm_csv, encoding='utf-8')
-        return tm
-
-    tm = ts.get_today_all()
-    if filters is None:
-        return tm
+    KEY_LATEST = 'latest_market'
+    storage = get_storage()
+    modify_t = storage.mtime(KEY_LATEST)
+    if use_latest and modify_t and time.time() - modify_t < interval:
+        return storage.read(KEY_LATEST)
+
+    if use_cache:
+        tm = quote_cache.get("market", "all", ts.get_today_all).copy()
+    else:
+        tm = ts.get_today_all()
+        quote_cache.put("market", "all", tm)
+        tm = tm.copy()
     filters = [x.lower() for x in filters]
     if "tp" in filters:
         tm = filter_tp(tm)
     if "st" in filters:
         tm = filter_st(tm)
     if save:
-        tm.to_csv(tm_csv, index=False, encoding='utf-8')
+        storage.write(KEY_LATEST, tm)
     return tm
 
 
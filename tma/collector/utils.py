@@ -1,10 +1,81 @@
 # -*- coding: UTF-8 -*-
 
+import os
+import time
+import threading
 import requests
 
 
-def save_pdf(url, pdf_name):
-    response = requests.get(url)
-    with open(pdf_name, "wb") as pdf:
-        for content in response.iter_content():
-            pdf.write(content)
+def save_pdf(url, pdf_name, chunk_size=1 << 16, session=None, timeout=30):
+    """下载文件并保存为pdf_name
+
+    以流的方式按 chunk_size 字节分块写入，先写临时文件，下载完成后再
+    重命名，中断时不会留下不完整的文件。
+
+    :param url: str
+    :param pdf_name: str
+        保存路径
+    :param chunk_size: int 默认值 64KB
+    :param session: requests.Session 默认值 None
+    :param timeout: float 默认值 30
+    """
+    getter = session.get if session is not None else requests.get
+    tmp = pdf_name + ".tmp"
+    with getter(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        with open(tmp, "wb") as pdf:
+            for content in response.iter_content(chunk_size=chunk_size):
+                pdf.write(content)
+    os.replace(tmp, pdf_name)
+    return pdf_name
+
+
+# 限流
+# --------------------------------------------------------------------
+
+class TokenBucket(object):
+    """令牌桶限流器（线程安全）
+
+    :param rate: float
+        每秒生成的令牌数量，即长期平均的请求速率，必须大于0
+    :param capacity: int 默认值 None
+        令牌桶容量，即允许的突发请求数量；默认为 max(1, rate)
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = self._check_rate(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.timestamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _check_rate(rate):
+        rate = float(rate)
+        if not rate > 0:
+            raise ValueError("rate 必须大于0，当前值为 %s" % rate)
+        return rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.timestamp) * self.rate)
+        self.timestamp = now
+
+    def set_rate(self, rate):
+        """调整令牌生成速率"""
+        rate = self._check_rate(rate)
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def acquire(self, tokens=1):
+        """获取tokens个令牌，令牌不足时阻塞等待"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
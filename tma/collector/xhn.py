@@ -11,9 +11,12 @@ http://qc.wa.news.cn/nodeart/list?nid=115093&pgnum=1&cnt=10000
 
 新华全媒体头条
 http://www.xinhuanet.com/politics/qmtt/index.htm
+
+异步接口（*_async）与同步接口共用解析函数，多篇文章并发请求。
 ====================================================================
 """
 
+import asyncio
 import requests
 import re
 from datetime import datetime
@@ -24,8 +27,10 @@ import pandas as pd
 from tqdm import tqdm
 
 import tma
+from tma.collector.aio import _with_client
 
 home_url = "http://www.xinhuanet.com/"
+URL_SPECIAL_TOPICS = "http://qc.wa.news.cn/nodeart/list?nid=115093&pgnum=%s&cnt=200"
 
 
 def get_website_map():
@@ -38,9 +43,23 @@ def get_website_map():
 
 def get_special_topics(pgnum=1):
     """获取专题列表"""
-    url = "http://qc.wa.news.cn/nodeart/list?" \
-          "nid=115093&pgnum=%s&cnt=200" % str(pgnum)
-    res = requests.get(url).text
+    res = requests.get(URL_SPECIAL_TOPICS % str(pgnum)).text
+    return _parse_special_topics(res)
+
+
+async def get_special_topics_async(pgnum=1, client=None):
+    """`get_special_topics` 的异步版本
+
+    :param client: :class: `tma.collector.aio.AsyncClient` 默认值 None
+        异步HTTP客户端，默认创建一个临时客户端
+    """
+    async def _fetch(client):
+        return _parse_special_topics(await client.get_text(URL_SPECIAL_TOPICS % str(pgnum)))
+
+    return await _with_client(client, _fetch)
+
+
+def _parse_special_topics(res):
     res = res.replace("null", "\'\'")
     res = eval(res)
     assert res['status'] == 0, "获取文章列表失败"
@@ -74,7 +93,34 @@ def get_article_detail(article_url):
     """
     # article_url = "http://www.xinhuanet.com/fortune/2018-06/20/c_129897476.htm"
     html = requests.get(article_url, headers=get_header())
-    bsobj = BeautifulSoup(html.content.decode('utf-8'), 'lxml')
+    return _parse_article_detail(article_url, html.content)
+
+
+async def get_article_detail_async(article_url, client=None):
+    """`get_article_detail` 的异步版本"""
+    async def _fetch(client):
+        content = await client.get_bytes(article_url, headers=get_header())
+        return _parse_article_detail(article_url, content)
+
+    return await _with_client(client, _fetch)
+
+
+async def _fetch_articles(client, urls):
+    """并发获取多篇文章，获取或解析失败的文章被忽略"""
+    async def _one(url):
+        try:
+            return await get_article_detail_async(url, client)
+        except Exception:
+            if tma.DEBUG:
+                traceback.print_exc()
+            return None
+
+    articles = await asyncio.gather(*[_one(url) for url in urls])
+    return [a for a in articles if a is not None]
+
+
+def _parse_article_detail(article_url, content):
+    bsobj = BeautifulSoup(content.decode('utf-8'), 'lxml')
 
     # 解析标题
     cols = bsobj.find('div', {"class": "h-news"}).text.strip().split("\r\n")
@@ -106,7 +152,7 @@ class HomePage(object):
 
     @staticmethod
     def _get_date_from_url(url):
-        pat = re.compile("(\d{4}-\d{2}[/-]\d{2})")
+        pat = re.compile(r"(\d{4}-\d{2}[/-]\d{2})")
         res = pat.findall(url)
         if res is not None and len(res) == 1:
             return res[0].replace('/', "-")
@@ -116,7 +162,10 @@ class HomePage(object):
     def get_article_list(self, d=None):
         """获取首页的头条文章列表"""
         html = requests.get(self.home_url, headers=get_header())
-        bsobj = BeautifulSoup(html.content.decode('utf-8'), 'lxml')
+        return self._parse_article_list(html.content, d)
+
+    def _parse_article_list(self, content, d=None):
+        bsobj = BeautifulSoup(content.decode('utf-8'), 'lxml')
 
         a_list = []
         for a in bsobj.find_all("a"):
@@ -177,6 +226,19 @@ class HomePage(object):
                     traceback.print_exc()
         return articles
 
+    async def get_articles_async(self, d=None, client=None):
+        """`get_articles` 的异步版本，所有文章并发请求
+
+        :param client: :class: `tma.collector.aio.AsyncClient` 默认值 None
+            异步HTTP客户端，默认创建一个临时客户端
+        """
+        async def _fetch(client):
+            content = await client.get_bytes(self.home_url, headers=get_header())
+            res = self._parse_article_list(content, d)
+            return await _fetch_articles(client, list(set(a[0] for a in res)))
+
+        return await _with_client(client, _fetch)
+
 
 class Fortune(object):
     def __init__(self):
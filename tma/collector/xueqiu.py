@@ -7,16 +7,30 @@ collector.xueqiu - 采集雪球数据
 ====================================================================
 """
 
+import os
+import queue
+import asyncio
+import threading
 import requests
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import OrderedDict
 from bs4 import BeautifulSoup
 import webbrowser
 from zb.crawlers.utils import get_header
 import traceback
 
+import tma
+from tma.collector.aio import _with_client, run_sync
+from tma.collector.utils import TokenBucket
+
 XUEQIU_HOME = "https://xueqiu.com/"
+COMMENT_URL = 'https://xueqiu.com/statuses/search.json?' \
+              'count=10&comment=0&symbol={symbol}&hl=0&' \
+              'source=user&sort=time&page={page}&_={real_time}'
+SUB_COMMENT_URL = "https://xueqiu.com/statuses/comments.json?id={comment_id}" \
+                  "&count=20&page=1&reply=true&asc=false&type=status&split=true"
 
 
 def make_symbol(code):
@@ -74,84 +88,308 @@ def get_raw_response(raw):
     return response
 
 
-def get_comments(code, sleep=1):
-    """获取股票code的雪球评论
+def _parse_user(u):
+    return {
+        "id": u['id'],
+        "city": u['city'],
+        "description": u['description'],
+        "followers_count": u['followers_count'],
+        "friends_count": u['friends_count'],
+        "gender": u['gender'],
+        "nick_name": u['screen_name'],
+        "province": u['province'],
+        "status_count": u['status_count'],
+    }
 
-    :param str code: 股票代码，如 `600122`
-    :param float sleep: 睡眠时间， 默认值为 1
-    :return:
-    """
-    headers = get_header()
-    sess = requests.Session()
 
-    # 访问首页，获取cookies
-    sess.get(XUEQIU_HOME, headers=headers, timeout=10)
+def _parse_comment(r):
+    return {
+        "text": BeautifulSoup(r['text'], 'lxml').text,
+        "id": r['id'],
+        "time": r['timeBefore'],
+        "reply_count": int(r['reply_count']),
+        "source": r['source'],
+        "user": _parse_user(r['user']),
+    }
 
-    # 获取首页评论
-    symbol = make_symbol(code)
-    real_time = str(time.time()).replace('.', '')[0:-1]  # 获取当前时间
-    comment_url = 'https://xueqiu.com/statuses/search.json?' \
-                  'count=10&comment=0&symbol={symbol}&hl=0&' \
-                  'source=user&sort=time&page={page}&_={real_time}'
-    url = comment_url.format(symbol=symbol, page=1, real_time=real_time)
-    res = sess.get(url, headers=headers, timeout=10).json()
-    count = res['count']  # 评论总条数
-    total_page = res['maxPage']  # 页数
-    print("总页数：", total_page)
-    # 评论数据存储list
-    comments = {
-        "symbol": symbol,
-        "count": count,
+
+def _parse_sub_comment(r):
+    return {
+        "timestamp": r['created_at'],
+        "ip": r['created_ip'],
+        "text": BeautifulSoup(r['text'], 'lxml').text,
+        "source": r['source'],
+        "user": _parse_user(r['user']),
     }
-    coms = []
-    for i in range(1, total_page + 1):
-        print(i)
-        time.sleep(sleep)
-        headers = get_header()
-        sess_temp = requests.Session()
-
-        # 访问首页，获取cookies
-        sess_temp.get(XUEQIU_HOME, headers=headers, timeout=10)
-        real_time = str(time.time()).replace('.', '')[0:-1]  # 获取当前时间
-
-        url = comment_url.format(symbol=symbol, page=i, real_time=real_time)
-        try:
-            res = sess_temp.get(url, headers=headers, timeout=10).json()['list']
-        except Exception:
-            print(i, "fail")
-            traceback.print_exc()
-            continue
-        for r in res:
-            com = {
-                "text": BeautifulSoup(r['text'], 'lxml').text,
-                "id": r['id'],
-                "time": r['timeBefore'],
-                "reply_count": int(r['reply_count']),
-                "source": r['source']
-            }
 
-            user = {
-                "id": r['user']['id'],
-                "city": r['user']['city'],
-                "description": r['user']['description'],
-                "followers_count": r['user']['followers_count'],
-                "friends_count": r['user']['friends_count'],
-                "gender": r['user']['gender'],
-                "nick_name": r['user']['screen_name'],
-                "province": r['user']['province'],
-                "status_count": r['user']['status_count'],
-            }
 
-            com['user'] = user
+def _real_time():
+    return str(time.time()).replace('.', '')[0:-1]
+
+
+class XueqiuCommentCrawler(object):
+    """雪球评论并发采集器
+
+    1）会话池：启动时创建 sessions 个 requests.Session，每个会话只访问一次
+       雪球首页获取cookies，之后所有评论页、子评论请求都复用这些会话；
+       会话的cookies失效（返回400/403）时重新访问首页；
+    2）自适应限流：所有请求共用一个令牌桶，每次请求成功后速率提高5%，
+       被限流或请求失败时速率减半；
+    3）评论页和子评论分别在两个线程池中并发获取；
+    4）每一页的评论（含子评论）获取完成后整体追加写入JSONL文件，每行一条
+       评论，并记录所在页码；中断后再次运行时跳过已经写入的评论。评论按
+       时间倒序分页，新评论会使各页的内容整体后移，因此按评论id而不是
+       页码去重。
+
+    :param sessions: int 默认值 4
+        会话池中的会话数量
+    :param workers: int 默认值 4
+        并发获取评论页的线程数量，子评论使用同样数量的线程
+    :param rate: float 默认值 2
+        初始请求速率（次/秒）
+    :param min_rate: float 默认值 0.2
+    :param max_rate: float 默认值 10
+    :param timeout: float 默认值 10
+    :param retries: int 默认值 3
+        单个请求的最大尝试次数
+
+    使用方法：
+        crawler = XueqiuCommentCrawler(rate=3)
+        summary = crawler.crawl('600122')
+        for comment in iter_comments(summary['path']):
+            ...
+    """
 
+    def __init__(self, sessions=4, workers=4, rate=2.0, min_rate=0.2,
+                 max_rate=10.0, timeout=10, retries=3):
+        self.n_sessions = max(1, int(sessions))
+        self.workers = max(1, int(workers))
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.limiter = TokenBucket(rate)
+        self.timeout = timeout
+        self.retries = retries
+        self.home = XUEQIU_HOME
+        self.comment_url = COMMENT_URL
+        self.sub_comment_url = SUB_COMMENT_URL
+        self._pool = None
+        self._lock = threading.Lock()
+
+    # 会话池 & 限流
+    # --------------------------------------------------------------------
+    def _warm(self, sess):
+        sess.headers.update(get_header())
+        sess.get(self.home, timeout=self.timeout)
+        return sess
+
+    def _sessions(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = queue.Queue()
+                for _ in range(self.n_sessions):
+                    self._pool.put(self._warm(requests.Session()))
+        return self._pool
+
+    @property
+    def rate(self):
+        return self.limiter.rate
+
+    def _adapt(self, ok):
+        with self._lock:
+            rate = self.limiter.rate
+            rate = min(self.max_rate, rate * 1.05) if ok \
+                else max(self.min_rate, rate / 2)
+            self.limiter.set_rate(rate)
+
+    def get_json(self, url):
+        """限流、复用会话并在失败后重试的GET请求"""
+        pool = self._sessions()
+        for attempt in range(self.retries):
+            self.limiter.acquire()
+            sess = pool.get()
+            try:
+                res = sess.get(url, timeout=self.timeout)
+                if res.status_code in (400, 403):
+                    self._warm(sess)
+                if res.status_code != 200:
+                    raise requests.HTTPError("%i %s" % (res.status_code, url))
+                data = res.json()
+                self._adapt(True)
+                return data
+            except Exception:
+                self._adapt(False)
+                if attempt == self.retries - 1:
+                    raise
+            finally:
+                pool.put(sess)
+
+    # 采集
+    # --------------------------------------------------------------------
+    def page(self, symbol, page):
+        url = self.comment_url.format(symbol=symbol, page=page,
+                                      real_time=_real_time())
+        return self.get_json(url)
+
+    def sub_comments(self, comment_id):
+        """获取评论下面的子评论"""
+        url = self.sub_comment_url.format(comment_id=comment_id)
+        return [_parse_sub_comment(r) for r in self.get_json(url)['comments']]
+
+    def _crawl_page(self, symbol, page, sub_executor, first=None, skip=()):
+        """获取一页评论及其子评论，跳过id在skip中的评论"""
+        res = first if first is not None else self.page(symbol, page)
+        coms = [_parse_comment(r) for r in res['list']]
+        coms = [com for com in coms if com['id'] not in skip]
+        futures = {}
+        for com in coms:
+            com['page'] = page
+            com['sub_comments'] = []
             if com['reply_count'] > 0:
-                com['sub_comments'] = _get_sub_comments(com['id'])
-            else:
-                com['sub_comments'] = []
+                futures[com['id']] = sub_executor.submit(self.sub_comments,
+                                                         com['id'])
+        for com in coms:
+            if com['id'] in futures:
+                try:
+                    com['sub_comments'] = futures[com['id']].result()
+                except Exception:
+                    if tma.DEBUG:
+                        traceback.print_exc()
+        return coms
+
+    def crawl(self, code, path=None, max_pages=None, resume=True):
+        """采集股票code的全部雪球评论并写入JSONL文件
+
+        :param str code: 股票代码，如 `600122`
+        :param str path: JSONL文件路径，默认为 `DATA_PATH/xueqiu/comments_{code}.jsonl`
+        :param int max_pages: 最多采集的页数，默认全部
+        :param bool resume: 是否跳过文件中已经写入的评论
+        :return: dict
+            symbol、count（评论总数）、pages（总页数）、written（本次写入的
+            评论数量）、failed（获取失败的页）、path
+        """
+        if path is None:
+            folder = os.path.join(tma.DATA_PATH, "xueqiu")
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            path = os.path.join(folder, "comments_%s.jsonl" % code)
+        done = _done_ids(path) if resume else set()
+        if not resume and os.path.exists(path):
+            os.remove(path)
+
+        symbol = make_symbol(code)
+        first = self.page(symbol, 1)
+        total_page = first['maxPage']
+        if max_pages is not None:
+            total_page = min(total_page, max_pages)
+        todo = range(1, total_page + 1)
+
+        written, failed = 0, []
+        sink_lock = threading.Lock()
+        with open(path, 'a', encoding='utf-8') as sink, \
+                ThreadPoolExecutor(self.workers) as page_executor, \
+                ThreadPoolExecutor(self.workers) as sub_executor:
+            futures = {
+                page_executor.submit(self._crawl_page, symbol, i, sub_executor,
+                                     first if i == 1 else None, done): i
+                for i in todo
+            }
+            for future in as_completed(futures):
+                try:
+                    coms = future.result()
+                except Exception:
+                    if tma.DEBUG:
+                        traceback.print_exc()
+                    failed.append(futures[future])
+                    continue
+                with sink_lock:
+                    # 采集期间有新评论时，相邻两页可能有重复的评论
+                    coms = [c for c in coms if c['id'] not in done]
+                    done.update(c['id'] for c in coms)
+                    sink.write("".join(json.dumps(c, ensure_ascii=False) + "\n"
+                                       for c in coms))
+                    sink.flush()
+                written += len(coms)
+
+        return {
+            "symbol": symbol,
+            "count": first['count'],
+            "pages": total_page,
+            "written": written,
+            "failed": sorted(failed),
+            "path": path,
+        }
 
-            coms.append(com)
-    comments['comment_list'] = coms
-    return comments
+
+def iter_comments(path):
+    """逐条读取 `XueqiuCommentCrawler.crawl` 写入的评论，不把整个文件读入内存"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # 中断时写了一半的行
+                continue
+
+
+def _done_ids(path):
+    """JSONL文件中已经完整写入的评论id；同时截掉文件末尾写了一半的行"""
+    if not os.path.exists(path):
+        return set()
+    ids = set()
+    valid = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                ids.add(json.loads(line)['id'])
+            except (ValueError, KeyError, TypeError):
+                break
+            valid += len(line)
+    if valid < os.path.getsize(path):
+        with open(path, 'r+b') as f:
+            f.truncate(valid)
+    return ids
+
+
+_crawler = None
+
+
+def _default_crawler():
+    global _crawler
+    if _crawler is None:
+        _crawler = XueqiuCommentCrawler()
+    return _crawler
+
+
+def get_comments(code, sleep=1):
+    """获取股票code的雪球评论
+
+    通过 `XueqiuCommentCrawler` 并发采集；评论数量很多时建议直接使用
+    `XueqiuCommentCrawler.crawl` 写入文件，而不是全部放在内存中。
+
+    :param str code: 股票代码，如 `600122`
+    :param float sleep: 平均请求间隔，默认值为 1，即初始速率为每秒1次请求
+    :return: dict
+        symbol、count（评论总数）、comment_list、failed（获取失败的页，
+        这些页的评论不在 comment_list 中）
+    """
+    crawler = XueqiuCommentCrawler(rate=1.0 / sleep if sleep else 10.0)
+    folder = os.path.join(tma.DATA_PATH, "xueqiu")
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, ".comments_%s.jsonl.tmp" % code)
+    try:
+        summary = crawler.crawl(code, path=path, resume=False)
+        coms = sorted(iter_comments(path), key=lambda c: c.pop('page'))
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return {
+        "symbol": summary['symbol'],
+        "count": summary['count'],
+        "comment_list": coms,
+        "failed": summary['failed'],
+    }
 
 
 def _get_sub_comments(comment_id):
@@ -160,43 +398,79 @@ def _get_sub_comments(comment_id):
     :param str comment_id: 评论id，如 `106580772`
     :return: list sub_comments
     """
-    sub_com_url = "https://xueqiu.com/statuses/comments.json?id={comment_id}" \
-                  "&count=20&page=1&reply=true&asc=false&type=status&split=true"
-    url = sub_com_url.format(comment_id=comment_id)
+    return _default_crawler().sub_comments(comment_id)
 
-    headers = get_header()
-    sess = requests.Session()
 
-    # 访问首页，获取cookies
-    sess.get(XUEQIU_HOME, headers=headers, timeout=10)
+# 异步接口
+# --------------------------------------------------------------------
 
-    res = sess.get(url, headers=headers).json()['comments']
-    sub_comments = []
+async def _fetch_comments(client, code, max_pages=None):
+    # 访问首页，获取cookies；同一个client只需要访问一次
+    if not getattr(client, '_xueqiu_warmed', False):
+        await client.get_text(XUEQIU_HOME)
+        client._xueqiu_warmed = True
 
-    for r in res:
-        com = {
-            "timestamp": r['created_at'],
-            "ip": r['created_ip'],
-            "text": BeautifulSoup(r['text'], 'lxml').text,
-            "source": r['source'],
-        }
+    symbol = make_symbol(code)
+    url = COMMENT_URL.format(symbol=symbol, page=1, real_time=_real_time())
+    first = await client.get_json(url)
+    total_page = first['maxPage']
+    if max_pages is not None:
+        total_page = min(total_page, max_pages)
+
+    failed = []
+
+    async def _page(i):
+        if i == 1:
+            return first['list']
+        url = COMMENT_URL.format(symbol=symbol, page=i, real_time=_real_time())
+        try:
+            return (await client.get_json(url))['list']
+        except Exception:
+            if tma.DEBUG:
+                traceback.print_exc()
+            failed.append(i)
+            return []
+
+    async def _sub(com):
+        com['sub_comments'] = []
+        if com['reply_count'] > 0:
+            url = SUB_COMMENT_URL.format(comment_id=com['id'])
+            try:
+                res = await client.get_json(url)
+                com['sub_comments'] = [_parse_sub_comment(r) for r in res['comments']]
+            except Exception:
+                if tma.DEBUG:
+                    traceback.print_exc()
+        return com
+
+    pages = await asyncio.gather(*[_page(i) for i in range(1, total_page + 1)])
+    coms = [_parse_comment(r) for page in pages for r in page]
+    coms = await asyncio.gather(*[_sub(com) for com in coms])
+    return {
+        "symbol": symbol,
+        "count": first['count'],
+        "comment_list": list(coms),
+        "failed": sorted(failed),
+    }
 
-        user = {
-            "id": r['user']['id'],
-            "city": r['user']['city'],
-            "description": r['user']['description'],
-            "followers_count": r['user']['followers_count'],
-            "friends_count": r['user']['friends_count'],
-            "gender": r['user']['gender'],
-            "nick_name": r['user']['screen_name'],
-            "province": r['user']['province'],
-            "status_count": r['user']['status_count'],
-        }
 
-        com["user"] = user
+async def get_comments_async(code, max_pages=None, client=None):
+    """异步获取股票code的雪球评论，所有评论页、子评论并发请求
+
+    :param str code: 股票代码，如 `600122`
+    :param int max_pages: 最多获取的评论页数，默认全部
+    :param client: :class: `tma.collector.aio.AsyncClient` 默认值 None
+        异步HTTP客户端，默认创建一个临时客户端；雪球的并发上限见
+        `tma.collector.aio.HOST_LIMITS`
+    :return: dict
+        字段同 `get_comments`
+    """
+    return await _with_client(client, _fetch_comments, code, max_pages)
+
 
-        sub_comments.append(com)
-    return sub_comments
+def get_comments_concurrent(code, max_pages=None):
+    """`get_comments_async` 的同步版本"""
+    return run_sync(get_comments_async(code, max_pages))
 
 
 def get_top_portfolio(market='cn', profit="monthly_gain", count=30):
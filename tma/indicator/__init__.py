@@ -5,7 +5,7 @@ indicator - 指标计算模块
 ====================================================================
 """
 
-from .share import ShareDayIndicator
+from .share import ShareDayIndicator, MarketShareIndicatorEngine
 from .market import MarketDayIndicator
 from .meta import check_indicator_meta
 
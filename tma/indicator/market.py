@@ -5,11 +5,61 @@ indicator.market - A股市场指标计算
 ====================================================================
 """
 
-import pandas as pd
+import numpy as np
 from collections import OrderedDict
 
 from tma.collector import today_market
 from tma.indicator.meta import check_indicator_meta
+from tma.utils import get_limit_rates, get_limit_prices
+
+# 涨跌停板分类
+# --------------------------------------------------------------------
+NONE, SEALED, ONE_WORD, TOUCHED = range(4)
+LIMIT_UP_KINDS = ("", "涨停板", "一字涨停板", "盘中触及涨停板")
+LIMIT_DOWN_KINDS = ("", "跌停板", "一字跌停板", "盘中触及跌停板")
+
+
+def classify_limits(m, rates=None):
+    """对全市场行情进行涨跌停板分类
+
+    涨停价、跌停价按每只股票的涨跌幅限制比例（`get_limit_rates`）计算。
+    最高价达到涨停价的股票：现价低于最高价为盘中触及涨停板，最高价等于
+    最低价为一字涨停板，否则为涨停板；跌停板同理。成交量为0的股票不参与分类。
+
+    :param m: :class: `pd.DataFrame`
+        全市场行情，字段同 `today_market`
+    :param rates: np.ndarray 默认值 None
+        每只股票的涨跌幅限制比例，默认由代码和名称计算
+    :return: tuple of np.ndarray of int8
+        (涨停板分类, 跌停板分类)，取值为 NONE / SEALED / ONE_WORD / TOUCHED，
+        对应名称见 LIMIT_UP_KINDS / LIMIT_DOWN_KINDS
+    """
+    if rates is None:
+        rates = get_limit_rates(m['code'], m['name'])
+    return classify_limit_arrays(
+        trade=m['trade'].to_numpy(dtype=np.float64),
+        high=m['high'].to_numpy(dtype=np.float64),
+        low=m['low'].to_numpy(dtype=np.float64),
+        volume=m['volume'].to_numpy(dtype=np.float64),
+        pre_close=m['settlement'].to_numpy(dtype=np.float64),
+        rates=rates
+    )
+
+
+def classify_limit_arrays(trade, high, low, volume, pre_close, rates):
+    """`classify_limits` 的数组版本，参数均为等长的 np.ndarray"""
+    traded = volume != 0.0
+    up_price, down_price = get_limit_prices(pre_close, rates)
+    return (_classify_side(traded & (high >= up_price - 1e-6), high > trade, high == low),
+            _classify_side(traded & (low <= down_price + 1e-6), trade > low, high == low))
+
+
+def _classify_side(arrived, touched, one_word):
+    kind = np.full(len(arrived), NONE, dtype=np.int8)
+    kind[arrived] = SEALED
+    kind[arrived & one_word] = ONE_WORD
+    kind[arrived & touched] = TOUCHED
+    return kind
 
 
 class MarketDayIndicator(object):
@@ -24,7 +74,7 @@ class MarketDayIndicator(object):
         if not use_exists:
             self.m = today_market(filters=['tp'], use_latest=False)
         if self.m is None:
-            m = self.m = today_market(filters=['tp'], use_latest=True)
+            m = self.m = today_market(filters=['tp'], use_latest=True, use_cache=True)
         else:
             m = self.m
         return m
@@ -34,13 +84,11 @@ class MarketDayIndicator(object):
     @staticmethod
     def _up_rate(m):
         """计算赚钱效应相关指标"""
-        total = len(m)
-        m['is_up'] = m['changepercent'].apply(lambda x: True if x > 0.0 else False)
-        m['is_up_3'] = m['changepercent'].apply(lambda x: True if x > 3.0 else False)
-        m['is_down_3'] = m['changepercent'].apply(lambda x: True if x < -3.0 else False)
-        up3 = dict(m['is_up_3'].value_counts())[True]
-        up = dict(m['is_up'].value_counts())[True]
-        down3 = dict(m['is_down_3'].value_counts())[True]
+        change = m['changepercent'].to_numpy(dtype=np.float64)
+        total = len(change)
+        up = int(np.count_nonzero(change > 0.0))
+        up3 = int(np.count_nonzero(change > 3.0))
+        down3 = int(np.count_nonzero(change < -3.0))
         return total, up, up3, down3
 
     def cal_total_market(self):
@@ -49,7 +97,7 @@ class MarketDayIndicator(object):
         total, up, up3, down3 = self._up_rate(m)
         f = OrderedDict(
             {
-                "M001": up / total,
+                "M001": up / total if total else 0,
                 "M002": total,
                 "M003": up,
                 "M004": up3,
@@ -61,13 +109,12 @@ class MarketDayIndicator(object):
     def cal_turnover_top50(self):
         """计算换手率前50只股票的赚钱效应相关指标"""
         m = self._get_market()
-        m.sort_values('turnoverratio', inplace=True)
-        m.reset_index(drop=True, inplace=True)
-        m_tt50 = m.tail(50)
-        total, up, up3, down3 = self._up_rate(m_tt50)
+        turnover = m['turnoverratio'].to_numpy(dtype=np.float64)
+        top = np.argsort(turnover, kind='stable')[-50:]
+        total, up, up3, down3 = self._up_rate(m.iloc[top])
         f = OrderedDict(
             {
-                "M006": up / total,
+                "M006": up / total if total else 0,
                 "M007": up3,
                 "M008": down3,
             }
@@ -77,62 +124,16 @@ class MarketDayIndicator(object):
     def cal_limit_arrived(self):
         """计算涨跌停板相关指标"""
         m = self._get_market()
-        m = m[[
-            'code', 'name', 'changepercent', 'trade',
-            'open', 'high', 'low', 'settlement', 'volume'
-        ]]
-        la = []
-        for i in m.index:
-            data = m.loc[i]
-            if data['volume'] == 0.0:
-                continue
-
-            # 涨停板观察
-            if data['high'] > data['settlement'] * 1.095:
-                if data['high'] > data['trade']:  # 盘中触及涨停板
-                    x = dict(data)
-                    x['kind'] = "盘中触及涨停板"
-                    la.append(x)
-                elif data['high'] == data['low']:  # 一字涨停板
-                    x = dict(data)
-                    x['kind'] = "一字涨停板"
-                    la.append(x)
-                elif data['high'] == data['trade']:  # 涨停板
-                    x = dict(data)
-                    x['kind'] = "涨停板"
-                    la.append(x)
-                else:
-                    continue
-
-            # 跌停板观察
-            if data['low'] < data['settlement'] * 0.905:
-                if data['trade'] > data['low']:  # 盘中触及跌停板
-                    x = dict(data)
-                    x['kind'] = "盘中触及跌停板"
-                    la.append(x)
-                elif data['high'] == data['low']:  # 一字跌停板
-                    x = dict(data)
-                    x['kind'] = "一字跌停板"
-                    la.append(x)
-                elif data['low'] == data['trade']:  # 跌停板
-                    x = dict(data)
-                    x['kind'] = "跌停板"
-                    la.append(x)
-                else:
-                    continue
-
-        df_la = pd.DataFrame(la)
-        df_la = df_la[['code', 'name', 'trade', 'open', 'high', 'low',
-                        'kind', 'changepercent']]
-        df_la = df_la.sort_values('kind')
-
-        la_count = OrderedDict(df_la['kind'].value_counts())
-        x1 = la_count.get("涨停板", 0) + la_count.get("一字涨停板", 0)
-        x2 = la_count.get("一字涨停板", 0)
-        x3 = la_count.get("盘中触及涨停板", 0)
-        x4 = la_count.get("跌停板", 0) + la_count.get("一字跌停板", 0)
-        x5 = la_count.get("一字跌停板", 0)
-        x6 = la_count.get("盘中触及跌停板", 0)
+        up_kind, down_kind = classify_limits(m)
+        up_count = np.bincount(up_kind, minlength=len(LIMIT_UP_KINDS))
+        down_count = np.bincount(down_kind, minlength=len(LIMIT_DOWN_KINDS))
+
+        x1 = int(up_count[SEALED] + up_count[ONE_WORD])
+        x2 = int(up_count[ONE_WORD])
+        x3 = int(up_count[TOUCHED])
+        x4 = int(down_count[SEALED] + down_count[ONE_WORD])
+        x5 = int(down_count[ONE_WORD])
+        x6 = int(down_count[TOUCHED])
 
         f = OrderedDict(
             {
@@ -70,17 +70,17 @@ MARKET_INDICATOR_META['M008'] = OrderedDict({
 
 MARKET_INDICATOR_META['M009'] = OrderedDict({
     "explain": "涨停板个股数量",
-    "cal_method": "（涨幅 > 0.095）的个股总数",
+    "cal_method": "（收盘价 == 最高价 >= 涨停价）的个股总数，涨停价按主板10%、创业板/科创板20%、ST股5%计算",
 })
 
 MARKET_INDICATOR_META['M010'] = OrderedDict({
     "explain": "一字涨停板个股数量",
-    "cal_method": "（涨幅 > 0.095）且（最高价 == 最低价）的个股总数",
+    "cal_method": "（最高价 >= 涨停价）且（最高价 == 最低价）的个股总数",
 })
 
 MARKET_INDICATOR_META['M011'] = OrderedDict({
     "explain": "盘中触及涨停板个股数量",
-    "cal_method": "（最高价涨幅 > 0.095）且（现价 < 最高价）的个股总数",
+    "cal_method": "（最高价 >= 涨停价）且（现价 < 最高价）的个股总数",
 })
 
 MARKET_INDICATOR_META['M012'] = OrderedDict({
@@ -90,17 +90,17 @@ MARKET_INDICATOR_META['M012'] = OrderedDict({
 
 MARKET_INDICATOR_META['M013'] = OrderedDict({
     "explain": "跌停板个股数量",
-    "cal_method": "（跌幅 > 0.095）的个股总数",
+    "cal_method": "（收盘价 == 最低价 <= 跌停价）的个股总数，跌停价按主板10%、创业板/科创板20%、ST股5%计算",
 })
 
 MARKET_INDICATOR_META['M014'] = OrderedDict({
     "explain": "一字跌停板个股数量",
-    "cal_method": "（跌幅 > 0.095）且（最高价 == 最低价）的个股总数",
+    "cal_method": "（最低价 <= 跌停价）且（最高价 == 最低价）的个股总数",
 })
 
 MARKET_INDICATOR_META['M015'] = OrderedDict({
     "explain": "盘中触及跌停板个股数量",
-    "cal_method": "（最低价跌幅 > 0.095）且（现价 > 最低价）的个股总数",
+    "cal_method": "（最低价 <= 跌停价）且（现价 > 最低价）的个股总数",
 })
 
 MARKET_INDICATOR_META['M016'] = OrderedDict({
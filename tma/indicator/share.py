@@ -5,11 +5,14 @@ indicator.share - 个股指标计算
 ====================================================================
 """
 import numpy as np
+import pandas as pd
 from datetime import datetime
 import traceback
+import warnings
 from collections import OrderedDict
 
-from tma.collector import klines, ticks, get_price, bars
+from tma.collector import klines, ticks, get_price, bars, today_market
+from tma.collector import KlineStore, OHLCVPanel, agg_market_klines
 
 
 class ShareDayIndicator(object):
@@ -58,7 +61,8 @@ class ShareDayIndicator(object):
 
     def _get_realtime_bar(self):
         """获取实时行情"""
-        bar = self.bar = bars(self.code)
+        # basic_info 和 cal_bs_first 在同一次计算中先后调用，共用一次请求
+        bar = self.bar = bars(self.code, use_cache=True)
         self.update_time['bar'] = datetime.now().__str__()
         return bar
 
@@ -224,6 +228,162 @@ class ShareDayIndicator(object):
         return indicators
 
 
+class MarketShareIndicatorEngine(object):
+    """全市场个股指标批量计算引擎
+
+    与 `ShareDayIndicator` 的指标定义和输出字段一致，但不再逐只股票请求
+    K线和实时行情：K线来自本地的 `OHLCVPanel`（日K线），实时行情来自一次
+    全市场行情请求，所有股票的指标通过矩阵运算一次算出。
+
+    :param panel: :class: `OHLCVPanel` 默认值 None
+        日K线面板，默认为 `OHLCVPanel.load("D")`；本地没有K线时先调用
+        `agg_market_klines("D")` 获取
+    :param quotes: :class: `pd.DataFrame` 默认值 None
+        全市场行情，字段同 `today_market`，默认为 `today_market(use_latest=True)`
+    """
+    MA_WINDOWS = (5, 10, 20, 30, 60, 120, 240)
+    ND_WINDOWS = (5, 10, 20, 40, 60)
+
+    def __init__(self, panel=None, quotes=None):
+        self.panel = panel
+        self.quotes = quotes
+        self.features = OrderedDict()
+        self.codes = None
+        self._cols = None
+        self._aligned = None
+        self.default_target = ('ma', 'lnd')
+
+    # 相关数据获取
+    # --------------------------------------------------------------------
+    def _get_panel(self):
+        if self.panel is None:
+            if not KlineStore("D").meta:
+                agg_market_klines(k_freq="D")
+            self.panel = OHLCVPanel.load("D")
+        return self.panel
+
+    def _get_quotes(self):
+        if self.quotes is None:
+            self.quotes = today_market(filters=['tp'], use_latest=True, use_cache=True)
+        return self.quotes
+
+    def _tail(self, n):
+        """每只股票最近n根K线，形状为 [n x n_codes]
+
+        停牌日在面板中为NaN，先把每只股票的有效K线按时间顺序移到矩阵底部，
+        再取最后n行；有效K线不足n根的股票，顶部为NaN。
+        """
+        if self._aligned is None or len(self._aligned['close']) < n:
+            panel = self._get_panel()
+            order = np.argsort(~np.isnan(panel.close), axis=0, kind='stable')[-n:]
+            self._aligned = OrderedDict()
+            for field in ('open', 'high', 'low', 'close'):
+                self._aligned[field] = np.take_along_axis(
+                    panel.field(field), order, axis=0).astype(np.float64)
+        return OrderedDict((k, v[-n:]) for k, v in self._aligned.items())
+
+    # --------------------------------------------------------------------
+
+    def basic_info(self):
+        panel = self._get_panel()
+        quotes = self._get_quotes()
+        quotes = quotes[quotes['code'].astype(str).isin(panel.code_index)]
+        quotes = quotes.drop_duplicates('code').reset_index(drop=True)
+        self.codes = quotes['code'].astype(str).tolist()
+        self._cols = np.array([panel.code_index[c] for c in self.codes],
+                              dtype=np.int64)
+
+        pre_close = quotes['settlement'].to_numpy(dtype=np.float64)
+        cur_price = quotes['trade'].to_numpy(dtype=np.float64)
+        high_price = quotes['high'].to_numpy(dtype=np.float64)
+        low_price = quotes['low'].to_numpy(dtype=np.float64)
+
+        BASIC = OrderedDict()
+        BASIC['DATE'] = [datetime.now().date().__str__()] * len(self.codes)
+        BASIC['CODE'] = self.codes
+        BASIC['NAME'] = quotes['name'].tolist()
+        BASIC['PRICE'] = cur_price
+        BASIC['TOTAL_AMOUNT'] = quotes['amount'].to_numpy(dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            BASIC['CHANGE_RATE'] = (cur_price - pre_close) / pre_close
+            BASIC['WAVE_RATE'] = (high_price - low_price) / pre_close
+        self.features.update(BASIC)
+
+    def cal_move_average(self, windows=None):
+        """计算移动均线指标"""
+        if windows is None:
+            windows = self.MA_WINDOWS
+        close = self._tail(max(windows))['close'][:, self._cols]
+        MA = OrderedDict()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            for n in windows:
+                MA["MA%i_D" % n] = np.round(np.nanmean(close[-n:], axis=0), 4)
+        self.features.update(MA)
+
+    def cal_latest_nd(self, d=None):
+        """计算最近N个交易日的相关指标，有效K线不足N根的股票为NaN"""
+        if d is None:
+            d = self.ND_WINDOWS
+        tail = self._tail(max(d))
+        o_, h_, l_, c_ = [tail[f][:, self._cols]
+                          for f in ('open', 'high', 'low', 'close')]
+        wave_rate = (h_ - l_) / o_
+        LND = OrderedDict()
+        with warnings.catch_warnings(), np.errstate(divide='ignore', invalid='ignore'):
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            for i in d:
+                o = o_[-i]
+                h = np.max(h_[-i:], axis=0)
+                l = np.min(l_[-i:], axis=0)
+                c = c_[-1]
+                # 最高价
+                LND["HIGH_" + str(i)] = h
+                # 最低价
+                LND["LOW_" + str(i)] = l
+                # 涨跌幅
+                LND["CHANGE_" + str(i)] = (c - o) / o
+                # 最大回撤
+                LND["MAX_DOWN_" + str(i)] = (c - h) / h
+                # 平均每日波动率
+                LND["WAVE_RATE_A" + str(i)] = np.mean(wave_rate[-i:], axis=0)
+                # 累计波动率
+                LND["WAVE_RATE_T" + str(i)] = (h - l) / o
+        for k, v in LND.items():
+            LND[k] = np.round(v, 4)
+        self.features.update(LND)
+
+    def run(self, target=None):
+        """计算全市场个股指标
+
+        :param target: list 默认值 ('ma', 'lnd')
+            需要计算的指标，可选值 'ma'、'lnd'
+        :return: :class: `pd.DataFrame`
+            每只股票一行，字段同 `ShareDayIndicator.indicators`
+        """
+        if not target:
+            target = self.default_target
+        funcs = {
+            "ma": self.cal_move_average,
+            "lnd": self.cal_latest_nd,
+        }
+        self.features = OrderedDict()
+        self.basic_info()
+        for x in target:
+            if x in funcs.keys():
+                funcs[x]()
+            else:
+                raise ValueError('%s 不是合法的指标关键词' % x)
+        return self.indicators
+
+    @property
+    def indicators(self):
+        df = pd.DataFrame(self.features)
+        float_cols = df.select_dtypes(include=[np.floating]).columns
+        df[float_cols] = df[float_cols].round(4)
+        return df
+
+
 class ShareWeekIndicator(object):
     """以周为更新周期的个股指标体系"""
 
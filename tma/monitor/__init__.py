@@ -1,4 +1,4 @@
 # -*- coding: UTF-8 -*-
 
-from .single import sm_limit, get_shares_status
-from .market import get_market_status, get_indices_status
+from .single import sm_limit, get_shares_status, LimitBoardMonitor
+from .market import get_market_status, get_indices_status, MarketBreadthStream
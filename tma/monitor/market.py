@@ -1,17 +1,298 @@
 # -*- coding: UTF-8 -*-
 """
-
+monitor.market - 市场状态监控
 ====================================================================
 """
+import time
+import threading
+import traceback
+from collections import OrderedDict
+import numpy as np
+
+import tma
+from tma.utils import debug_print, is_in_trade_time, get_limit_rates
+from tma.indicator import MarketDayIndicator, check_indicator_meta
+from tma.indicator.market import classify_limit_arrays, SEALED, ONE_WORD, TOUCHED
+from tma.collector.ts import get_indices, today_market
+from tma.collector.quotes import get_quotes
+
+
+# 盘中市场宽度
+# --------------------------------------------------------------------
+
+class MarketBreadthStream(object):
+    """盘中市场宽度流式计算引擎
+
+    以开盘前（或任意时刻）的全市场行情为快照，之后只接收实时行情中发生
+    变化的股票，按变化前后的差值增量调整计数器，实时维护 M001 - M016
+    （指标含义与 `MarketDayIndicator` 相同）。每次轮询结束后把最新指标
+    推送给所有订阅者。
+
+    换手率前50只股票（M006 - M008）需要流通股本：由快照中的流通市值推算
+    （流通股本 = 流通市值 / 价格，价格为最新价，开盘前为昨收价）；快照中
+    没有流通市值时，退回到由成交量和换手率推算。之后用实时成交量计算
+    换手率，每次推送时用 np.argpartition 在全市场重新选出前50只。
+
+    :param fetch: callable 默认值 get_quotes
+        实时行情获取函数，签名同 `get_quotes(codes)`，参考 `QuoteBatcher`
+
+    使用方法：
+        stream = MarketBreadthStream()
+        stream.subscribe(lambda seq, features, latency: print(seq, features))
+        stream.run(interval=3)
+    """
+    # 计数器的位置
+    TOTAL, UP, UP3, DOWN3 = range(4)
+    UP_KIND = slice(4, 7)
+    DOWN_KIND = slice(7, 10)
+
+    def __init__(self, fetch=None):
+        self.fetch = fetch if fetch is not None else get_quotes
+        self.codes = None
+        self.code_index = {}
+        self.counters = np.zeros(10, dtype=np.int64)
+        self.features = OrderedDict()
+        self.seq = 0
+        self.latency = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    # 快照
+    # --------------------------------------------------------------------
+    def load_snapshot(self, m=None):
+        """加载全市场行情快照
+
+        :param m: :class: `pd.DataFrame` 默认值 None
+            全市场行情，字段同 `today_market`；默认获取最新的全市场行情
+            （包含停牌股，停牌股成交量为0，不参与计数）
+        """
+        if m is None:
+            m = today_market(filters=[], save=False)
+        m = m.drop_duplicates('code').reset_index(drop=True)
+        with self._lock:
+            self.codes = m['code'].to_numpy().astype(str)
+            self.code_index = {c: i for i, c in enumerate(self.codes.tolist())}
+            self.rates = get_limit_rates(m['code'], m['name'])
+            self.pre_close = m['settlement'].to_numpy(dtype=np.float64, copy=True)
+            self.trade = m['trade'].to_numpy(dtype=np.float64, copy=True)
+            self.high = m['high'].to_numpy(dtype=np.float64, copy=True)
+            self.low = m['low'].to_numpy(dtype=np.float64, copy=True)
+            self.volume = m['volume'].to_numpy(dtype=np.float64, copy=True)
+            self.change = m['changepercent'].to_numpy(dtype=np.float64, copy=True)
+            self.turnover = m['turnoverratio'].to_numpy(dtype=np.float64, copy=True)
+            self.float_shares = self._float_shares(m)
+            self.counters = self._count(np.arange(len(self.codes)))
+            self._update_features()
+        return self
+
+    def _float_shares(self, m):
+        """流通股本（单位同成交量：股）
+
+        开盘前的快照成交量为0，不能由成交量和换手率推算，因此优先使用
+        流通市值 nmc（单位：万元）。
+        """
+        float_shares = np.full(len(m), np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if 'nmc' in m.columns:
+                price = np.where(self.trade > 0, self.trade, self.pre_close)
+                nmc = m['nmc'].to_numpy(dtype=np.float64)
+                float_shares = np.where((nmc > 0) & (price > 0),
+                                        nmc * 1e4 / price, np.nan)
+            derived = self.volume / self.turnover * 100
+        return np.where(np.isnan(float_shares) & (self.turnover > 0),
+                        derived, float_shares)
+
+    def _count(self, rows):
+        """rows对应的股票对各计数器的贡献"""
+        active = self.volume[rows] != 0.0
+        change = self.change[rows]
+        up_kind, down_kind = classify_limit_arrays(
+            self.trade[rows], self.high[rows], self.low[rows],
+            self.volume[rows], self.pre_close[rows], self.rates[rows]
+        )
+        c = np.zeros(10, dtype=np.int64)
+        c[self.TOTAL] = np.count_nonzero(active)
+        c[self.UP] = np.count_nonzero(active & (change > 0.0))
+        c[self.UP3] = np.count_nonzero(active & (change > 3.0))
+        c[self.DOWN3] = np.count_nonzero(active & (change < -3.0))
+        c[self.UP_KIND] = np.bincount(up_kind, minlength=4)[1:]
+        c[self.DOWN_KIND] = np.bincount(down_kind, minlength=4)[1:]
+        return c
+
+    # 增量更新
+    # --------------------------------------------------------------------
+    def ingest(self, bars):
+        """接收一批实时行情，只处理发生变化的股票
 
-from tma.indicator import MarketDayIndicator
-from tma.collector.ts import get_indices
+        :param bars: :class: `pd.DataFrame`
+            实时行情，字段同 `get_quotes`（至少包含 code、price、high、low、volume）
+        :return: int
+            发生变化的股票数量
+        """
+        if self.codes is None:
+            raise RuntimeError("请先调用 load_snapshot() 加载全市场行情快照")
+        if bars is None or len(bars) == 0:
+            return 0
+        idx = np.fromiter((self.code_index.get(c, -1) for c in bars['code']),
+                          dtype=np.int64, count=len(bars))
+        known = idx >= 0
+        idx = idx[known]
+        trade = bars['price'].to_numpy(dtype=np.float64)[known]
+        high = bars['high'].to_numpy(dtype=np.float64)[known]
+        low = bars['low'].to_numpy(dtype=np.float64)[known]
+        volume = bars['volume'].to_numpy(dtype=np.float64)[known]
 
+        changed = (trade != self.trade[idx]) | (high != self.high[idx]) | \
+                  (low != self.low[idx]) | (volume != self.volume[idx])
+        rows = idx[changed]
+        if len(rows) == 0:
+            return 0
 
-def get_market_status():
-    """获取最新的市场状态，非交易时间段则获取最后交易时刻的市场状态"""
-    mi = MarketDayIndicator()
-    mi.update()
+        with self._lock:
+            old = self._count(rows)
+            self.trade[rows] = trade[changed]
+            self.high[rows] = high[changed]
+            self.low[rows] = low[changed]
+            self.volume[rows] = volume[changed]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                pre_close = self.pre_close[rows]
+                self.change[rows] = np.where(
+                    pre_close > 0, (trade[changed] / pre_close - 1) * 100, 0.0)
+                fs = self.float_shares[rows]
+                self.turnover[rows] = np.where(
+                    np.isfinite(fs), volume[changed] / fs * 100,
+                    self.turnover[rows])
+            self.counters += self._count(rows) - old
+        return len(rows)
+
+    def _update_features(self):
+        c = self.counters
+        total, up, up3, down3 = (int(x) for x in c[:4])
+        x1 = int(c[self.UP_KIND][SEALED - 1] + c[self.UP_KIND][ONE_WORD - 1])
+        x2 = int(c[self.UP_KIND][ONE_WORD - 1])
+        x3 = int(c[self.UP_KIND][TOUCHED - 1])
+        x4 = int(c[self.DOWN_KIND][SEALED - 1] + c[self.DOWN_KIND][ONE_WORD - 1])
+        x5 = int(c[self.DOWN_KIND][ONE_WORD - 1])
+        x6 = int(c[self.DOWN_KIND][TOUCHED - 1])
+
+        # 换手率前50
+        active = np.flatnonzero(self.volume != 0.0)
+        turnover = np.nan_to_num(self.turnover[active], nan=0.0)
+        n = min(50, len(active))
+        top = active[np.argpartition(turnover, len(active) - n)[-n:]] \
+            if n else active
+        change = self.change[top]
+        top_up = int(np.count_nonzero(change > 0.0))
+
+        self.features = OrderedDict([
+            ("M001", up / total if total else 0),
+            ("M002", total),
+            ("M003", up),
+            ("M004", up3),
+            ("M005", down3),
+            ("M006", top_up / n if n else 0),
+            ("M007", int(np.count_nonzero(change > 3.0))),
+            ("M008", int(np.count_nonzero(change < -3.0))),
+            ("M009", x1),
+            ("M010", x2),
+            ("M011", x3),
+            ("M013", x4),
+            ("M014", x5),
+            ("M015", x6),
+            ("M012", x1 / (x1 + x3) if x1 + x3 != 0 else 0),
+            ("M016", x4 / (x4 + x6) if x4 + x6 != 0 else 0),
+        ])
+        return self.features
+
+    # 订阅
+    # --------------------------------------------------------------------
+    def subscribe(self, callback):
+        """订阅指标推送，callback签名为 callback(seq, features, latency)
+
+        seq为推送序号；features为 M001 - M016 的 OrderedDict；latency为
+        本轮行情到达至推送时刻的耗时（单位：s）
+        """
+        self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def publish(self, received=None):
+        """计算最新指标并推送给所有订阅者
+
+        :param received: float 默认值 None
+            行情到达时刻（time.perf_counter），用于计算推送延迟
+        """
+        with self._lock:
+            features = OrderedDict(self._update_features())
+        self.seq += 1
+        self.latency = time.perf_counter() - received \
+            if received is not None else 0.0
+        for callback in list(self._subscribers):
+            try:
+                callback(self.seq, features, self.latency)
+            except Exception:
+                if tma.DEBUG:
+                    traceback.print_exc()
+        return features
+
+    @property
+    def indicators(self):
+        indicators = OrderedDict()
+        for k, v in self.features.items():
+            indicators[k] = {
+                "value": round(v, 4),
+                "explain": check_indicator_meta(k)['explain']
+            }
+        return indicators
+
+    # 运行
+    # --------------------------------------------------------------------
+    def poll(self):
+        """获取全市场实时行情并增量更新，有变化时推送一次
+
+        :return: int
+            本轮发生变化的股票数量
+        """
+        if self.codes is None:
+            self.load_snapshot()
+        bars = self.fetch(self.codes.tolist())
+        received = time.perf_counter()
+        changed = self.ingest(bars)
+        if changed or self.seq == 0:
+            self.publish(received)
+        return changed
+
+    def run(self, interval=3):
+        """交易时间段内每隔interval秒轮询一次"""
+        if self.codes is None:
+            self.load_snapshot()
+        while is_in_trade_time():
+            start = time.time()
+            try:
+                self.poll()
+            except Exception:
+                debug_print("MarketBreadthStream 轮询失败", level="EXCEPTION")
+            time.sleep(max(0.0, interval - (time.time() - start)))
+
+
+# 市场状态
+# --------------------------------------------------------------------
+
+def get_market_status(stream=None):
+    """获取最新的市场状态，非交易时间段则获取最后交易时刻的市场状态
+
+    :param stream: :class: `MarketBreadthStream` 默认值 None
+        盘中市场宽度引擎；传入时直接使用其最新指标，不再重新获取全市场行情
+    """
+    if stream is not None:
+        i = stream.indicators
+    else:
+        mi = MarketDayIndicator()
+        mi.update()
+        i = mi.indicators
 
     market_status_template = "### 实时市场状态\n --- \n" \
                              "* 今日开盘个股总数为{M002}家，上涨个股数量为{M003}家，**赚钱效应{M001}**；" \
@@ -22,7 +303,6 @@ def get_market_status():
                              "{M011}，封板成功率为{M012}；两市跌停{M013}家，其中一字板跌停{M014}" \
                              "家，盘中触及跌停板{M015}家。\n\n"
 
-    i = mi.indicators
     market_status = market_status_template.format(
         M002=i['M002']['value'], M003=i['M003']['value'],
         M001="%.2f" % (i['M001']['value'] * 100) + "%",
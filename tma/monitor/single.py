@@ -3,8 +3,11 @@
 import time
 import traceback
 from datetime import datetime
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
 
-from tma.indicator import ShareDayIndicator
+from tma.collector import get_quotes
 from tma.utils import is_in_trade_time
 from tma import sms
 from tma.utils import debug_print
@@ -15,9 +18,165 @@ from tma.monitor.market import get_indices_status
 # 涨跌停板破板
 # --------------------------------------------------------------------
 
-def sm_limit(code, kind, threshold=10000, interval=1):
+class LimitBoardMonitor(object):
+    """涨跌停板破板监控（多只股票）
+
+    每个监控间隔只发出一次批量行情请求，所有股票的买一/卖一挂单金额与
+    各自的阈值一次比较；同一只股票、同一监控类型的预警在冷却时间内只
+    推送一次。
+
+    :param interval: int 默认值 1
+        监控间隔，单位：秒
+    :param cooldown: int 默认值 60
+        同一只股票两次预警之间的最小间隔，单位：秒
+    :param push: callable 默认值 sms.server_chan_push
+        预警推送函数，签名为 push(title, content)
+    :param fetch: callable 默认值 get_quotes
+        实时行情获取函数，签名同 `get_quotes(codes)`
+
+    使用方法：
+        lbm = LimitBoardMonitor(cooldown=300)
+        lbm.add('600122', 'zt', threshold=5000)
+        lbm.add('000001', 'dt')
+        lbm.run()
+    """
+    KINDS = OrderedDict([
+        # kind: (标题, 挂单金额说明, 挂单量字段, 挂单价字段)
+        ("zt", ("【涨停板 - 破板监控】", "买一总挂单金额", "b1_v", "b1_p")),
+        ("dt", ("【跌停板 - 破板监控】", "卖一总挂单金额", "a1_v", "a1_p")),
+    ])
+
+    def __init__(self, interval=1, cooldown=60, push=None, fetch=None):
+        self.interval = interval
+        self.cooldown = cooldown
+        self.push = push if push is not None else sms.server_chan_push
+        self.fetch = fetch if fetch is not None else get_quotes
+        self.watches = OrderedDict()
+        self._last_alert = {}
+        self._arrays = None
+
+    # 监控列表
+    # --------------------------------------------------------------------
+    def add(self, code, kind, threshold=10000):
+        """添加监控
+
+        :param code: str
+            股票代码
+        :param kind: str
+            涨停板（zt） / 跌停板（dt）
+        :param threshold: int, 默认值 10000
+            金额阈值，单位：万元；买一/卖一挂单金额小于阈值时发送预警
+        """
+        if kind not in self.KINDS:
+            raise ValueError("kind 可选值为 %s，当前值为 '%s'"
+                             % (str(list(self.KINDS)), kind))
+        self.watches[(str(code), kind)] = threshold
+        self._arrays = None
+        return self
+
+    def remove(self, code, kind=None):
+        """移除监控，kind为None时移除code的全部监控"""
+        for k in [k for k in self.watches
+                  if k[0] == str(code) and (kind is None or k[1] == kind)]:
+            del self.watches[k]
+        self._arrays = None
+
+    def _get_arrays(self):
+        if self._arrays is None:
+            keys = list(self.watches.keys())
+            last = self._last_alert
+            self._arrays = {
+                "keys": keys,
+                "codes": np.array([k[0] for k in keys], dtype=object),
+                "kinds": np.array([k[1] for k in keys], dtype=object),
+                "zt": np.array([k[1] == "zt" for k in keys], dtype=bool),
+                "threshold": np.array(list(self.watches.values()),
+                                      dtype=np.float64),
+                "last": np.array([last.get(k, -np.inf) for k in keys],
+                                 dtype=np.float64),
+            }
+        return self._arrays
+
+    # 监控
+    # --------------------------------------------------------------------
+    def evaluate(self, quotes, now=None):
+        """用一批实时行情检查所有监控，返回需要预警的监控
+
+        :param quotes: :class: `pd.DataFrame`
+            实时行情，字段同 `get_quotes`
+        :param now: float 默认值 time.time()
+        :return: list of dict
+            每个预警包含 code、kind、money（万元）、threshold
+        """
+        if now is None:
+            now = time.time()
+        a = self._get_arrays()
+        if len(a['codes']) == 0 or quotes is None or len(quotes) == 0:
+            return []
+        rows = pd.Index(quotes['code'].astype(str)).get_indexer(a['codes'])
+        found = rows >= 0
+        rows = np.where(found, rows, 0)
+
+        def _money(vol, price):
+            return quotes[vol].to_numpy(dtype=np.float64)[rows] * \
+                quotes[price].to_numpy(dtype=np.float64)[rows] * 100 / 10000
+
+        money = np.where(a['zt'], _money('b1_v', 'b1_p'), _money('a1_v', 'a1_p'))
+        money = np.nan_to_num(money, nan=0.0)
+        alert = found & (money < a['threshold']) & \
+            (now - a['last'] >= self.cooldown)
+        a['last'][alert] = now
+
+        alerts = []
+        for i in np.flatnonzero(alert):
+            self._last_alert[a['keys'][i]] = now
+            alerts.append({
+                "code": a['codes'][i],
+                "kind": a['kinds'][i],
+                "money": float(money[i]),
+                "threshold": float(a['threshold'][i]),
+            })
+        return alerts
+
+    def notify(self, alert):
+        msg0, msg1 = self.KINDS[alert['kind']][:2]
+        title = "%s - %s 即将破板" % (msg0, alert['code'])
+        content = "%s: %s万元，低于阈值（%g万元）" % (
+            msg1, str(int(alert['money'])), alert['threshold'])
+        self.push(title, content)
+
+    def poll(self, now=None):
+        """批量获取所有监控股票的实时行情，检查并推送预警"""
+        a = self._get_arrays()
+        if len(a['codes']) == 0:
+            return []
+        quotes = self.fetch(list(dict.fromkeys(a['codes'].tolist())))
+        alerts = self.evaluate(quotes, now=now)
+        for alert in alerts:
+            debug_print("%s - %s - %s 万元" % (
+                alert['code'], self.KINDS[alert['kind']][1], int(alert['money'])))
+            self.notify(alert)
+        return alerts
+
+    def run(self):
+        """交易时间段内每隔interval秒检查一次"""
+        debug_print("开始监控 - 涨跌停板破板 - %i只股票" % len(self.watches))
+        while is_in_trade_time():
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                traceback.print_exc()
+                debug_print(str(e))
+                continue
+        debug_print("结束监控 - 涨跌停板破板 - %i只股票" % len(self.watches))
+
+
+def sm_limit(code, kind, threshold=10000, interval=1, cooldown=60):
     """监控单只股票 涨停板买一挂单金额 / 跌停板卖一挂单金额
 
+    同时监控多只股票请使用 `LimitBoardMonitor`。
+
     :param code: str
         股票代码
     :param kind: str
@@ -28,72 +187,38 @@ def sm_limit(code, kind, threshold=10000, interval=1):
         及时发送预警通知。
     :param interval: int, 默认值 1
         监控间隔，单位：秒
+    :param cooldown: int, 默认值 60
+        两次预警之间的最小间隔，单位：秒
     :return: None
     """
-    if kind == "zt":
-        msg0 = "【涨停板 - 破板监控】"
-        msg1 = "买一总挂单金额"
-    elif kind == "dt":
-        msg0 = "【跌停板 - 破板监控】"
-        msg1 = "卖一总挂单金额"
-    else:
-        raise ValueError("kind 可选值为 ['zt', 'dt']，"
-                         "当前值为 '%s'" % kind)
-
-    start_info = "开始监控 - %s - %s | 参数配置：阈值（%i 万元）" \
-                 % (msg0, str(code), threshold)
-    debug_print(start_info)
-
-    while is_in_trade_time():
-        time.sleep(interval)
-        try:
-            sdi = ShareDayIndicator(code)
-            sdi.cal_bs_first()
-
-            if kind == "zt":
-                money = sdi.features['BUY_FIRST']
-            elif kind == "dt":
-                money = sdi.features['SELL_FIRST']
-            else:
-                money = 0
-
-            debug_info = "%s - %s - %s 万元" % (str(code), msg1, str(int(money / 10000)))
-            debug_print(debug_info)
-
-            if money / 10000 < threshold:
-                title = "%s - %s 即将破板" % (msg0, str(code))
-                content = "%s: %s万元，低于阈值（%s万元）" % (msg1,
-                                                   str(int(money / 10000)), str(threshold))
-                sms.server_chan_push(title, content)
-        except Exception as e:
-            traceback.print_exc()
-            debug_print(str(e))
-            continue
-
-    end_info = "结束监控 - %s - %s | 参数配置：阈值（%i 万元）" \
-               % (msg0, str(code), threshold)
-    debug_print(end_info)
+    lbm = LimitBoardMonitor(interval=interval, cooldown=cooldown)
+    lbm.add(code, kind, threshold=threshold)
+    lbm.run()
 
 
 # 市场状态 & 个股行情
 # --------------------------------------------------------------------
 
 def get_shares_status(codes):
-    shares = [ShareDayIndicator(code) for code in codes]
+    """获取个股的最新行情状态，所有个股通过一次批量请求获取
+
+    :param codes: list
+        个股代码
+    :return: str
+    """
+    quotes = get_quotes(codes)
     share_status_template = "### {code}（{name}）\n --- \n" \
                             "* 当前价格为{price}元\n" \
                             "* 涨跌幅{change_rate}\n" \
                             "* 振幅{wave_rate}\n" \
                             "* 总成交金额{total_amount}万元\n\n"
     shares_status = []
-    for share in shares:
-        share.update(target=['bsf'])
-        si = share.indicators
+    for q in quotes.itertuples(index=False):
         share_status = share_status_template.format(
-            code=si['CODE'], name=si['NAME'], price=si['PRICE'],
-            change_rate=str(round(si['CHANGE_RATE'] * 100, 4)) + "%",
-            wave_rate=str(round(si['WAVE_RATE'] * 100, 4)) + "%",
-            total_amount=str(int(si['TOTAL_AMOUNT'] / 10000))
+            code=q.code, name=q.name, price=q.price,
+            change_rate=str(round((q.price - q.pre_close) / q.pre_close * 100, 4)) + "%",
+            wave_rate=str(round((q.high - q.low) / q.pre_close * 100, 4)) + "%",
+            total_amount=str(int(q.amount / 10000))
         )
         shares_status.append(share_status)
 
@@ -3,61 +3,373 @@ StockPool - 股票池对象
 ====================================================================
 """
 import os
+import ast
+import atexit
+import threading
 import traceback
 from datetime import datetime
 from collections import OrderedDict
+from contextlib import contextmanager
+from types import MappingProxyType
 import json
+import numpy as np
 import pandas as pd
 
 from tma import POOL_PATH
-from tma.collector import bars
+from tma.collector import get_quotes, OHLCVPanel
+
+
+LEVELS = (1, 2, 3)
+
+
+def _now():
+    return datetime.now().__str__().split(".")[0]
+
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n"
 
 
 class StockPool:
-    """三级股票池对象"""
+    """三级股票池对象
 
-    def __init__(self, name, pool_path=None):
+    股票池保存在追加写入的日志文件 `<name>_pool.log` 中，每行一条JSON记录：
+        {"op": "add", "id": 1, "code": "600122", "dt": "...", "level": 3, "reason": "..."}
+        {"op": "remove", "ids": [1, 5]}
+    打开股票池时重放日志；日志行数超过有效记录数的 compact_ratio 倍时，
+    重写为只包含有效记录的新日志（写临时文件后改名）。内存中按 code、
+    level、reason、date 建立索引。移出股票池的记录追加到
+    `<name>_pool_hist.jsonl`。
+
+    :param name: str
+        股票池名称
+    :param pool_path: str 默认值 `tma.POOL_PATH`
+        股票池文件所在目录
+    :param compact_ratio: float 默认值 2
+        日志压缩阈值
+    :param fsync: bool 默认值 True
+        每次提交后是否调用 os.fsync，确保变更已写入磁盘
+    :param flush_interval: float 默认值 None
+        后台写入的间隔（单位：s），参考 `start_flusher`；为None时每次变更立即提交
+
+    使用方法：
+        pool = StockPool("ma")
+        pool.add_many(codes, reason="SS01", level=3)
+        pool.check("600122", level=3)
+        pool.query(level=3, date="2018-06-01")
+
+        with pool.batch():      # 多个变更一次提交
+            pool.add_many(codes_1, reason="SS01", level=3)
+            pool.remove("600122", level=2)
+    """
+
+    def __init__(self, name, pool_path=None, compact_ratio=2, fsync=True,
+                 flush_interval=None):
         self.name = name
         if pool_path is None:
             self.pool_path = POOL_PATH
         else:
             self.pool_path = pool_path
+        self.compact_ratio = compact_ratio
 
-        # 三级股票池缓存文件
+        # 股票池日志文件、选股历史文件；path 和 path_hist 为旧版本的文件
+        self.path_log = os.path.join(self.pool_path, '%s_pool.log' % self.name)
+        self.path_hist_log = os.path.join(self.pool_path, '%s_pool_hist.jsonl' % self.name)
         self.path = os.path.join(self.pool_path, '%s_pool.json' % self.name)
         self.path_hist = self.path.replace(".json", "_hist.pool")
 
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        self._log = None
+        self._batch_depth = 0
+        self._flusher = None
+        self._reset()
+
         # 如果pool_path路径下已经有名称为name的股票池，恢复；否则，新建
-        if os.path.exists(self.path):
+        if os.path.exists(self.path_log):
             self.restore()
-        else:
-            self.shares = OrderedDict(level1=[], level2=[], level3=[])
+        elif os.path.exists(self.path):
+            self._migrate()
 
         self.shares_hist = None
+        if flush_interval:
+            self.start_flusher(flush_interval)
+
+    # 内存索引
+    # --------------------------------------------------------------------
+    def _reset(self):
+        self._next_id = 1
+        self._log_lines = 0
+        self._pending = []
+        self._pending_hist = []
+        self._reset_index()
+
+    def _reset_index(self):
+        self._entries = OrderedDict()
+        self._by_code_level = {}
+        self._by_code = {}
+        self._by_level = {level: OrderedDict() for level in LEVELS}
+        self._by_reason = {}
+        self._by_date = {}
+
+    def _index_keys(self, share):
+        return [
+            (self._by_code_level, (share['code'], share['level'])),
+            (self._by_code, share['code']),
+            (self._by_level, share['level']),
+            (self._by_reason, share['reason']),
+            (self._by_date, share['dt'][:10]),
+        ]
+
+    def _insert(self, id_, share):
+        self._entries[id_] = share
+        self._next_id = max(self._next_id, id_ + 1)
+        for index, key in self._index_keys(share):
+            index.setdefault(key, OrderedDict())[id_] = None
+
+    def _delete(self, id_):
+        share = self._entries.pop(id_, None)
+        if share is None:
+            return None
+        for index, key in self._index_keys(share):
+            ids = index[key]
+            del ids[id_]
+            if not ids and index is not self._by_level:
+                del index[key]
+        return share
+
+    def _apply(self, record):
+        """把一条日志记录应用到内存"""
+        op = record['op']
+        if op == 'add':
+            self._insert(record['id'], {
+                'code': record['code'], 'dt': record['dt'],
+                'level': record['level'], 'reason': record['reason'],
+            })
+        elif op == 'remove':
+            for id_ in record['ids']:
+                self._delete(id_)
+        elif op == 'empty':
+            self._reset_index()
+        elif op == 'batch':
+            for r in record['ops']:
+                self._apply(r)
+        else:
+            raise ValueError("未知的日志记录：%s" % str(record))
+
+    @property
+    def shares(self):
+        """各级股票池中的股票，结构同旧版本的json文件
+
+        返回只读视图，修改时抛出异常；请通过 add / remove / empty 修改股票池。
+        """
+        with self._lock:
+            return MappingProxyType(OrderedDict(
+                ("level%i" % level,
+                 tuple(MappingProxyType(self._entries[i]) for i in self._by_level[level]))
+                for level in LEVELS
+            ))
+
+    def __len__(self):
+        return len(self._entries)
 
     # 三级股票池的保存与恢复
     # --------------------------------------------------------------------
+    def _write(self, record, count):
+        """把一条日志记录追加写入日志文件；count 为其中包含的变更数量"""
+        if self._log is None:
+            self._log = open(self.path_log, 'a', encoding='utf-8')
+        self._log.write(_dumps(record))
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+        self._log_lines += count
+        if self._log_lines > max(1000, self.compact_ratio * len(self._entries)):
+            self.compact()
+
+    def _write_hist(self, lines):
+        with open(self.path_hist_log, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _record(self, record, save=True):
+        """应用一条日志记录；save为False、处于批量模式或后台写入模式时暂存"""
+        self._apply(record)
+        self._pending.append(record)
+        if save and self._flusher is None:
+            self.save()
+
     def save(self):
-        """把股票池中的股票保存到文件"""
-        with open(self.path, 'w', encoding='utf-8') as f:
-            json.dump(self.shares, f, indent=2, ensure_ascii=False)
+        """把尚未写入的变更作为一条日志记录追加到日志文件
+
+        多条变更写为一条 {"op": "batch", "ops": [...]} 记录，一次 fsync；
+        写入中断时，不完整的记录在恢复时被整体忽略。批量模式中调用无效。
+        """
+        with self._lock:
+            if self._batch_depth:
+                return
+            pending, self._pending = self._pending, []
+            hist, self._pending_hist = self._pending_hist, []
+            if len(pending) == 1:
+                self._write(pending[0], 1)
+            elif pending:
+                self._write(dict(op='batch', ops=pending), len(pending))
+            if hist:
+                self._write_hist(hist)
+
+    @contextmanager
+    def batch(self):
+        """批量修改股票池
+
+        with 语句中的所有 add / add_many / remove / empty 只修改内存，
+        退出时作为一条日志记录提交；发生异常时全部撤销。可以嵌套，
+        最外层退出时提交。批量期间持有股票池的锁。
+
+        使用方法：
+            with pool.batch():
+                pool.add_many(codes_1, "SS01", 3)
+                pool.add_many(codes_2, "SS02", 2)
+                pool.remove("600122", 3)
+        """
+        with self._lock:
+            if self._batch_depth == 0:
+                self._batch_start = (len(self._pending), len(self._pending_hist),
+                                     self._next_id, OrderedDict(self._entries))
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self._rollback()
+                raise
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._flusher is None:
+                self.save()
+
+    def _rollback(self):
+        """撤销最外层批量修改中的所有变更：恢复批量开始时的内存快照，
+        只丢弃批量期间暂存的记录，之前尚未写入的变更保留"""
+        n, n_hist, next_id, entries = self._batch_start
+        del self._pending[n:], self._pending_hist[n_hist:]
+        self._reset_index()
+        for id_, share in entries.items():
+            self._insert(id_, share)
+        self._next_id = next_id
+
+    def start_flusher(self, interval=1):
+        """启动后台写入线程：此后的变更只修改内存，每隔interval秒提交一次
+
+        :param interval: float 默认值 1
+            提交间隔（单位：s）
+        """
+        with self._lock:
+            if self._flusher is not None:
+                return
+            stop = threading.Event()
+            self._flusher = threading.Thread(target=self._flush_loop,
+                                             args=(interval, stop), daemon=True)
+            self._flusher_stop = stop
+            self._flusher.start()
+        atexit.register(self.stop_flusher)
+
+    def _flush_loop(self, interval, stop):
+        while not stop.wait(interval):
+            try:
+                self.save()
+            except Exception:
+                traceback.print_exc()
+
+    def stop_flusher(self):
+        """停止后台写入线程，并提交尚未写入的变更"""
+        thread = self._flusher
+        if thread is None:
+            return
+        self._flusher_stop.set()
+        thread.join()
+        self._flusher = None
+        atexit.unregister(self.stop_flusher)
+        self.save()
+
+    def compact(self):
+        """重写日志文件，只保留股票池中的有效记录（写临时文件后改名）"""
+        with self._lock:
+            if self._batch_depth:
+                return
+            self.save()
+            tmp = self.path_log + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                for id_, share in self._entries.items():
+                    f.write(_dumps(dict(op='add', id=id_, **share)))
+                f.flush()
+                os.fsync(f.fileno())
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            os.replace(tmp, self.path_log)
+            self._log_lines = len(self._entries)
+
+    def close(self):
+        """停止后台写入线程，提交尚未写入的变更，关闭日志文件"""
+        self.stop_flusher()
+        with self._lock:
+            self.save()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
 
     def save_hist(self, shares):
-        """删除股票池中股票的同时，保存一份到对应的hist文件"""
-        shares = [str(dict(share)) + "\n" for share in shares]
-        with open(self.path_hist, 'a', encoding='utf-8') as f:
-            f.writelines(shares)
+        """删除股票池中股票的同时，保存一份到对应的hist文件；与股票池的变更一同提交"""
+        removed = _now()
+        self._pending_hist.extend(_dumps(dict(share, removed=removed)) for share in shares)
 
     def restore(self):
-        """从文件中恢复股票池"""
+        """从日志文件中恢复股票池，尚未写入的变更会被丢弃"""
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            self._reset()
+            broken = 0
+            with open(self.path_log, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 写入过程中断导致的不完整的行
+                        broken += 1
+                        continue
+                    self._apply(record)
+                    self._log_lines += len(record['ops']) if record['op'] == 'batch' else 1
+            if broken or self._log_lines > max(1000, self.compact_ratio * len(self._entries)):
+                self.compact()
+
+    def _migrate(self):
+        """从旧版本的json文件中恢复股票池，并转换为日志文件"""
         with open(self.path, 'r', encoding='utf-8') as f:
-            self.shares = OrderedDict(json.load(f))
+            shares = json.load(f)
+        for level_shares in shares.values():
+            for share in level_shares:
+                self._insert(self._next_id, {
+                    'code': share['code'], 'dt': share['dt'],
+                    'level': int(share['level']), 'reason': share['reason'],
+                })
+        self.compact()
 
     def restore_hist(self):
         """从文件中恢复选股历史"""
-        with open(self.path_hist, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        self.shares_hist = [eval(x) for x in lines]
+        shares_hist = []
+        if os.path.exists(self.path_hist):
+            # 旧版本的选股历史，每行为 str(dict)
+            with open(self.path_hist, 'r', encoding='utf-8') as f:
+                shares_hist.extend(ast.literal_eval(x) for x in f if x.strip())
+        if os.path.exists(self.path_hist_log):
+            with open(self.path_hist_log, 'r', encoding='utf-8') as f:
+                shares_hist.extend(json.loads(x) for x in f if x.strip())
+        self.shares_hist = shares_hist
+        return shares_hist
 
     # 添加股票
     # --------------------------------------------------------------------
@@ -75,21 +387,12 @@ class StockPool:
         :param dt: str 默认值 datetime.now()
             加入股票池的时间
         :param save: bool 默认值 True
-            是否实时保存到json文件
+            是否实时写入日志文件；为False时在下一次 save 时写入
         :return: None
         """
-        if dt is None:
-            dt = datetime.now().__str__().split(".")[0]
-        share = dict()
-        share['code'] = code
-        share['dt'] = dt
-        share['level'] = level
-        share['reason'] = reason
-        self.shares["level" + str(level)].append(share)
-        if save:
-            self.save()
+        self.add_many([code], reason, level, dt, save=save)
 
-    def add_many(self, codes, reason, level, dt=None):
+    def add_many(self, codes, reason, level, dt=None, save=True):
         """添加多只股票到股票池
 
         Note: 每只股票可以多个入选理由，因此存在多条记录。
@@ -102,20 +405,23 @@ class StockPool:
             加入股票池的等级，可选值 [1, 2, 3]
         :param dt: str 默认值 datetime.now()
             加入股票池的时间
+        :param save: bool 默认值 True
+            是否实时写入日志文件
         :return: None
         """
+        level = int(level)
+        if level not in LEVELS:
+            raise ValueError("level 的可选值为 %s" % str(LEVELS))
         if dt is None:
-            dt = datetime.now().__str__().split(".")[0]
+            dt = _now()
         if isinstance(codes, str):
             codes = [codes]
-        for code in codes:
-            share = dict()
-            share['code'] = code
-            share['dt'] = dt
-            share['level'] = level
-            share['reason'] = reason
-            self.shares["level" + str(level)].append(share)
-        self.save()
+        with self._lock:
+            for code in codes:
+                self._record(dict(op='add', id=self._next_id, code=code, dt=dt,
+                                  level=level, reason=reason), save=False)
+            if save and self._flusher is None:
+                self.save()
 
     # 查看股票
     # --------------------------------------------------------------------
@@ -126,48 +432,77 @@ class StockPool:
         :type code: str
         :param level: 股票池等级
         :type level: int
-        :return: 股票池中对应code、level的所有数据
+        :return: 股票池中对应code、level的所有数据（副本）
         :rtype: list
         """
-        shares_l = self.shares['level' + str(level)]
-        shares = [x for x in shares_l if x['code'] == code]
-        return shares
+        with self._lock:
+            ids = self._by_code_level.get((code, int(level)), ())
+            return [dict(self._entries[i]) for i in ids]
+
+    def query(self, code=None, level=None, reason=None, date=None):
+        """按条件查询股票池，多个条件之间为“且”的关系
+
+        :param code: str 默认值 None
+            股票代码
+        :param level: int 默认值 None
+            股票池等级
+        :param reason: str 默认值 None
+            选股逻辑
+        :param date: str 默认值 None
+            加入股票池的日期，如 "2018-06-01"
+        :return: list
+            按加入顺序排列的记录（副本），修改返回值不影响股票池
+        """
+        with self._lock:
+            candidates = []
+            if code is not None and level is not None:
+                candidates.append(self._by_code_level.get((code, int(level)), {}))
+            elif code is not None:
+                candidates.append(self._by_code.get(code, {}))
+            elif level is not None:
+                candidates.append(self._by_level.get(int(level), {}))
+            if reason is not None:
+                candidates.append(self._by_reason.get(reason, {}))
+            if date is not None:
+                candidates.append(self._by_date.get(date[:10], {}))
+            if not candidates:
+                return [dict(e) for e in self._entries.values()]
+            candidates.sort(key=len)
+            ids = [i for i in candidates[0] if all(i in c for c in candidates[1:])]
+            return [dict(self._entries[i]) for i in ids]
 
     # 删除股票
     # --------------------------------------------------------------------
-    def remove(self, code, level):
+    def remove(self, code, level, save=True):
         """删除指定等级的股票
 
         :param code: str
             股票代码
         :param level: int
             对应的股票等级，可选值 [1, 2, 3]
+        :param save: bool 默认值 True
+            是否实时写入日志文件
         :return: None
         """
-        shares_l = self.shares['level' + str(level)]
-        removed = [share for share in shares_l if share['code'] == code]
-        self.save_hist(removed)
-        shares_l = [share for share in shares_l if share['code'] != code]
-        self.shares['level' + str(level)] = shares_l
-        self.save()
+        with self._lock:
+            ids = list(self._by_code_level.get((code, int(level)), ()))
+            if not ids:
+                return
+            self.save_hist([self._entries[i] for i in ids])
+            self._record(dict(op='remove', ids=ids), save=save)
 
     def empty(self, clear=True):
         """清空三级股票池
 
-        Note: 默认会同时将股票池对应的json文件清空，谨慎操作！
+        Note: 默认会同时将股票池对应的日志文件清空，谨慎操作！
 
         :param clear: bool 默认值 True
-            是否同时清空对应的json文件
+            是否同时清空对应的日志文件
         :return: None
         """
-        shares = self.shares['level1']
-        shares.extend(self.shares['level2'])
-        shares.extend(self.shares['level3'])
-        self.save_hist(shares)
-
-        self.shares = OrderedDict(level1=[], level2=[], level3=[])
-        if clear:
-            self.save()
+        with self._lock:
+            self.save_hist(list(self._entries.values()))
+            self._record(dict(op='empty'), save=clear)
 
     # 检查各级股票池的表现
     # --------------------------------------------------------------------
@@ -180,17 +515,9 @@ class StockPool:
         """
         shares_l = self.shares['level' + str(level)]
         codes_l = list(set([x['code'] for x in shares_l]))
-        batch_num = int(len(codes_l) / 800) + 1
-
-        res = []
-        for i in range(batch_num):
-            codes = codes_l[i * 800: (i + 1) * 800]
-            res.append(bars(codes))
-        codes_bar = pd.concat(res, ignore_index=True)
+        codes_bar = get_quotes(codes_l)
 
         # 计算赚钱效应
-        codes_bar['price'] = codes_bar['price'].astype(float)
-        codes_bar['pre_close'] = codes_bar['pre_close'].astype(float)
         codes_bar['change'] = codes_bar['price'] - codes_bar['pre_close']
         up_nums = len(codes_bar[codes_bar['change'] > 0])
         down_nums = len(codes_bar[codes_bar['change'] <= 0])
@@ -202,3 +529,121 @@ class StockPool:
             "total_nums": total_nums,
             "up_rate": round(up_nums / total_nums, 4)
         }
+
+    def entries(self, include_hist=False):
+        """股票池中的所有记录
+
+        :param include_hist: bool 默认值 False
+            是否包含已经移出股票池的历史记录
+        :return: :class: `pd.DataFrame`
+            字段 ['code', 'dt', 'level', 'reason', 'removed']，
+            removed 为移出股票池的时间，仍在股票池中的记录为None
+        """
+        columns = ['code', 'dt', 'level', 'reason', 'removed']
+        with self._lock:
+            rows = [dict(share, removed=None) for share in self._entries.values()]
+        if include_hist:
+            rows = self.restore_hist() + rows
+        df = pd.DataFrame(rows, columns=columns)
+        df['level'] = df['level'].astype(int)
+        return df
+
+    def performance(self, horizons=(1, 5, 20), include_hist=True,
+                    by=('level', 'reason'), panel=None):
+        """基于本地K线面板，统计所有入选记录此后 horizons 个交易日的收益率
+
+        :param horizons: tuple 默认值 (1, 5, 20)
+        :param include_hist: bool 默认值 True
+            是否包含已经移出股票池的历史记录
+        :param by: tuple 默认值 ('level', 'reason')
+            分组字段
+        :param panel: :class: `OHLCVPanel` 默认值 OHLCVPanel.load("D")
+        :return: :class: `pd.DataFrame`
+            参考 `PoolAnalyzer.summary`
+        """
+        analyzer = PoolAnalyzer(panel, horizons)
+        return analyzer.summary(analyzer.returns(self.entries(include_hist)), by)
+
+
+class PoolAnalyzer(object):
+    """股票池表现分析
+
+    入选价格为入选日期（dt，非交易日取之前最近的交易日）的收盘价，
+    h日收益率为此后第h个交易日的收盘价相对入选价格的涨跌幅；所有记录
+    一次完成查找：入选日期在交易日序列上二分查找得到行号，股票代码
+    得到列号，直接从日K线面板的收盘价矩阵中取值。超出面板范围、停牌
+    或不在面板中的股票，收益率为NaN。
+
+    :param panel: :class: `OHLCVPanel` 默认值 OHLCVPanel.load("D")
+        日K线面板
+    :param horizons: tuple 默认值 (1, 5, 20)
+        持有的交易日数量
+
+    使用方法：
+        analyzer = PoolAnalyzer()
+        entries = pd.concat([pool.entries(include_hist=True) for pool in pools])
+        rets = analyzer.returns(entries)
+        analyzer.summary(rets, by=['level', 'reason'])
+    """
+
+    def __init__(self, panel=None, horizons=(1, 5, 20)):
+        if panel is None:
+            panel = OHLCVPanel.load("D")
+        self.panel = panel
+        self.horizons = tuple(int(h) for h in horizons)
+        self._codes = pd.Index(panel.codes)
+
+    def locate(self, codes, dts):
+        """记录在面板中的 (行号, 列号)，找不到时为 -1"""
+        # 入选日期和股票代码的取值远少于记录数量，只对不重复的值做查找
+        inv, uniq = pd.factorize(np.asarray(dts, dtype='U10'))
+        rows = np.searchsorted(self.panel.dates, uniq, side='right')[inv] - 1
+        inv, uniq = pd.factorize(np.asarray(codes, dtype=str))
+        cols = self._codes.get_indexer(uniq)[inv]
+        return rows, cols
+
+    def returns(self, entries):
+        """计算每条记录的入选价格和各持有期的收益率
+
+        :param entries: :class: `pd.DataFrame`
+            至少包含 code、dt 两个字段，如 `StockPool.entries()` 的返回值
+        :return: :class: `pd.DataFrame`
+            在 entries 的基础上增加 entry_date、entry_price 和 ret_{h} 字段
+        """
+        res = entries.reset_index(drop=True).copy()
+        rows, cols = self.locate(res['code'], res['dt'])
+        n_dates = len(self.panel.dates)
+        valid = (rows >= 0) & (cols >= 0)
+        r, c = np.where(valid, rows, 0), np.where(valid, cols, 0)
+
+        close = self.panel.close
+        entry = np.where(valid, close[r, c], np.nan).astype(np.float64)
+        res['entry_date'] = np.where(valid, self.panel.dates[r], None)
+        res['entry_price'] = entry
+        for h in self.horizons:
+            ok = valid & (rows + h < n_dates)
+            exit_ = np.where(ok, close[np.where(ok, r + h, 0), c], np.nan)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                res['ret_%i' % h] = exit_.astype(np.float64) / entry - 1
+        return res
+
+    def summary(self, returns, by=('level', 'reason')):
+        """按 by 分组统计各持有期的收益率
+
+        :return: :class: `pd.DataFrame`
+            index为分组，字段为每个持有期的 count（有收益率的记录数）、
+            mean、median 和 win_rate（收益率大于0的比例）
+        """
+        cols = ['ret_%i' % h for h in self.horizons]
+        rets = returns[cols]
+        wins = (rets > 0).where(rets.notna())
+        grouped = rets.groupby([returns[k] for k in by])
+        stats = pd.concat({
+            'count': grouped.count(),
+            'mean': grouped.mean(),
+            'median': grouped.median(),
+            'win_rate': wins.groupby([returns[k] for k in by]).mean(),
+        }, axis=1)
+        stats.columns = ["%s_%s" % (col, stat) for stat, col in stats.columns]
+        return stats[["%s_%s" % (col, stat) for col in cols
+                      for stat in ('count', 'mean', 'median', 'win_rate')]]
@@ -1,3 +1,5 @@
 # -*- coding: UTF-8 -*-
 
 
+
+from .engine import ShareScreener, ScreenRule, compile_expr
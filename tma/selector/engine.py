@@ -0,0 +1,233 @@
+# -*- coding: UTF-8 -*-
+"""
+
+selector.engine - 声明式选股引擎
+====================================================================
+
+选股规则是指标表上的列表达式，如 "PRICE < 0.9 * MA5_D"。表达式在注册时
+编译一次，执行时直接作用于整列的 numpy 数组，得到布尔掩码；所有规则的
+掩码组成 (股票, 规则) 的命中矩阵，同一只股票可以同时命中多条规则。
+
+表达式语法为 Python 表达式，但 `and`、`or`、`not` 和链式比较
+（如 "MA10_D > MA5_D > PRICE"）按元素计算；可用的函数见 FUNCTIONS。
+"""
+
+import ast
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# 表达式中可以使用的函数
+FUNCTIONS = {
+    "abs": np.abs,
+    "min": np.minimum,
+    "max": np.maximum,
+    "log": np.log,
+    "sqrt": np.sqrt,
+    "where": np.where,
+    "isnull": pd.isnull,
+    "notnull": pd.notnull,
+}
+_GLOBALS = dict(FUNCTIONS, __builtins__={})
+
+
+class _Elementwise(ast.NodeTransformer):
+    """把 and / or / not / 链式比较 改写为按元素计算的 & / | / ~"""
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        expr = node.values[0]
+        for value in node.values[1:]:
+            expr = ast.BinOp(left=expr, op=op, right=value)
+        return expr
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(op=ast.Invert(), operand=node.operand)
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        operands = [node.left] + node.comparators
+        expr = None
+        for op, left, right in zip(node.ops, operands[:-1], operands[1:]):
+            cmp = ast.Compare(left=left, ops=[op], comparators=[right])
+            expr = cmp if expr is None else ast.BinOp(left=expr, op=ast.BitAnd(), right=cmp)
+        return expr
+
+
+def compile_expr(expr):
+    """编译列表达式
+
+    :param expr: str
+        列表达式，如 "abs(MA5_D - MA10_D) <= PRICE * 0.001"
+    :return: tuple
+        (code, names)，names 为表达式中引用的变量名（列名或参数名）
+    """
+    tree = ast.parse(expr.strip(), mode="eval")
+    tree = ast.fix_missing_locations(_Elementwise().visit(tree))
+    names = sorted({n.id for n in ast.walk(tree)
+                    if isinstance(n, ast.Name) and n.id not in FUNCTIONS})
+    return compile(tree, "<rule: %s>" % expr, "eval"), names
+
+
+class ScreenRule(object):
+    """选股规则
+
+    :param name: str
+        规则名称，如 SS01
+    :param expr: str or callable
+        列表达式；或者签名为 func(df) -> 布尔数组 的函数
+    :param reason: str 默认值 None
+        选股理由，默认为表达式本身
+    """
+
+    def __init__(self, name, expr, reason=None):
+        self.name = name
+        self.expr = expr
+        if callable(expr):
+            self.code, self.names = None, None
+            self.reason = reason or getattr(expr, "__doc__", None) or name
+        else:
+            self.code, self.names = compile_expr(expr)
+            self.reason = reason or expr
+
+    def mask(self, df, namespace=None):
+        """计算规则在df上的布尔掩码
+
+        :param df: :class: `pd.DataFrame`
+        :param namespace: dict 默认值 None
+            表达式中引用的参数；取出的列也会缓存在其中，供其他规则复用
+        """
+        if namespace is None:
+            namespace = {}
+        if self.code is None:
+            res = self.expr(df)
+        else:
+            for name in self.names:
+                if name not in namespace:
+                    if name not in df.columns:
+                        raise KeyError("规则 %s 引用了不存在的列：%s" % (self.name, name))
+                    namespace[name] = df[name].to_numpy()
+            res = eval(self.code, _GLOBALS, namespace)
+        res = np.asarray(res, dtype=bool)
+        if res.ndim == 0:
+            res = np.full(len(df), bool(res))
+        return res
+
+    def __repr__(self):
+        return "<ScreenRule %s: %s>" % (self.name, self.expr)
+
+
+class ShareScreener(object):
+    """声明式选股器
+
+    :param key: str 默认值 "CODE"
+        指标表中的股票代码列，作为命中矩阵的行索引；不存在时使用指标表的索引
+    :param rules: list 默认值 None
+        初始规则，元素为 ScreenRule 或 (name, expr, reason)
+
+    使用方法：
+        screener = ShareScreener()
+        screener.register("SS01", "PRICE < 0.9 * MA5_D", "当前价格向下偏离MA5_D超过10个点")
+
+        @screener.rule("SS09", "自定义规则")
+        def ss09(df):
+            return df['PRICE'].rank(pct=True) < 0.1
+
+        matrix = screener.match(sdis_df)   # (股票, 规则) 的命中矩阵
+        screened = screener.screen(sdis_df)  # 命中任一规则的股票及全部理由
+    """
+
+    def __init__(self, key="CODE", rules=None):
+        self.key = key
+        self.rules = OrderedDict()
+        for rule in rules or []:
+            if isinstance(rule, ScreenRule):
+                self.rules[rule.name] = rule
+            else:
+                self.register(*rule)
+
+    def register(self, name, expr, reason=None):
+        """注册规则，同名规则会被替换"""
+        rule = ScreenRule(name, expr, reason)
+        self.rules[name] = rule
+        return rule
+
+    def rule(self, name, reason=None):
+        """以装饰器的方式注册函数规则"""
+        def decorator(func):
+            self.register(name, func, reason)
+            return func
+        return decorator
+
+    def unregister(self, name):
+        self.rules.pop(name, None)
+
+    def _select(self, rules):
+        if rules is None:
+            return list(self.rules.values())
+        if isinstance(rules, str):
+            rules = [rules]
+        return [self.rules[name] for name in rules]
+
+    def masks(self, df, rules=None, **params):
+        """计算所有规则的掩码
+
+        :param df: :class: `pd.DataFrame`
+            指标表
+        :param rules: list 默认值 None
+            参与计算的规则名称，默认为全部规则
+        :param params:
+            表达式中引用的参数，如 lower=0
+        :return: tuple
+            (规则列表, 形状为 (股票数量, 规则数量) 的布尔数组)
+        """
+        rules = self._select(rules)
+        namespace = dict(params)
+        res = np.zeros((len(df), len(rules)), dtype=bool)
+        for j, rule in enumerate(rules):
+            res[:, j] = rule.mask(df, namespace)
+        return rules, res
+
+    def match(self, df, rules=None, **params):
+        """(股票, 规则) 的命中矩阵
+
+        :return: :class: `pd.DataFrame`
+            行索引为股票代码，列为规则名称，值为是否命中
+        """
+        rules, res = self.masks(df, rules, **params)
+        index = df[self.key] if self.key in df.columns else df.index
+        return pd.DataFrame(res, index=pd.Index(index),
+                            columns=[r.name for r in rules])
+
+    def screen(self, df, rules=None, how="any", **params):
+        """筛选股票
+
+        :param how: str 默认值 "any"
+            any - 命中任一规则；all - 命中全部规则
+        :return: :class: `pd.DataFrame`
+            命中的行，增加 rules（命中的规则名称元组）和 reason（全部理由，以；分隔）两列
+        """
+        rules, res = self.masks(df, rules, **params)
+        hit = res.all(axis=1) if how == "all" else res.any(axis=1)
+        screened = df[hit].copy()
+        names = np.array([r.name for r in rules], dtype=object)
+        reasons = np.array([r.reason for r in rules], dtype=object)
+        # 命中的规则组合远少于股票数量，每种组合只拼接一次理由
+        sub = res[hit]
+        groups = {}
+        inverse = np.array([groups.setdefault(row.tobytes(), len(groups))
+                            for row in np.packbits(sub, axis=1)], dtype=np.int64)
+        patterns = sub[np.unique(inverse, return_index=True)[1]]
+        pattern_rules = np.empty(len(patterns), dtype=object)
+        pattern_rules[:] = [tuple(names[m]) for m in patterns]
+        pattern_reasons = np.array(["；".join(reasons[m]) for m in patterns], dtype=object)
+        screened['rules'] = pattern_rules[inverse]
+        screened['reason'] = pattern_reasons[inverse]
+        return screened
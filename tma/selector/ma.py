@@ -5,94 +5,100 @@ selector.ma - 均线选股
 ====================================================================
 """
 
-import os
-from tqdm import tqdm
-import pandas as pd
 import time
 
-from tma.indicator import ShareDayIndicator
+from tma.indicator import MarketShareIndicatorEngine
 from tma.collector.ts import get_all_codes
-from tma import DATA_PATH
+from tma.storage import get_storage
+from tma.selector.engine import ShareScreener
+
+# 均线选股规则，新规则通过 MA_RULES.register 注册即可参与 MaShareScreen.screen
+MA_RULES = ShareScreener(key="CODE", rules=[
+    ("SS01", "PRICE < 0.9 * MA5_D", "当前价格向下偏离MA5_D超过10个点"),
+    ("SS02", "abs(MA5_D - MA10_D) <= PRICE * 0.001",
+     "MA5_D与MA10_D相互靠近（差的绝对值小于0.1%）"),
+    ("SS03", "MA120_D > MA60_D > MA30_D > MA20_D > MA10_D > MA5_D",
+     "日K线完全空头排列（MA120_D > MA60_D > MA30_D > MA20_D > MA10_D > MA5_D）"),
+])
 
 
 class MaShareScreen(object):
-    """基于均线系统的股票筛选器"""
+    """基于均线系统的股票筛选器
+
+    :param screener: ShareScreener 默认值 MA_RULES
+        选股规则集合
+
+    使用方法：
+        mss = MaShareScreen()
+        mss.screen()            # 所有规则一次完成，同一股票的多个理由以；分隔
+        mss.match()             # (股票, 规则) 的命中矩阵
+        mss.SS01()              # 单条规则，结果追加到 mss.screened
+    """
 
-    def __init__(self):
+    def __init__(self, screener=None):
         self.name = "均线系统股票筛选器"
         self.codes = get_all_codes()
+        self.screener = screener or MA_RULES
         self.shares_ma = []
         self.screened = []
     
     def cal_shares_indicators_ma(self, use_cache=True, interval=3600*12):
-        FILE_ALL_SHARES_INDICATORS_MA = os.path.join(DATA_PATH, "all_shares_indicators_ma.csv")
-        
+        KEY_ALL_SHARES_INDICATORS_MA = "all_shares_indicators_ma"
+        storage = get_storage()
+
         # 读取缓存：文件存在，且最后一次修改时间距离现在不超过interval
-        if os.path.exists(FILE_ALL_SHARES_INDICATORS_MA):
-            now_t = time.time()
-            modify_t = os.path.getmtime(FILE_ALL_SHARES_INDICATORS_MA)
-            if use_cache and now_t - modify_t < interval:
-                sdis_df = pd.read_csv(FILE_ALL_SHARES_INDICATORS_MA, dtype={"CODE": str})
-                return sdis_df
+        modify_t = storage.mtime(KEY_ALL_SHARES_INDICATORS_MA)
+        if use_cache and modify_t and time.time() - modify_t < interval:
+            return storage.read(KEY_ALL_SHARES_INDICATORS_MA)
         
-        # 重新计算
-        sdis = []
-        failed = []
-        for code in tqdm(self.codes):
-            try:
-                sdi = ShareDayIndicator(code)
-                sdi.run(['ma'])
-                sdis.append(sdi.indicators)
-            except:
-                failed.append(code)
-                continue
+        # 重新计算：基于本地K线面板和一次全市场行情请求，批量计算所有股票的均线指标
+        engine = MarketShareIndicatorEngine()
+        sdis_df = engine.run(['ma'])
+        sdis_df = sdis_df[sdis_df['CODE'].isin(self.codes)].reset_index(drop=True)
+        failed = sorted(set(self.codes) - set(sdis_df['CODE']))
         print("%i 个股票的指标计算失败，分别是：%s" % (len(failed), str(failed)))
-        sdis_df = pd.DataFrame(sdis)
-        sdis_df.to_csv(FILE_ALL_SHARES_INDICATORS_MA, index=False, encoding='utf-8')
+        storage.write(KEY_ALL_SHARES_INDICATORS_MA, sdis_df)
         return sdis_df
 
     def get_shares_ma(self):
         sdis_df = self.cal_shares_indicators_ma()
-        sdis_df = sdis_df[[
-            'DATE', 'CODE', 'NAME', 'PRICE', 'MA5_D', 
-            'MA10_D', 'MA20_D', 'MA30_D', 'MA60_D', 
+        self.shares_ma = sdis_df[[
+            'DATE', 'CODE', 'NAME', 'PRICE', 'MA5_D',
+            'MA10_D', 'MA20_D', 'MA30_D', 'MA60_D',
             'MA120_D', 'MA240_D'
-        ]]
-        self.shares_ma = [dict(row[1]) for row in sdis_df.iterrows()]
+        ]].reset_index(drop=True)
+        return self.shares_ma
+
+    def _shares_ma(self):
+        if len(self.shares_ma) == 0:
+            self.get_shares_ma()
+        return self.shares_ma
+
+    def match(self, rules=None):
+        """(股票, 规则) 的命中矩阵，参考 `ShareScreener.match`"""
+        return self.screener.match(self._shares_ma(), rules)
+
+    def screen(self, rules=None, how="any"):
+        """一次计算全部（或指定的）规则，返回命中的股票及全部选股理由，
+        参考 `ShareScreener.screen`"""
+        return self.screener.screen(self._shares_ma(), rules, how)
+
+    def _screen_rule(self, name):
+        rule = self.screener.rules[name]
+        shares_ma = self._shares_ma()
+        screened = shares_ma[rule.mask(shares_ma)].to_dict('records')
+        for share in screened:
+            share['reason'] = rule.reason
+        self.screened.extend(screened)
 
     def SS01(self):
         """Share Screen 01 - 1号选股，当前价格向下偏离MA5_D超过10个点"""
-        reason = "当前价格向下偏离MA5_D超过10个点"
-        screened = []
-        for share in self.shares_ma:
-            if share['PRICE'] < 0.9 * share['MA5_D']:
-                share['reason'] = reason
-                screened.append(share)
-        self.screened.extend(screened)
+        self._screen_rule("SS01")
 
     def SS02(self):
         """Share Screen 02 - 2号选股，MA5_D与MA10_D相互靠近（差的绝对值小于0.1%）"""
-        reason = "MA5_D与MA10_D相互靠近（差的绝对值小于0.1%）"
-        screened = []
-        for share in self.shares_ma:
-            abs_gap = share['PRICE'] * 0.001
-            if abs(share['MA5_D'] - share['MA10_D']) <= abs_gap:
-                share['reason'] = reason
-                screened.append(share)
-        self.screened.extend(screened)
-    
+        self._screen_rule("SS02")
+
     def SS03(self):
         """Share Screen 03 - 3号选股，日K线完全空头排列（MA120_D > MA60_D > MA30_D > MA20_D > MA10_D > MA5_D）"""
-        reason = "日K线完全空头排列（MA120_D > MA60_D > MA30_D > MA20_D > MA10_D > MA5_D）"
-        screened = []
-        for share in self.shares_ma:
-            condition = share['MA120_D'] > share['MA60_D'] > share['MA30_D'] \
-                        > share['MA20_D'] > share['MA10_D'] > share['MA5_D']
-            if condition:
-                share['reason'] = reason
-                screened.append(share)
-        self.screened.extend(screened)
-  
-
-    
-
+        self._screen_rule("SS03")
@@ -7,6 +7,10 @@ selector.ma - 市净率选股
 
 
 from tma.collector import today_market
+from tma.selector.engine import ScreenRule
+
+PB_RULE = ScreenRule("PB", "lower < pb < upper", "市净率在给定范围内")
+
 
 def screen_by_pb(pb_range=[0, 0.8]):
     """根据pb范围筛选股票
@@ -19,11 +23,5 @@ def screen_by_pb(pb_range=[0, 0.8]):
 
     tm = today_market(filters=['tp', 'st'])
     tm = tm[['code', 'name', 'pb']]
-    codes = []
-    for row in tm.iterrows():
-        share = dict(row[1])
-        if pb_range[1] > share['pb'] > pb_range[0]:
-            codes.append(share)
-    return codes
-        
-
+    mask = PB_RULE.mask(tm, {"lower": pb_range[0], "upper": pb_range[1]})
+    return tm[mask].to_dict('records')
@@ -0,0 +1,274 @@
+# -*- coding: UTF-8 -*-
+
+"""
+storage - 本地数据存储
+
+所有缓存数据通过键（如 "market_basic"、"klines/D/600122"）读写，键对应
+`DATA_PATH` 下的一个文件，文件格式由存储后端决定：
+
+1）csv - 与旧版本兼容的CSV文件；
+2）parquet - 列式存储，读取时支持列裁剪和谓词下推，需要安装 pyarrow；
+3）feather - 列式存储，读写速度最快，需要安装 pyarrow。
+
+旧版本的CSV缓存在首次读取时自动迁移到当前后端的格式。
+====================================================================
+"""
+
+import os
+import pandas as pd
+
+import tma
+
+# 读取CSV时需要保持为字符串的列，如股票代码 000001
+STR_COLUMNS = ("code", "CODE", "date", "DATE", "calendarDate")
+
+_OPERATORS = {
+    "==": lambda s, v: s == v,
+    "=": lambda s, v: s == v,
+    "!=": lambda s, v: s != v,
+    "<": lambda s, v: s < v,
+    "<=": lambda s, v: s <= v,
+    ">": lambda s, v: s > v,
+    ">=": lambda s, v: s >= v,
+    "in": lambda s, v: s.isin(v),
+    "not in": lambda s, v: ~s.isin(v),
+}
+
+
+def apply_filters(df, filters):
+    """在DataFrame上应用过滤条件
+
+    :param df: :class: `pd.DataFrame`
+    :param filters: list
+        过滤条件列表，各条件之间为“且”的关系，如：
+        [('code', 'in', ['600122', '000001']), ('date', '>=', '2018-01-01')]
+    :return: :class: `pd.DataFrame`
+    """
+    if not filters:
+        return df
+    mask = None
+    for col, op, value in filters:
+        if op not in _OPERATORS:
+            raise ValueError("不支持的过滤操作符：%s" % op)
+        m = _OPERATORS[op](df[col], value)
+        mask = m if mask is None else mask & m
+    return df[mask].reset_index(drop=True)
+
+
+def _filter_columns(columns, filters):
+    """读取时需要的列：返回的列 + 过滤条件涉及的列"""
+    if columns is None:
+        return None
+    needed = list(columns)
+    for col, _, _ in filters or []:
+        if col not in needed:
+            needed.append(col)
+    return needed
+
+
+class BaseStorage(object):
+    """存储后端基类
+
+    :param root: str 默认值 DATA_PATH
+        存储根目录
+    """
+    name = None
+    suffix = None
+
+    def __init__(self, root=None):
+        self.root = root if root is not None else tma.DATA_PATH
+
+    def path(self, key):
+        return os.path.join(self.root, key + self.suffix)
+
+    def _legacy_path(self, key):
+        return os.path.join(self.root, key + ".csv")
+
+    def exists(self, key):
+        return os.path.exists(self.path(key)) or \
+            os.path.exists(self._legacy_path(key))
+
+    def mtime(self, key):
+        """key对应文件的修改时间，文件不存在时返回None"""
+        for path in (self.path(key), self._legacy_path(key)):
+            if os.path.exists(path):
+                return os.path.getmtime(path)
+        return None
+
+    def keys(self, prefix):
+        """prefix目录下的所有键"""
+        path = os.path.join(self.root, prefix)
+        if not os.path.isdir(path):
+            return []
+        keys = set()
+        for name in os.listdir(path):
+            if name.startswith(('.', '_')):
+                continue
+            for suffix in (self.suffix, ".csv"):
+                if name.endswith(suffix):
+                    keys.add(prefix + "/" + name[:-len(suffix)])
+        return sorted(keys)
+
+    def remove(self, key):
+        for path in (self.path(key), self._legacy_path(key)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _migrate(self, key):
+        """把旧版本的CSV缓存迁移到当前后端的格式"""
+        if self.suffix == ".csv" or os.path.exists(self.path(key)):
+            return
+        legacy = self._legacy_path(key)
+        if os.path.exists(legacy):
+            df = CsvStorage._read_csv(legacy)
+            self.write(key, df)
+            os.utime(self.path(key), (os.path.getatime(legacy),
+                                      os.path.getmtime(legacy)))
+            os.remove(legacy)
+
+    def write(self, key, df):
+        """写入数据，先写临时文件再替换，避免中断时留下不完整的文件"""
+        path = self.path(key)
+        folder, name = os.path.split(path)
+        os.makedirs(folder, exist_ok=True)
+        tmp = os.path.join(folder, "." + name + ".tmp")
+        self._write(df.reset_index(drop=True), tmp)
+        os.replace(tmp, path)
+
+    def read(self, key, columns=None, filters=None):
+        """读取数据
+
+        :param key: str
+        :param columns: list 默认值 None
+            需要返回的列，None 表示全部
+        :param filters: list 默认值 None
+            过滤条件，参考 `apply_filters`
+        :return: :class: `pd.DataFrame`
+        """
+        self._migrate(key)
+        return self._read(self.path(key), columns, filters)
+
+    def read_many(self, keys, columns=None, filters=None):
+        """读取多个键并合并为一个DataFrame"""
+        for key in keys:
+            self._migrate(key)
+        paths = [self.path(key) for key in keys if os.path.exists(self.path(key))]
+        if not paths:
+            return pd.DataFrame(columns=columns)
+        return self._read_many(paths, columns, filters)
+
+    def _read_many(self, paths, columns, filters):
+        dfs = [self._read(path, columns, filters) for path in paths]
+        return pd.concat(dfs, ignore_index=True)
+
+    def _read(self, path, columns, filters):
+        raise NotImplementedError
+
+    def _write(self, df, path):
+        raise NotImplementedError
+
+
+class CsvStorage(BaseStorage):
+    """CSV存储后端"""
+    name = "csv"
+    suffix = ".csv"
+
+    @staticmethod
+    def _read_csv(path, usecols=None):
+        return pd.read_csv(path, encoding='utf-8', usecols=usecols,
+                           dtype={c: str for c in STR_COLUMNS})
+
+    def _read(self, path, columns, filters):
+        df = self._read_csv(path, usecols=_filter_columns(columns, filters))
+        df = apply_filters(df, filters)
+        return df if columns is None else df[list(columns)]
+
+    def _write(self, df, path):
+        df.to_csv(path, index=False, encoding='utf-8')
+
+
+class ParquetStorage(BaseStorage):
+    """Parquet存储后端，读取时列裁剪和谓词下推由 pyarrow 完成"""
+    name = "parquet"
+    suffix = ".parquet"
+
+    def __init__(self, root=None):
+        super().__init__(root)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self._pq = pq
+
+    def _read(self, path, columns, filters):
+        table = self._pq.read_table(path, columns=columns,
+                                    filters=filters or None)
+        return table.to_pandas()
+
+    def _read_many(self, paths, columns, filters):
+        try:
+            dataset = self._pq.ParquetDataset(paths, filters=filters or None)
+            return dataset.read(columns=columns).to_pandas()
+        except (self._pa.ArrowInvalid, self._pa.ArrowTypeError,
+                self._pa.ArrowNotImplementedError):
+            # 各文件的列类型不一致（如 volume 有的是 int64，有的是 float64），
+            # 无法合并为一个数据集；逐个读取后由 pandas 合并
+            return super()._read_many(paths, columns, filters)
+
+    def _write(self, df, path):
+        df.to_parquet(path, engine='pyarrow', index=False)
+
+
+class FeatherStorage(BaseStorage):
+    """Feather存储后端，列裁剪由 pyarrow 完成，过滤在内存中进行"""
+    name = "feather"
+    suffix = ".feather"
+
+    def __init__(self, root=None):
+        super().__init__(root)
+        import pyarrow.feather as feather
+        self._feather = feather
+
+    def _read(self, path, columns, filters):
+        df = self._feather.read_feather(path,
+                                        columns=_filter_columns(columns, filters))
+        df = apply_filters(df, filters)
+        return df if columns is None else df[list(columns)]
+
+    def _write(self, df, path):
+        self._feather.write_feather(df, path)
+
+
+BACKENDS = {
+    "csv": CsvStorage,
+    "parquet": ParquetStorage,
+    "feather": FeatherStorage,
+}
+
+_storages = {}
+
+
+def get_storage(kind=None, root=None):
+    """获取存储后端
+
+    :param kind: str 默认值 tma.STORAGE
+        可选值 'auto'、'csv'、'parquet'、'feather'；'auto' 表示安装了
+        pyarrow 时使用 parquet，否则使用 csv
+    :param root: str 默认值 DATA_PATH
+    :return: :class: `BaseStorage`
+    """
+    if kind is None:
+        kind = tma.STORAGE
+    if kind == "auto":
+        try:
+            import pyarrow.parquet  # noqa
+            kind = "parquet"
+        except ImportError:
+            kind = "csv"
+    if kind not in BACKENDS:
+        raise ValueError("kind 可选值为 %s，当前值为 '%s'"
+                         % (str(list(BACKENDS)), kind))
+    if root is None:
+        root = tma.DATA_PATH
+    if (kind, root) not in _storages:
+        _storages[(kind, root)] = BACKENDS[kind](root)
+    return _storages[(kind, root)]
@@ -1,26 +1,191 @@
 # -*- coding: UTF-8 -*-
 
-import os
 import time
+import bisect
 import functools
-import tushare as ts
-import pandas as pd
 import warnings
 from datetime import datetime
-from zb.tools import pdf
-
-from tma import DATA_PATH
+import numpy as np
 
 # A股交易日历
 # --------------------------------------------------------------------
 
-FILE_CALENDAR = os.path.join(DATA_PATH, 'calendar.csv')
-if os.path.exists(FILE_CALENDAR) and \
-        time.time() - os.path.getmtime(FILE_CALENDAR) < 3600 * 24:
-    trade_calendar = pd.read_csv(FILE_CALENDAR, encoding='utf-8')
-else:
-    trade_calendar = ts.trade_cal()  # tushare提供的交易日历
-    trade_calendar.to_csv(FILE_CALENDAR, index=False, encoding='utf-8')
+KEY_CALENDAR = 'calendar'
+
+
+class TradeCalendar(object):
+    """延迟加载的A股交易日历
+
+    交易日历在首次使用时才加载：如果本地缓存存在且未过期，直接读取缓存；
+    否则通过tushare获取并更新缓存。调用 `refresh()` 可以显式刷新。
+    对象本身的行为与 `pd.DataFrame` 一致，如
+    `trade_calendar[trade_calendar["isOpen"] == 1]`。
+
+    :param key: str 默认值 KEY_CALENDAR
+        缓存在 `tma.storage` 中的键
+    :param expire: int 默认值 3600 * 24
+        缓存的有效期（单位：s）
+    """
+
+    def __init__(self, key=KEY_CALENDAR, expire=3600 * 24):
+        self.key = key
+        self.expire = expire
+        self._data = None
+        self._index = None
+
+    @property
+    def storage(self):
+        from tma.storage import get_storage
+        return get_storage()
+
+    def _is_expired(self):
+        mtime = self.storage.mtime(self.key)
+        return mtime is None or time.time() - mtime >= self.expire
+
+    def load(self):
+        """加载交易日历，缓存过期时从tushare刷新"""
+        if self._is_expired():
+            try:
+                return self.refresh()
+            except Exception:
+                # 网络不可用时，退回到已有的缓存
+                if not self.storage.exists(self.key):
+                    raise
+                warnings.warn("交易日历刷新失败，使用过期的缓存 %s" % self.key)
+        self._data = self.storage.read(self.key)
+        self._index = None
+        return self._data
+
+    def refresh(self):
+        """从tushare获取最新的交易日历，并更新缓存"""
+        import tushare as ts
+        data = ts.trade_cal()  # tushare提供的交易日历
+        self.storage.write(self.key, data)
+        self._data = data
+        self._index = None
+        return data
+
+    @property
+    def data(self):
+        """交易日历 :class: `pd.DataFrame`，字段 ['calendarDate', 'isOpen']"""
+        if self._data is None:
+            self.load()
+        return self._data
+
+    @property
+    def day_index(self):
+        """交易日索引 :class: `TradeDayIndex`，随交易日历的刷新而重建
+
+        Note: 不使用 index 作为名称，`trade_calendar.index` 仍是交易日历的行索引
+        """
+        if self._index is None:
+            data = self.data
+            days = data.loc[data['isOpen'] == 1, 'calendarDate']
+            self._index = TradeDayIndex(days)
+        return self._index
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.data, name)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __repr__(self):
+        if not self.loaded:
+            return "<TradeCalendar %s (not loaded)>" % self.key
+        return repr(self._data)
+
+
+def _date_str(date):
+    """把 str / datetime.date / datetime 统一成 'YYYY-MM-DD' 格式的字符串"""
+    return str(date)[:10]
+
+
+class TradeDayIndex(object):
+    """交易日索引
+
+    预先计算排序后的交易日数组、交易日集合以及 交易日 -> 序号 的映射，
+    交易日判断为 O(1) 的集合查找，前后N个交易日、区间交易日的查询为
+    O(1) 的序号查找或 O(log n) 的 `np.searchsorted`。
+
+    :param days: iterable
+        交易日列表，元素为 'YYYY-MM-DD' 格式的字符串
+    """
+
+    def __init__(self, days):
+        self.days = np.array(sorted(set(_date_str(d) for d in days)), dtype='U10')
+        days_list = self.days.tolist()
+        self.day_set = frozenset(days_list)
+        self.ordinal = {d: i for i, d in enumerate(days_list)}
+
+    def __len__(self):
+        return len(self.days)
+
+    def __contains__(self, date):
+        return _date_str(date) in self.day_set
+
+    def is_trade_day(self, date):
+        return _date_str(date) in self.day_set
+
+    def _left(self, date):
+        """第一个 >= date 的交易日的序号"""
+        date = _date_str(date)
+        i = self.ordinal.get(date)
+        if i is None:
+            i = int(np.searchsorted(self.days, date, side='left'))
+        return i
+
+    def _right(self, date):
+        """第一个 > date 的交易日的序号"""
+        date = _date_str(date)
+        i = self.ordinal.get(date)
+        if i is None:
+            return int(np.searchsorted(self.days, date, side='right'))
+        return i + 1
+
+    def _get(self, i):
+        if 0 <= i < len(self.days):
+            return str(self.days[i])
+        return None
+
+    def recent(self, date, n=10):
+        """date前后的n个交易日（含date），规则同 `get_recent_trade_days`"""
+        if n >= 0:
+            start = self._left(date)
+            return self.days[start:start + n].tolist()
+        end = self._right(date)
+        return self.days[max(end + n, 0):end][::-1].tolist()
+
+    def prev(self, date, k=1):
+        """date之前（不含date）的第k个交易日，超出日历范围返回None"""
+        return self._get(self._left(date) - k)
+
+    def next(self, date, k=1):
+        """date之后（不含date）的第k个交易日，超出日历范围返回None"""
+        return self._get(self._right(date) + k - 1)
+
+    def between(self, start_date, end_date):
+        """start_date 与 end_date 之间（含两端）的所有交易日"""
+        return self.days[self._left(start_date):self._right(end_date)].tolist()
+
+    def count_between(self, start_date, end_date):
+        """start_date 与 end_date 之间（含两端）的交易日数量"""
+        return max(self._right(end_date) - self._left(start_date), 0)
+
+
+trade_calendar = TradeCalendar()
 
 
 def is_trade_day(date):
@@ -29,33 +194,166 @@ def is_trade_day(date):
     :param date: str or datetime.date, 如 2018-03-15
     :return: Bool
     """
-    trade_day = trade_calendar[trade_calendar["isOpen"] == 1]
-    trade_day_list = list(trade_day['calendarDate'])
-    if isinstance(date, datetime):
-        date = str(date.date())
-    if date in trade_day_list:
-        return True
-    else:
-        return False
+    return trade_calendar.day_index.is_trade_day(date)
+
+
+# A股交易时段
+# --------------------------------------------------------------------
+
+class TradingSessionClock(object):
+    """A股交易时段时钟
+
+    交易日内的时段边界（单位：当日秒数）只计算一次，判断某一时刻所处的
+    时段只需要一次交易日集合查找和一次二分查找：
+
+        09:15 - 09:25  open_auction   开盘集合竞价（含 09:25:00 撮合时刻）
+        09:25 - 09:30  pre_open       竞价结束，等待开盘
+        09:30 - 11:30  morning        上午连续竞价
+        11:30 - 13:00  noon_break     午间休市
+        13:00 - 14:57  afternoon      下午连续竞价
+        14:57 - 15:00  close_auction  收盘集合竞价（含 15:00:00 撮合时刻）
+        其他时间及非交易日           closed
+
+    除两个集合竞价的撮合时刻（OPEN_MATCH、CLOSE_MATCH）外，各时段前闭后开。
+
+    :param calendar: :class: `TradeCalendar` 默认值 trade_calendar
+    """
+
+    PHASES = ('closed', 'open_auction', 'pre_open', 'morning',
+              'noon_break', 'afternoon', 'close_auction')
+    CLOSED, OPEN_AUCTION, PRE_OPEN, MORNING, NOON_BREAK, AFTERNOON, \
+        CLOSE_AUCTION = range(7)
+
+    # 各时段的起始时刻，前闭后开
+    BOUNDARIES = (9 * 3600 + 15 * 60, 9 * 3600 + 25 * 60, 9 * 3600 + 30 * 60,
+                  11 * 3600 + 30 * 60, 13 * 3600, 14 * 3600 + 57 * 60,
+                  15 * 3600)
+    SESSIONS = ((9 * 3600 + 30 * 60, 11 * 3600 + 30 * 60),
+                (13 * 3600, 15 * 3600))
+    IN_SESSION = (MORNING, AFTERNOON, CLOSE_AUCTION)
+    # 集合竞价的撮合时刻，分别属于 open_auction 和 close_auction
+    OPEN_MATCH, CLOSE_MATCH = 9 * 3600 + 25 * 60, 15 * 3600
+
+    def __init__(self, calendar=None):
+        self.calendar = calendar if calendar is not None else trade_calendar
+        # BOUNDARIES 切分出的第i个区间 -> 时段编码，15:00之后为 closed
+        self._slot_phase = np.array(list(range(len(self.PHASES))) + [self.CLOSED],
+                                    dtype=np.int8)
+        self._bounds = np.array(self.BOUNDARIES, dtype=np.float64)
+        self._day = None
+        self._day_is_trade = False
+        self._days64 = None
+        self._days64_index = None
+
+    def _is_trade_day(self, day):
+        index = self.calendar.day_index
+        key = (day, id(index))
+        if key != self._day:
+            self._day = key
+            self._day_is_trade = index.is_trade_day(day)
+        return self._day_is_trade
+
+    @staticmethod
+    def _seconds(now):
+        return now.hour * 3600 + now.minute * 60 + now.second + \
+            now.microsecond / 1e6
+
+    def phase_code(self, now=None):
+        """返回now所处时段的编码，见 `TradingSessionClock.PHASES`"""
+        if now is None:
+            now = datetime.now()
+        if not self._is_trade_day(now.date()):
+            return self.CLOSED
+        sec = self._seconds(now)
+        if sec == self.OPEN_MATCH:
+            return self.OPEN_AUCTION
+        if sec == self.CLOSE_MATCH:
+            return self.CLOSE_AUCTION
+        slot = bisect.bisect_right(self.BOUNDARIES, sec)
+        return int(self._slot_phase[slot])
+
+    def phase(self, now=None):
+        """返回now所处时段的名称，如 'morning'"""
+        return self.PHASES[self.phase_code(now)]
+
+    def in_session(self, now=None, inclusive=False):
+        """now是否处于交易时间（连续竞价及收盘集合竞价）
+
+        :param inclusive: bool 默认值 False
+            是否把上午连续竞价的结束时刻 11:30:00 也算作交易时间
+        """
+        if now is None:
+            now = datetime.now()
+        code = self.phase_code(now)
+        if code in self.IN_SESSION:
+            return True
+        return inclusive and code == self.NOON_BREAK and \
+            self._seconds(now) == self.SESSIONS[0][1]
+
+    def seconds_to_open(self, now=None):
+        """距离下一次连续竞价开始的秒数，当前处于交易时间则返回0"""
+        if now is None:
+            now = datetime.now()
+        if self.in_session(now):
+            return 0.0
+        sec = self._seconds(now)
+        if self._is_trade_day(now.date()):
+            for start, _ in self.SESSIONS:
+                if sec < start:
+                    return start - sec
+        return self._seconds_to_next_day(now) + self.SESSIONS[0][0]
+
+    def seconds_to_close(self, now=None):
+        """距离当前（或下一个）交易时段结束的秒数"""
+        if now is None:
+            now = datetime.now()
+        sec = self._seconds(now)
+        if self._is_trade_day(now.date()):
+            for _, end in self.SESSIONS:
+                if sec < end:
+                    return end - sec
+        return self._seconds_to_next_day(now) + self.SESSIONS[0][1]
+
+    def _seconds_to_next_day(self, now):
+        """now到下一个交易日零点的秒数"""
+        next_day = self.calendar.day_index.next(now.date())
+        if next_day is None:
+            raise ValueError("%s 之后没有交易日，请刷新交易日历" % now.date())
+        midnight = datetime.strptime(next_day, "%Y-%m-%d")
+        return (midnight - now).total_seconds()
+
+    def label(self, timestamps):
+        """批量标记时间戳所处的时段
+
+        :param timestamps: array-like
+            时间戳序列，如 `pd.Series` / `np.ndarray` of datetime64 / datetime列表
+        :return: np.ndarray of int8
+            时段编码，可以用 `np.array(TradingSessionClock.PHASES)[codes]`
+            转换为时段名称
+        """
+        ts = np.asarray(timestamps, dtype='datetime64[us]')
+        days = ts.astype('datetime64[D]')
+        sec = (ts - days).astype(np.int64) / 1e6
+        codes = self._slot_phase[np.searchsorted(self._bounds, sec, side='right')]
+        codes[sec == self.OPEN_MATCH] = self.OPEN_AUCTION
+        codes[sec == self.CLOSE_MATCH] = self.CLOSE_AUCTION
+        codes[~np.isin(days, self._trade_days64())] = self.CLOSED
+        return codes
+
+    def _trade_days64(self):
+        index = self.calendar.day_index
+        if self._days64_index is not index:
+            self._days64 = index.days.astype('datetime64[D]')
+            self._days64_index = index
+        return self._days64
+
+
+trade_clock = TradingSessionClock()
 
 
 def is_in_trade_time():
-    """判断当前是否是交易时间"""
-    today = str(datetime.now().date())
-    if not is_trade_day(today):  # 如果今天不是交易日，返回False
-        return False
-    t1 = today + " " + "09:30:00"
-    t1 = datetime.strptime(t1, "%Y-%m-%d %H:%M:%S")
-    t2 = today + " " + "11:30:00"
-    t2 = datetime.strptime(t2, "%Y-%m-%d %H:%M:%S")
-    t3 = today + " " + "13:00:00"
-    t3 = datetime.strptime(t3, "%Y-%m-%d %H:%M:%S")
-    t4 = today + " " + "15:00:00"
-    t4 = datetime.strptime(t4, "%Y-%m-%d %H:%M:%S")
-    if t1 <= datetime.now() <= t2 or t3 <= datetime.now() <= t4:
-        return True
-    else:
-        return False
+    """判断当前是否是交易时间：交易日的 09:30 - 11:30、13:00 - 15:00（含两端）"""
+    return trade_clock.in_session(inclusive=True)
 
 
 def get_recent_trade_days(date, n=10):
@@ -69,21 +367,22 @@ def get_recent_trade_days(date, n=10):
     :return: list
         n个交易日日期列表
     """
-    cal_date = list(trade_calendar['calendarDate'])
-    date_index = cal_date.index(date)
-    if n >= 0:
-        recent_days = cal_date[date_index:date_index + n + 20]
-    else:
-        recent_days = cal_date[date_index + n - 20:date_index + 1]
-        recent_days = recent_days[::-1]
-
-    res = []
-    for d in recent_days:
-        if is_trade_day(d):
-            res.append(d)
-        if len(res) == abs(n):
-            break
-    return res
+    return trade_calendar.day_index.recent(date, n)
+
+
+def get_prev_trade_day(date, k=1):
+    """返回date之前（不含date）的第k个交易日"""
+    return trade_calendar.day_index.prev(date, k)
+
+
+def get_next_trade_day(date, k=1):
+    """返回date之后（不含date）的第k个交易日"""
+    return trade_calendar.day_index.next(date, k)
+
+
+def get_trade_days_between(start_date, end_date):
+    """返回 start_date 与 end_date 之间（含两端）的所有交易日"""
+    return trade_calendar.day_index.between(start_date, end_date)
 
 
 class Calendar:
@@ -106,6 +405,18 @@ class Calendar:
             date = datetime.now().date().__str__()
         return get_recent_trade_days(date=date, n=n)
 
+    @staticmethod
+    def prev_trade_day(date, k=1):
+        return get_prev_trade_day(date, k)
+
+    @staticmethod
+    def next_trade_day(date, k=1):
+        return get_next_trade_day(date, k)
+
+    @staticmethod
+    def trade_days_between(start_date, end_date):
+        return get_trade_days_between(start_date, end_date)
+
 
 # --------------------------------------------------------------------
 def debug_print(msg, level="INFO"):
@@ -151,6 +462,47 @@ def code_verify(code):
     return True, '代码正确'
 
 
+# 涨跌停价格
+# --------------------------------------------------------------------
+def get_limit_rates(codes, names=None):
+    """返回每只股票的涨跌幅限制比例
+
+    主板、中小板 10%；创业板（300/301开头）、科创板（688开头）20%；
+    主板、中小板的ST股 5%。
+
+    :param codes: array-like
+        股票代码，如 ['600122', '300001']
+    :param names: array-like 默认值 None
+        股票名称，用于识别ST股；为 None 时不考虑ST股
+    :return: np.ndarray of float64
+    """
+    codes = np.asarray(codes).astype(str)
+    rates = np.full(len(codes), 0.10)
+    growth = np.zeros(len(codes), dtype=bool)
+    for prefix in ('300', '301', '688'):
+        growth |= np.char.startswith(codes, prefix)
+    rates[growth] = 0.20
+    if names is not None:
+        st = np.char.find(np.asarray(names).astype(str), 'ST') >= 0
+        rates[st & ~growth] = 0.05
+    return rates
+
+
+def get_limit_prices(pre_close, rates):
+    """根据昨收价和涨跌幅限制比例计算涨停价、跌停价（四舍五入到分）
+
+    :return: tuple of np.ndarray
+        (涨停价, 跌停价)
+    """
+    pre_close = np.asarray(pre_close, dtype=np.float64)
+    up = np.floor(pre_close * (1 + rates) * 100 + 0.5 + 1e-6) / 100
+    down = np.floor(pre_close * (1 - rates) * 100 + 0.5 + 1e-6) / 100
+    return up, down
+
+
 # 提取pdf中的文本
 # --------------------------------------------------------------------
-pdf2text = pdf.pdf2text
+def pdf2text(*args, **kwargs):
+    """提取pdf中的文本，参数同 `zb.tools.pdf.pdf2text`"""
+    from zb.tools import pdf
+    return pdf.pdf2text(*args, **kwargs)